@@ -0,0 +1,382 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the curator's validation hot path.
+
+Generates synthetic operator bundles of a configurable shape and times each
+step of validating them.  Results can be saved as JSON and compared against
+a previous run to catch regressions between commits:
+
+    ./bench_curator.py --output before.json
+    ./bench_curator.py --compare before.json
+
+The libyaml and pure Python yaml backends can also be compared on real
+operator bundles (tarballs from the blob cache, or any operator package):
+
+    ./bench_curator.py --yaml-backends .cache/blobs/sha256/*/*
+"""
+
+import argparse
+import contextlib
+from io import BytesIO
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+import timeit
+from unittest.mock import patch
+import yaml
+import curator
+
+
+BUNDLE_ENTRIES = ["packages", "clusterServiceVersions", "customResourceDefinitions"]
+
+# Slowdowns beyond this fraction are reported as regressions
+DEFAULT_THRESHOLD = 0.2
+
+
+def synthetic_crd(index, size):
+    """
+    Returns a CustomResourceDefinition with an openAPIV3Schema padded out to
+    roughly size bytes of yaml.
+    """
+    properties = {}
+    field = 0
+    while len(yaml.dump(properties)) < size:
+        properties[f"field{field}"] = {
+            "type": "string",
+            "description": f"Synthetic field {field} of a synthetic custom resource."
+        }
+        field += 1
+    return {
+        "apiVersion": "apiextensions.k8s.io/v1beta1",
+        "kind": "CustomResourceDefinition",
+        "metadata": {"name": f"widgets{index}.synthetic.example.com"},
+        "spec": {
+            "group": "synthetic.example.com",
+            "names": {"kind": f"Widget{index}", "plural": f"widgets{index}"},
+            "validation": {"openAPIV3Schema": {"properties": properties}},
+        }
+    }
+
+
+def synthetic_csv(name, replaces=None, cluster_permissions=False):
+    """
+    Returns a ClusterServiceVersion that passes curation unless
+    cluster_permissions is set.
+    """
+    install_spec = {
+        "deployments": [{"name": "synthetic-operator", "spec": {"replicas": 1}}],
+        "permissions": [{
+            "serviceAccountName": "synthetic-operator",
+            "rules": [{"apiGroups": [""], "resources": ["pods", "services"], "verbs": ["*"]}]
+        }]
+    }
+    if cluster_permissions:
+        install_spec["clusterPermissions"] = install_spec["permissions"]
+    csv = {
+        "apiVersion": "operators.coreos.com/v1alpha1",
+        "kind": "ClusterServiceVersion",
+        "metadata": {"name": name, "annotations": {"description": "A synthetic operator."}},
+        "spec": {
+            "install": {"strategy": "deployment", "spec": install_spec},
+            "installModes": [
+                {"type": "OwnNamespace", "supported": True},
+                {"type": "SingleNamespace", "supported": True},
+                {"type": "MultiNamespace", "supported": False},
+                {"type": "AllNamespaces", "supported": False},
+            ],
+        }
+    }
+    if replaces:
+        csv["spec"]["replaces"] = replaces
+    return csv
+
+
+def synthetic_bundle(channels=2, csvs_per_channel=10, chain_length=None,
+                     crds=2, crd_size=10000, reject_depth=None):
+    """
+    Returns the parts of a synthetic bundle as a dict: its packages, csvs,
+    crds, the bundle.yaml document and the tarball.
+
+    Each channel has csvs_per_channel CSVs, the newest chain_length of which
+    (all of them by default) are linked by 'replaces'.  If reject_depth is
+    set, the CSV that many steps down each channel's chain is rejected, so
+    the bundle is truncated and regenerated.
+    """
+    chain_length = csvs_per_channel if chain_length is None else min(chain_length, csvs_per_channel)
+
+    csvs = []
+    package_channels = []
+    for c in range(channels):
+        names = [f"synthetic-{c}.v0.0.{i}" for i in range(csvs_per_channel)]
+        for i, name in enumerate(names):
+            depth = csvs_per_channel - 1 - i
+            replaces = names[i - 1] if i > 0 and depth < chain_length - 1 else None
+            csvs.append(synthetic_csv(name, replaces, cluster_permissions=depth == reject_depth))
+        package_channels.append({"name": f"channel-{c}", "currentCSV": names[-1]})
+
+    packages = [{"packageName": "synthetic", "channels": package_channels}]
+    crd_list = [synthetic_crd(i, crd_size) for i in range(crds)]
+
+    bundle = {"data": {
+        "clusterServiceVersions": yaml.dump(csvs, default_style='|'),
+        "customResourceDefinitions": yaml.dump(crd_list, default_style='|'),
+        "packages": yaml.dump(packages, default_style='|'),
+    }}
+    bundle_yaml = yaml.dump(bundle, default_style='|').encode()
+
+    tarball = BytesIO()
+    with tarfile.open(fileobj=tarball, mode="w:gz") as t:
+        info = tarfile.TarInfo("synthetic/bundle.yaml")
+        info.size = len(bundle_yaml)
+        t.addfile(info, BytesIO(bundle_yaml))
+
+    return {
+        "packages": packages,
+        "csvs": csvs,
+        "crds": crd_list,
+        "bundle_yaml": bundle_yaml,
+        "tarball": tarball.getvalue(),
+    }
+
+
+def time_it(function, repeat):
+    """
+    Returns the best and mean time of several runs of function, in seconds.
+    """
+    times = timeit.repeat(function, number=1, repeat=repeat)
+    return {"min": min(times), "mean": statistics.mean(times), "repeat": repeat}
+
+
+def hot_path_benchmark(bundle, repeat=10):
+    """
+    Times each step of validating the synthetic bundle.  Returns a dict of
+    step name to timings.
+    """
+    release = {"package": "synthetic-operators/synthetic", "version": "1.0.0",
+               "digest": "0" * 64}
+    bundle_obj = curator.load_yaml_from_bundle_object(bundle["bundle_yaml"])[0]
+    csv = bundle["csvs"][-1]
+
+    def validate_bundle():
+        with patch('curator.open_package_release',
+                   lambda release, use_cache: contextlib.nullcontext(BytesIO(bundle["tarball"]))):
+            return curator.validate_bundle(release)
+
+    def regenerate_bundle_yaml():
+        # regenerate_bundle_yaml edits its arguments, give it fresh ones
+        csvs = yaml.safe_load(yaml.dump(bundle["csvs"]))
+        return curator.regenerate_bundle_yaml(
+            {"data": dict(bundle_obj["data"])},
+            bundle["packages"],
+            bundle["crds"],
+            {"all": csvs}
+        )
+
+    results = {
+        "extract_bundle_from_tar_file": time_it(
+            lambda: curator.extract_bundle_from_tar_file(BytesIO(bundle["tarball"])), repeat),
+        "load_yaml_from_bundle_object": time_it(
+            lambda: curator.load_yaml_from_bundle_object(bundle["bundle_yaml"]), repeat),
+    }
+    for entry in BUNDLE_ENTRIES:
+        results[f"get_entry_from_bundle[{entry}]"] = time_it(
+            lambda entry=entry: curator.get_entry_from_bundle(bundle_obj, entry), repeat)
+    results["validate_csv"] = time_it(
+        lambda: curator.validate_csv(release["package"], release["version"], csv), repeat)
+
+    # validate_bundle stores the packages it regenerates from truncated
+    # bundles, keep them out of the real store
+    with tempfile.TemporaryDirectory() as tmpdir, \
+            patch('curator.REGENERATED', curator.RegeneratedStore(tmpdir)), \
+            patch('curator.ALLOWED_PACKAGES', []), patch('curator.DENIED_PACKAGES', []):
+        results["validate_bundle"] = time_it(validate_bundle, repeat)
+    results["regenerate_bundle_yaml"] = time_it(regenerate_bundle_yaml, repeat)
+
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD, out=sys.stdout):
+    """
+    Compares the best times of two benchmark runs, and returns the names of
+    the steps that slowed down by more than threshold.
+    """
+    if results["params"] != baseline["params"]:
+        out.write("Warning: the runs used different bundle parameters\n")
+
+    regressions = []
+    for name, timing in results["results"].items():
+        before = baseline["results"].get(name)
+        if before is None:
+            continue
+        change = timing["min"] / before["min"] - 1
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        out.write(f"{name:50} {before['min'] * 1000:10.3f}ms -> "
+                  f"{timing['min'] * 1000:10.3f}ms {change:+8.1%}{flag}\n")
+    return regressions
+
+
+def load_bundle(bundle_yaml_obj, loader):
+    """
+    Parses a bundle.yaml and every entry inside it, the way validate_bundle
+    does.  Returns the parsed bundle and entries.
+    """
+    bundle = yaml.load(bundle_yaml_obj, Loader=loader)
+    entries = {e: yaml.load(bundle['data'].get(e, ""), Loader=loader) for e in BUNDLE_ENTRIES}
+    return bundle, entries
+
+
+def yaml_backend_benchmark(bundles, repeat=5, out=sys.stdout):
+    """
+    Times parsing each bundle with the libyaml and pure Python loaders,
+    checks that both produce byte-identical yaml once dumped, and reports
+    the speedup.  Returns the total (python, libyaml) parse times.
+    """
+    if not hasattr(yaml, "CSafeLoader"):
+        out.write("PyYAML was built without libyaml, nothing to compare\n")
+        return None
+
+    totals = [0.0, 0.0]
+    for label, bundle_yaml_obj in bundles:
+        python_time = time_it(lambda: load_bundle(bundle_yaml_obj, yaml.SafeLoader), repeat)["min"]
+        libyaml_time = time_it(lambda: load_bundle(bundle_yaml_obj, yaml.CSafeLoader), repeat)["min"]
+
+        python_dump = curator.yaml_dump(load_bundle(bundle_yaml_obj, yaml.SafeLoader), default_style='|')
+        libyaml_dump = curator.yaml_dump(load_bundle(bundle_yaml_obj, yaml.CSafeLoader), default_style='|')
+        identical = python_dump == libyaml_dump
+
+        totals[0] += python_time
+        totals[1] += libyaml_time
+        out.write(
+            f"{label}: python {python_time * 1000:.1f}ms, "
+            f"libyaml {libyaml_time * 1000:.1f}ms, "
+            f"speedup {python_time / libyaml_time:.1f}x, "
+            f"{'identical' if identical else 'DIFFERENT'} output\n"
+        )
+
+    out.write(
+        f"\nTotal: python {totals[0] * 1000:.1f}ms, "
+        f"libyaml {totals[1] * 1000:.1f}ms, "
+        f"speedup {totals[0] / totals[1]:.1f}x\n"
+    )
+    return tuple(totals)
+
+
+def read_bundles(tarballs):
+    """
+    Returns (label, bundle.yaml bytes) for each tarball that has a bundle.
+    """
+    bundles = []
+    for tarball in tarballs:
+        bundle_yaml_obj, _, result = curator.extract_bundle_from_tar_file(tarball)
+        if result:
+            bundles.append((tarball, bundle_yaml_obj))
+    return bundles
+
+
+if __name__ == "__main__":
+
+    PARSER = argparse.ArgumentParser(
+        description="Benchmark the curator's validation hot path.")
+    PARSER.add_argument(
+        '--channels', action="store",
+        default=2, dest="channels", type=int,
+        help="Number of channels in the synthetic bundle")
+    PARSER.add_argument(
+        '--csvs-per-channel', action="store",
+        default=10, dest="csvs_per_channel", type=int,
+        help="Number of CSVs in each channel")
+    PARSER.add_argument(
+        '--chain-length', action="store",
+        default=None, dest="chain_length", type=int,
+        help="Length of each channel's replaces chain (default: every CSV)")
+    PARSER.add_argument(
+        '--crds', action="store",
+        default=2, dest="crds", type=int,
+        help="Number of CRDs in the synthetic bundle")
+    PARSER.add_argument(
+        '--crd-size', action="store",
+        default=10000, dest="crd_size", type=int,
+        help="Approximate size of each CRD, in bytes")
+    PARSER.add_argument(
+        '--reject-depth', action="store",
+        default=None, dest="reject_depth", type=int,
+        help="Reject the CSV this far down each chain, so the bundle is truncated")
+    PARSER.add_argument(
+        '--repeat', action="store",
+        default=10, dest="repeat", type=int,
+        help="Number of times to repeat each measurement")
+    PARSER.add_argument(
+        '--output', action="store",
+        default=None, dest="output", type=str,
+        help="Write the results to this JSON file")
+    PARSER.add_argument(
+        '--compare', action="store",
+        default=None, dest="compare", type=str,
+        help="Compare the results against a previous JSON results file")
+    PARSER.add_argument(
+        '--threshold', action="store",
+        default=DEFAULT_THRESHOLD, dest="threshold", type=float,
+        help="Slowdown, as a fraction, that counts as a regression")
+    PARSER.add_argument(
+        '--yaml-backends', action="store_true",
+        default=False, dest="yaml_backends",
+        help="Compare the libyaml and pure Python yaml backends instead")
+    PARSER.add_argument(
+        'tarballs', nargs='*',
+        help="Operator package tarballs to compare yaml backends with")
+    ARGS = PARSER.parse_args()
+
+    if ARGS.yaml_backends:
+        BUNDLES = read_bundles(ARGS.tarballs) or [
+            ("synthetic", synthetic_bundle()["bundle_yaml"])
+        ]
+        yaml_backend_benchmark(BUNDLES, ARGS.repeat)
+        sys.exit(0)
+
+    PARAMS = {
+        "channels": ARGS.channels,
+        "csvs_per_channel": ARGS.csvs_per_channel,
+        "chain_length": ARGS.chain_length,
+        "crds": ARGS.crds,
+        "crd_size": ARGS.crd_size,
+        "reject_depth": ARGS.reject_depth,
+    }
+    RESULTS = {
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "yaml_backend": curator.YAML_BACKEND,
+        "params": PARAMS,
+        "results": hot_path_benchmark(synthetic_bundle(**PARAMS), ARGS.repeat),
+    }
+
+    for NAME, TIMING in RESULTS["results"].items():
+        print(f"{NAME:50} min {TIMING['min'] * 1000:10.3f}ms  mean {TIMING['mean'] * 1000:10.3f}ms")
+
+    if ARGS.output:
+        with open(ARGS.output, 'w') as f:
+            json.dump(RESULTS, f, indent=2)
+
+    if ARGS.compare:
+        with open(ARGS.compare) as f:
+            BASELINE = json.load(f)
+        print(f"\nCompared with {BASELINE.get('commit') or ARGS.compare}:")
+        if compare(RESULTS, BASELINE, ARGS.threshold):
+            sys.exit(1)
@@ -6,17 +6,40 @@ order to vet operators for use with OSD v4.
 
 import argparse
 import base64
+import collections.abc
+import contextlib
+import cProfile
+from email.utils import parsedate_to_datetime
+from fnmatch import fnmatchcase
+import functools
+import gzip
+import hashlib
+from io import BytesIO
 import itertools
 import json
 import logging
+import operator
+import os
 from pathlib import Path
+import pstats
+import queue
+import random
 import shutil
+import sqlite3
 import sys
 import tarfile
+import tempfile
+import threading
+import time
+from xml.sax.saxutils import quoteattr
 import requests
+import requests.adapters
 import yaml
 
 
+# Base url of the Quay instance to curate, overridden with --quay-url
+QUAY_URL = "https://quay.io"
+
 SOURCE_NAMESPACES = [
     "redhat-operators",
     "certified-operators",
@@ -36,13 +59,135 @@ DENIED_PACKAGES = [
     "community-operators/syndesis"
 ]
 
+# Rules every CSV must pass.  Each rule forbids one thing:
+#   installSpecKey: a key in the CSV's install spec
+#   permission: a namespaced permission rule granting a verb on a resource
+#   installMode: a supported installMode type
+# The rules are compiled into a single pass over each CSV, see CompiledPolicy
+CSV_RULES = [
+    {
+        "name": "CSV must not include clusterPermissions",
+        "reason": "requires clusterPermissions",
+        "forbid": {"installSpecKey": "clusterPermissions"}
+    },
+    {
+        "name": "CSV must not grant SecurityContextConstraints permissions",
+        "reason": "requires security context constraints",
+        "forbid": {"permission": {
+            "apiGroup": "security.openshift.io",
+            "verb": "use",
+            "resource": "securitycontextconstraints"
+        }}
+    },
+    {
+        "name": "CSV must not require MultiNamespace installMode",
+        "reason": "supports multi-namespace install mode",
+        "forbid": {"installMode": "MultiNamespace"}
+    },
+]
+
+# Bump whenever the way rules are evaluated in CompiledPolicy or
+# validate_bundle changes, so that cached validation results are
+# invalidated.  Changes to the rules or package lists invalidate them
+# automatically.
+VALIDATION_RULES_VERSION = 2
+
+# Default number of concurrent workers for each stage of the curation pipeline
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_VALIDATE_WORKERS = 2
+DEFAULT_PUSH_WORKERS = 2
+
+# Maximum number of items waiting between two pipeline stages
+DEFAULT_QUEUE_SIZE = 16
+
+# Connection pooling and retry defaults for the Quay client
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_TIMEOUT = 60
+
+# Requests a second allowed to each of Quay's APIs, 0 for no limit.  The
+# requests in flight are also capped, starting at the pool size and
+# adapting to how Quay responds
+DEFAULT_CNR_RATE_LIMIT = 50
+DEFAULT_REPOSITORY_RATE_LIMIT = 10
+# Longest Retry-After from Quay that is honoured, in seconds
+MAX_RETRY_AFTER = 300
+
+# Content-addressed blob cache defaults
+DEFAULT_CACHE_DIR = ".cache/blobs"
+DEFAULT_CACHE_MAX_SIZE_MB = 4096
+# Packages regenerated from truncated bundles are stored apart from the
+# downloaded packages
+DEFAULT_REGENERATED_DIR = ".cache/regenerated"
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+PUSH_CHUNK_SIZE = 3 * 64 * 1024
+
+# Where the outcome of every processed release is recorded between runs
+DEFAULT_MANIFEST = ".curator-manifest.json"
+
+# Where the stages completed by each release are journaled during a run
+DEFAULT_JOURNAL = ".curator-journal.jsonl"
+
+# Where summary entries are streamed to as they are produced
+DEFAULT_RESULTS = "curator-results.jsonl"
+
+# Persistent store of validation results
+DEFAULT_VALIDATION_CACHE = ".cache/validation.sqlite3"
+
+# Persistent store of registry metadata responses.  Responses without an
+# ETag or Last-Modified are only reused for DEFAULT_METADATA_TTL seconds
+DEFAULT_METADATA_CACHE = ".cache/metadata.sqlite3"
+DEFAULT_METADATA_TTL = 0
+
+# Number of slowest releases reported by --profile
+DEFAULT_PROFILE_TOP = 10
+
+# cProfile runs on sys.monitoring from Python 3.12, which allows a single
+# active profile and has it record every thread
+PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+# Latency histogram buckets for stage timings, in seconds
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+IDEMPOTENT_METHODS = frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"])
+RETRY_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+# Parse with libyaml's C parser when PyYAML was built against it, and
+# fall back to the pure Python parser otherwise
+try:
+    YAML_LOADER = yaml.CSafeLoader
+    YAML_BACKEND = "libyaml"
+except AttributeError:
+    YAML_LOADER = yaml.SafeLoader
+    YAML_BACKEND = "python"
+
+
+def yaml_load(stream):
+    """
+    Safely loads a yaml document using the fastest available parser.
+    """
+    return yaml.load(stream, Loader=YAML_LOADER)
+
+
+def yaml_dump(data, stream=None, **kwargs):
+    """
+    Dumps data to yaml.  This always uses the Python emitter: with a
+    default style set, libyaml's emitter formats long strings differently
+    and tags non-string scalars with the non-specific "!" tag, which would
+    reload them as strings.
+    """
+    return yaml.dump(data, stream, Dumper=yaml.SafeDumper, **kwargs)
+
 
 def _url(path):
-    return "https://quay.io/cnr/api/v1/" + path
+    return f"{QUAY_URL}/cnr/api/v1/" + path
 
 
 def _repo_url(path):
-    return "https://quay.io/api/v1/" + path
+    return f"{QUAY_URL}/api/v1/" + path
 
 
 def _quay_headers(authtoken):
@@ -52,6 +197,784 @@ def _quay_headers(authtoken):
     }
 
 
+class Metrics:
+    """
+    Run metrics: a latency histogram per stage, byte counters for
+    downloads and uploads, and counts of HTTP status codes per API.
+    Recording is a no-op unless the metrics are enabled.  The metrics are
+    written out in the Prometheus textfile format for node_exporter.
+    """
+    def __init__(self, enabled=False, buckets=METRICS_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._bytes = {}
+        self._statuses = {}
+
+    def observe(self, stage, seconds):
+        """
+        Records how long one call to a stage took.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.setdefault(
+                stage, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            )
+            for i, le in enumerate(self.buckets):
+                if seconds <= le:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+
+    def add_bytes(self, direction, count):
+        """
+        Counts bytes downloaded or uploaded.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._bytes[direction] = self._bytes.get(direction, 0) + count
+
+    def count_status(self, api, status_code):
+        """
+        Counts an HTTP response from one of Quay's APIs.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            key = (api, str(status_code))
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            lines += [
+                "# HELP curator_stage_duration_seconds Time spent in each curation stage.",
+                "# TYPE curator_stage_duration_seconds histogram",
+            ]
+            for stage, histogram in sorted(self._histograms.items()):
+                for le, count in zip(self.buckets, histogram["buckets"]):
+                    lines.append(f'curator_stage_duration_seconds_bucket{{stage="{stage}",le="{le}"}} {count}')
+                lines.append(f'curator_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+                lines.append(f'curator_stage_duration_seconds_sum{{stage="{stage}"}} {histogram["sum"]}')
+                lines.append(f'curator_stage_duration_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+            lines += [
+                "# HELP curator_bytes_total Bytes transferred to and from Quay.",
+                "# TYPE curator_bytes_total counter",
+            ]
+            for direction, count in sorted(self._bytes.items()):
+                lines.append(f'curator_bytes_total{{direction="{direction}"}} {count}')
+            lines += [
+                "# HELP curator_http_responses_total HTTP responses from Quay by API and status code.",
+                "# TYPE curator_http_responses_total counter",
+            ]
+            for (api, code), count in sorted(self._statuses.items()):
+                lines.append(f'curator_http_responses_total{{api="{api}",code="{code}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path):
+        """
+        Atomically writes the metrics to a Prometheus textfile, so that
+        node_exporter never reads a partial file.
+        """
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, 'w') as f:
+            f.write(self.render())
+        os.replace(tmp, path)
+
+
+# Shared metrics for the run, enabled with --metrics-file
+METRICS = Metrics()
+
+
+def _profile_label(func):
+    """
+    Returns a frame label for a pstats function key.
+    """
+    filename, line, name = func
+    if filename == '~':
+        return name.replace(';', ',')
+    return f"{name} ({os.path.basename(filename)}:{line})".replace(';', ',')
+
+
+def collapsed_stacks(stats, max_depth=64):
+    """
+    Returns the profile in pstats as collapsed stacks, "a;b;c microseconds"
+    lines that flamegraph tools read.
+
+    cProfile only records caller and callee pairs, so the stacks are
+    rebuilt by walking the call graph down from its roots, splitting each
+    function's time between its callers in proportion to the time each
+    call edge took.
+    """
+    children = collections.defaultdict(dict)
+    roots = []
+    for func, (_, _, _, _, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            if caller != func:
+                children[caller][func] = edge
+        if not set(callers) - {func}:
+            roots.append(func)
+
+    stacks = collections.Counter()
+
+    def walk(func, path, seconds):
+        # Nothing below a path this short would show up
+        if seconds < 5e-7:
+            return
+        _, _, tt, ct, _ = stats.stats[func]
+        share = seconds / ct if ct else 0.0
+        path = path + (func,)
+        stacks[path] += tt * share
+        if len(path) >= max_depth:
+            return
+        for callee, (_, _, _, edge_ct) in children[func].items():
+            if callee not in path:
+                walk(callee, path, edge_ct * share)
+
+    for root in roots:
+        walk(root, (), stats.stats[root][3])
+
+    return [
+        f"{';'.join(_profile_label(f) for f in path)} {round(seconds * 1e6)}"
+        for path, seconds in sorted(stacks.items())
+        if round(seconds * 1e6) > 0
+    ]
+
+
+class Profiler:
+    """
+    Profiles the timed stages with cProfile when enabled.
+
+    Where profiles are per thread, each outermost timed call in a thread is
+    profiled on its own and its stats are added to those of its stage.
+    Otherwise, one profile started by start() covers the whole run, and
+    the stages are not told apart.  The time spent in each timed stage,
+    less the time spent in timed stages it called, is also added up for
+    the release a pipeline stage wrapped with stage() is working on, so
+    the slowest releases and the stage that dominated each one can be
+    reported.  Nothing is recorded unless the profiler is enabled.
+    """
+    def __init__(self, enabled=False, per_thread=PROFILE_PER_THREAD):
+        self.enabled = enabled
+        self.per_thread = per_thread
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._run = None
+        self._stats = {}
+        self._releases = {}
+
+    def start(self):
+        """
+        Starts the profile of the whole run, where profiles cannot be per
+        thread.
+        """
+        if self.per_thread or self._run is not None:
+            return
+        logging.warning("cProfile records every thread at once on this Python, "
+                        "so the run is profiled as a whole rather than per stage")
+        self._run = cProfile.Profile()
+        self._run.enable()
+
+    def stage(self, function):
+        """
+        Wraps a pipeline stage so that the timed calls it makes are counted
+        against the release it is working on.
+        """
+        @functools.wraps(function)
+        def wrapper(item):
+            release = item[0] if isinstance(item, tuple) else item
+            self._local.release = f"{release['package']}:{release['version']}"
+            try:
+                return function(item)
+            finally:
+                self._local.release = None
+        return wrapper
+
+    def call(self, stage, function, *args, **kwargs):
+        """
+        Calls a timed function, profiling it unless a timed function that
+        called it is already being profiled.
+        """
+        frames = getattr(self._local, "frames", None)
+        if frames is None:
+            frames = self._local.frames = []
+
+        profile = None
+        if not frames and self.per_thread:
+            profile = cProfile.Profile()
+            profile.enable()
+
+        frame = [time.perf_counter(), 0.0]
+        frames.append(frame)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            if profile is not None:
+                profile.disable()
+            elapsed = time.perf_counter() - frame[0]
+            frames.pop()
+            if frames:
+                frames[-1][1] += elapsed
+            self._record(stage, elapsed - frame[1], profile)
+
+    def _record(self, stage, seconds, profile):
+        release = getattr(self._local, "release", None)
+        with self._lock:
+            if release is not None:
+                self._releases.setdefault(release, collections.Counter())[stage] += seconds
+            if profile is not None:
+                if stage in self._stats:
+                    self._stats[stage].add(profile)
+                else:
+                    self._stats[stage] = pstats.Stats(profile)
+
+    def slowest(self, count=DEFAULT_PROFILE_TOP):
+        """
+        Returns (release, seconds, stage, stage seconds) for the count
+        slowest releases, with the stage that took the most time in each.
+        """
+        with self._lock:
+            totals = [
+                (release, sum(stages.values()), *stages.most_common(1)[0])
+                for release, stages in self._releases.items()
+            ]
+        return sorted(totals, key=lambda t: t[1], reverse=True)[:count]
+
+    def write(self, directory):
+        """
+        Stops the profile of the whole run, if there is one.  Writes the
+        stats of each stage and of the whole run as pstats files, and the
+        whole run as collapsed stacks, to a directory.  Returns the path of
+        the collapsed stacks, or None if nothing was profiled.
+        """
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if self._run is not None:
+                self._run.disable()
+                total = pstats.Stats(self._run)
+            elif self._stats:
+                total = pstats.Stats()
+                for stage, stats in sorted(self._stats.items()):
+                    stats.dump_stats(str(directory / f"{stage}.pstats"))
+                    total.add(stats)
+            else:
+                return None
+        total.dump_stats(str(directory / "curator.pstats"))
+        path = directory / "curator.collapsed"
+        with open(path, 'w') as f:
+            for line in collapsed_stacks(total):
+                f.write(line + "\n")
+        return path
+
+    def print_report(self, count=DEFAULT_PROFILE_TOP, out=sys.stdout):
+        """
+        Prints the count slowest releases.
+        """
+        slowest = self.slowest(count)
+        if not slowest:
+            return
+        out.write(f"\nSlowest {len(slowest)} releases:\n")
+        for release, seconds, stage, stage_seconds in slowest:
+            share = stage_seconds / seconds if seconds else 1.0
+            out.write(f"  {seconds:8.3f}s  {release}  ({stage} {stage_seconds:.3f}s, {share:.0%})\n")
+
+
+# Shared profiler for the run, enabled with --profile
+PROFILER = Profiler()
+
+
+def timed(stage):
+    """
+    Decorates a function so that its latency is recorded under the given
+    stage when metrics are enabled, and it is profiled when the profiler
+    is.
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not (METRICS.enabled or PROFILER.enabled):
+                return function(*args, **kwargs)
+            start = time.monotonic()
+            try:
+                if PROFILER.enabled:
+                    return PROFILER.call(stage, function, *args, **kwargs)
+                return function(*args, **kwargs)
+            finally:
+                METRICS.observe(stage, time.monotonic() - start)
+        return wrapper
+    return decorator
+
+
+def _api_name(url):
+    """
+    Returns which of Quay's APIs a url belongs to.
+    """
+    return "cnr" if url.startswith(_url("")) else "repository"
+
+
+def _retry_after(response):
+    """
+    Returns the seconds a response's Retry-After header asks to wait for,
+    or None if it has none.
+    """
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError, IndexError):
+            return None
+    return min(max(seconds, 0.0), MAX_RETRY_AFTER)
+
+
+class TokenBucket:
+    """
+    Caps a request rate at rate a second, in bursts of up to burst.  It is
+    not thread safe; its RateLimiter holds a lock around it.
+    """
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst or rate
+        self._tokens = self.burst
+        self._updated = now
+
+    def wait(self, now):
+        """
+        Refills the bucket, and returns 0 if a token is available or the
+        seconds until one will be.
+        """
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def take(self):
+        """Takes an available token from the bucket."""
+        self._tokens -= 1
+
+
+class ConcurrencyLimit:
+    """
+    An AIMD cap on the requests in flight.  The cap is halved when a
+    request fails, at most once for every request sent since the last cut,
+    and grows by one for each cap's worth of successes, up to maximum.  It
+    is not thread safe; its RateLimiter holds a lock around it.
+    """
+    def __init__(self, maximum):
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._healthy = 0
+        self._decreased = float("-inf")
+
+    def full(self):
+        """Returns whether no more requests may be sent."""
+        return self.in_flight >= int(self.limit)
+
+    def failed(self, started, now):
+        """
+        Records that a request sent at started failed, at now.
+        """
+        self._healthy = 0
+        if started >= self._decreased:
+            self.limit = max(1.0, self.limit / 2)
+            self._decreased = now
+            return True
+        return False
+
+    def succeeded(self):
+        """
+        Records that a request succeeded.
+        """
+        if self.limit < self.maximum:
+            self._healthy += 1
+            if self._healthy >= self.limit:
+                self.limit = min(float(self.maximum), self.limit + 1)
+                self._healthy = 0
+
+
+class RateLimiter:
+    """
+    Paces the requests to one of Quay's APIs.
+
+    A TokenBucket caps the request rate at rate a second, in bursts of up
+    to burst, and a ConcurrencyLimit caps the requests in flight, up to
+    max_concurrency, backing off when Quay throttles or fails a request.
+    A Retry-After from Quay holds back every request until it has passed.
+    """
+    def __init__(self, rate=None, burst=None, max_concurrency=DEFAULT_POOL_MAXSIZE,
+                 clock=time.monotonic):
+        self._clock = clock
+        self._cond = threading.Condition()
+        self.bucket = TokenBucket(rate, burst, clock()) if rate else None
+        self.concurrency = ConcurrencyLimit(max_concurrency)
+        self.requests = 0
+        self._paused_until = 0.0
+
+    @property
+    def limit(self):
+        """The number of requests currently allowed in flight."""
+        return self.concurrency.limit
+
+    def acquire(self):
+        """
+        Waits until a request may be sent, and returns the time it was
+        allowed, to be passed back to release.
+        """
+        with self._cond:
+            while True:
+                now = self._clock()
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self.concurrency.full():
+                        wait = None
+                    else:
+                        wait = self.bucket.wait(now) if self.bucket else 0
+                        if wait <= 0:
+                            if self.bucket:
+                                self.bucket.take()
+                            self.concurrency.in_flight += 1
+                            self.requests += 1
+                            return now
+                self._cond.wait(wait)
+
+    def release(self, started, status=None, retry_after=None):
+        """
+        Records how a request sent at started went: its status code, or
+        None if no response came back, and any Retry-After it asked for.
+        """
+        with self._cond:
+            self.concurrency.in_flight -= 1
+            now = self._clock()
+            if status is None or status in RETRY_STATUS_CODES:
+                if self.concurrency.failed(started, now):
+                    logging.debug(f"Quay returned {status}, allowing {int(self.limit)} requests in flight")
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+            else:
+                self.concurrency.succeeded()
+            self._cond.notify_all()
+
+
+class QuayClient:
+    """
+    A shared HTTP client for Quay's CNR and repository APIs.
+
+    Requests go through a single keep-alive session with a bounded
+    connection pool, so TLS handshakes are paid once per connection rather
+    than once per call.  Idempotent requests that fail with a connection
+    error or a retryable status are retried with jittered exponential
+    backoff.  Each API has its own RateLimiter, so throttling by one does
+    not hold back the other.
+    """
+    def __init__(self, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, retries=DEFAULT_RETRIES,
+                 backoff=DEFAULT_BACKOFF, timeout=DEFAULT_TIMEOUT,
+                 cnr_rate_limit=DEFAULT_CNR_RATE_LIMIT,
+                 repository_rate_limit=DEFAULT_REPOSITORY_RATE_LIMIT):
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiters = {
+            "cnr": RateLimiter(cnr_rate_limit, max_concurrency=pool_maxsize),
+            "repository": RateLimiter(repository_rate_limit, max_concurrency=pool_maxsize),
+        }
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=True
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def backoff_delay(self, attempt):
+        """
+        Returns a "full jitter" delay for the given retry attempt.
+        """
+        return random.uniform(0, self.backoff * 2 ** attempt)
+
+    @staticmethod
+    def _release_on_close(response, limiter, started):
+        """
+        Returns a close method for a streamed response that also releases
+        its request from the limiter, once.
+        """
+        close = response.close
+        released = []
+
+        def closing():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    limiter.release(started, response.status_code, _retry_after(response))
+        return closing
+
+    def request(self, method, url, idempotent=None, **kwargs):
+        """
+        Sends a request through the pooled session, retrying it if it is
+        idempotent.  Returns the final response, or raises the final
+        connection error.  A streamed response counts as in flight until
+        it is closed, as its body is still being downloaded.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        attempts = self.retries + 1 if idempotent else 1
+        kwargs.setdefault('timeout', self.timeout)
+
+        limiter = self.limiters[_api_name(url)]
+
+        for attempt in range(attempts):
+            last_attempt = attempt == attempts - 1
+            started = limiter.acquire()
+            r = None
+            streaming = False
+            try:
+                r = self.session.request(method, url, **kwargs)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.Timeout) as err:
+                if last_attempt:
+                    raise
+                logging.debug(f"{method} {url} failed ({err}), retrying")
+            else:
+                METRICS.count_status(_api_name(url), r.status_code)
+                if last_attempt or r.status_code not in RETRY_STATUS_CODES:
+                    if kwargs.get('stream'):
+                        r.close = self._release_on_close(r, limiter, started)
+                        streaming = True
+                    return r
+                logging.debug(f"{method} {url} returned {r.status_code}, retrying")
+                r.close()
+            finally:
+                if not streaming:
+                    limiter.release(started, None if r is None else r.status_code, _retry_after(r))
+            time.sleep(self.backoff_delay(attempt))
+
+        return None
+
+    def get(self, url, **kwargs):
+        """Sends a GET request."""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Sends a POST request."""
+        return self.request("POST", url, **kwargs)
+
+
+# Shared client used for every call to Quay
+QUAY = QuayClient()
+
+
+class DigestMismatchError(Exception):
+    """
+    Raised when downloaded content does not match its expected digest.
+    """
+
+
+def _check_digest(digest):
+    """
+    Returns the digest if it is a sha256 hex digest, so it is safe to use
+    in a path, or raises ValueError.
+    """
+    if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        raise ValueError(f"Invalid sha256 digest: {digest}")
+    return digest
+
+
+class BlobCache:
+    """
+    A content-addressed store of package blobs, keyed by sha256 digest.
+
+    Blobs are hashed while they are written and only become visible under
+    their digest once the hash has been verified, so a truncated or corrupt
+    download can never be a cache hit.  The store is bounded by size, and
+    the least recently used blobs are evicted first.  Writes are atomic
+    renames, so several processes may share one cache directory.
+    """
+    def __init__(self, root=DEFAULT_CACHE_DIR,
+                 max_bytes=DEFAULT_CACHE_MAX_SIZE_MB * 1024 * 1024):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path(self, digest):
+        """
+        Returns the path a blob is stored at.
+        """
+        return self.root / "sha256" / digest[:2] / _check_digest(digest)
+
+    def open(self, digest):
+        """
+        Opens a cached blob for reading, or returns None if it is not cached.
+        """
+        path = self.path(digest)
+        with self._lock:
+            try:
+                # Mark the blob as recently used
+                os.utime(path)
+                return open(path, 'rb')
+            except FileNotFoundError:
+                return None
+
+    def put(self, digest, chunks):
+        """
+        Stores the blob made of the given chunks of bytes, verifying it
+        against its digest, and returns it opened for reading.
+        """
+        path = self.path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    sha.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+            if sha.hexdigest() != digest:
+                raise DigestMismatchError(
+                    f"Expected sha256 {digest}, got {sha.hexdigest()}"
+                )
+            with self._lock:
+                os.replace(tmp, path)
+                blob = open(path, 'rb')
+                if self._size is not None:
+                    self._size += size
+            self.evict()
+            return blob
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _blobs(self):
+        """
+        Returns (mtime, size, path) for every blob in the cache.
+        """
+        blobs = []
+        for path in (self.root / "sha256").glob("*/*"):
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+        return blobs
+
+    def evict(self):
+        """
+        Removes the least recently used blobs until the cache fits within
+        its maximum size.
+        """
+        with self._lock:
+            if self._size is not None and self._size <= self.max_bytes:
+                return
+
+            # Rescan, as other processes may share the cache directory
+            blobs = sorted(self._blobs())
+            self._size = sum(size for _, size, _ in blobs)
+            for _, size, path in blobs:
+                if self._size <= self.max_bytes:
+                    break
+                logging.debug(f"Evicting {path.name} from the blob cache")
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                self._size -= size
+
+
+# Shared store for downloaded package blobs
+BLOBS = BlobCache()
+
+
+class RegeneratedStore:
+    """
+    The packages regenerated from truncated bundles, kept apart from the
+    blob cache so that it only ever holds packages as they were published.
+
+    Regeneration is deterministic, so a regenerated package is stored under
+    the digest of the package it was regenerated from and the fingerprint
+    of the policy that truncated it, and regenerating it again gives the
+    same bytes.  Writes are atomic renames.
+    """
+    def __init__(self, root=DEFAULT_REGENERATED_DIR):
+        self.root = Path(root)
+
+    def path(self, release):
+        """
+        Returns the path the package regenerated from a release is stored at.
+        """
+        digest = _check_digest(release['digest'])
+        return self.root / policy_fingerprint() / digest[:2] / f"{digest}.tar.gz"
+
+    def exists(self, release):
+        """
+        Returns whether a package regenerated from the release is stored.
+        """
+        return self.path(release).exists()
+
+    def open(self, release):
+        """
+        Opens the package regenerated from a release, or returns None.
+        """
+        try:
+            return open(self.path(release), 'rb')
+        except FileNotFoundError:
+            return None
+
+    def put(self, release, data):
+        """
+        Stores the package regenerated from a release, and returns its
+        sha256 digest.
+        """
+        path = self.path(release)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return hashlib.sha256(data).hexdigest()
+
+    def prune(self):
+        """
+        Removes the packages regenerated under any other policy, which can
+        never be used again.
+        """
+        if not self.root.is_dir():
+            return
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name != policy_fingerprint():
+                shutil.rmtree(path, ignore_errors=True)
+
+
+# Shared store for packages regenerated from truncated bundles
+REGENERATED = RegeneratedStore()
+
+
 def _pkg_shortname(package):
     """
     Strips out the package's namespace and returns its shortname.
@@ -73,62 +996,895 @@ def _pkg_curated_namespace(package):
     return f"curated-{package.split('/', 1)[0]}"
 
 
+def _pkg_source_package(curated_package):
+    """
+    Returns the source package a curated package was curated from.
+    """
+    return curated_package[len("curated-"):] if curated_package.startswith("curated-") else curated_package
+
+
+def parse_shard(value):
+    """
+    Parses a shard given as "i/N", the i'th of N shards counting from 0.
+    """
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"shard must be given as i/N, not {value!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be from 0 to {count - 1}, not {index}")
+    return index, count
+
+
+def shard_path(path, shard):
+    """
+    Returns the path a shard uses in place of a default path, so shards
+    sharing a working directory do not overwrite each other's files.
+    """
+    if shard is None:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.shard-{shard[0]}-of-{shard[1]}{ext}"
+
+
+def in_shard(package, shard):
+    """
+    Returns whether a source package belongs to a shard.  Packages are
+    assigned by a stable hash of their name, so every instance agrees on
+    the split without coordinating.
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    digest = hashlib.sha256(package.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % count == index
+
+
+VERSION_OPERATORS = {
+    ">=": operator.ge, "<=": operator.le, "==": operator.eq,
+    "!=": operator.ne, ">": operator.gt, "<": operator.lt,
+}
+
+
+def _version_parts(version):
+    """
+    Returns the dot-separated identifiers of a version as a sort key.
+    Numeric identifiers sort numerically and before alphanumeric ones.
+    """
+    return tuple((0, int(p), "") if p.isdigit() else (1, 0, p) for p in version.split('.') if p)
+
+
+def _version_key(version):
+    """
+    Returns a key that sorts release versions numerically where they are
+    numeric, so that 1.10.0 sorts after 1.9.0, and sorts a prerelease such
+    as 1.0.0-rc1 before its release, as semver does.  Build metadata after
+    a + only breaks ties.
+    """
+    version, _, build = version.partition('+')
+    release, _, prerelease = version.partition('-')
+    return (_version_parts(release), 0 if prerelease else 1,
+            _version_parts(prerelease), _version_parts(build))
+
+
+def parse_version_range(value):
+    """
+    Parses a version range such as ">=1.2.0,<2.0.0" into a list of
+    (comparison, version) clauses that must all hold.
+    """
+    clauses = []
+    for clause in value.split(','):
+        clause = clause.strip()
+        for symbol in sorted(VERSION_OPERATORS, key=len, reverse=True):
+            if clause.startswith(symbol) and clause[len(symbol):].strip():
+                clauses.append((symbol, clause[len(symbol):].strip()))
+                break
+        else:
+            raise argparse.ArgumentTypeError(
+                f"version range clauses must be a comparison and a version, such as >=1.0.0, not {clause!r}")
+    return clauses
+
+
+class ReleaseFilter:
+    """
+    Selects the namespaces, packages and releases a run curates.  Namespaces
+    and packages are selected before any release metadata is fetched, by
+    namespace, package glob (matched against "namespace/package", or just
+    the package if the glob has no namespace) and shard.  Releases are then
+    selected by version range, and optionally only the latest is kept.
+    """
+    def __init__(self, namespaces=None, packages=None, versions=None,
+                 latest_only=False, shard=None):
+        self.namespaces = namespaces
+        self.packages = packages
+        self.versions = versions or []
+        self.latest_only = latest_only
+        self.shard = shard
+
+    def _globs(self):
+        return [glob if '/' in glob else f"*/{glob}" for glob in self.packages]
+
+    def namespace(self, namespace):
+        """
+        Returns whether any package in the namespace could be selected.
+        """
+        if self.namespaces and namespace not in self.namespaces:
+            return False
+        if self.packages:
+            return any(fnmatchcase(namespace, glob.split('/', 1)[0])
+                       for glob in self._globs())
+        return True
+
+    def package(self, package):
+        """
+        Returns whether a source package is selected.
+        """
+        if not self.namespace(_pkg_namespace(package)):
+            return False
+        if self.packages and not any(fnmatchcase(package, glob)
+                                     for glob in self._globs()):
+            return False
+        return in_shard(package, self.shard)
+
+    def releases(self, releases):
+        """
+        Returns the selected releases of a package.
+        """
+        releases = [
+            r for r in releases
+            if all(VERSION_OPERATORS[symbol](_version_key(r['version']), _version_key(version))
+                   for symbol, version in self.versions)
+        ]
+        if self.latest_only and releases:
+            releases = [max(releases, key=lambda r: _version_key(r['version']))]
+        return releases
+
+
+def curation_policy():
+    """
+    Returns the declarative curation policy: the allow and deny lists, and
+    the rules every CSV must pass.
+    """
+    return {
+        "allowed": sorted(ALLOWED_PACKAGES),
+        "denied": sorted(DENIED_PACKAGES),
+        "csv": CSV_RULES,
+        "rules": VALIDATION_RULES_VERSION
+    }
+
+
+def policy_fingerprint():
+    """
+    Returns a hash of everything that decides a validation result other
+    than the bundle itself: the curation policy and the rules version.
+    """
+    return hashlib.sha256(
+        json.dumps(curation_policy(), sort_keys=True).encode()
+    ).hexdigest()
+
+
+class CompiledPolicy:
+    """
+    The curation policy compiled for evaluation.  Package lists become sets,
+    and the CSV rules are grouped by the part of the CSV they inspect, so
+    that every rule is evaluated in a single pass over each CSV.
+    """
+    def __init__(self, policy):
+        self.allowed = frozenset(policy['allowed'])
+        self.denied = frozenset(policy['denied'])
+        self.names = [rule['name'] for rule in policy['csv']]
+        self.reasons = {rule['name']: rule['reason'] for rule in policy['csv']}
+
+        self._install_spec_keys = []
+        self._permissions = []
+        self._install_modes = {}
+        for rule in policy['csv']:
+            forbid = rule['forbid']
+            if 'installSpecKey' in forbid:
+                self._install_spec_keys.append((rule['name'], forbid['installSpecKey']))
+            elif 'permission' in forbid:
+                p = forbid['permission']
+                self._permissions.append((rule['name'], p['apiGroup'], p['verb'], p['resource']))
+            elif 'installMode' in forbid:
+                self._install_modes.setdefault(forbid['installMode'], []).append(rule['name'])
+            else:
+                raise ValueError(f"Unknown rule for {rule['name']}: {forbid}")
+
+    def is_allowed(self, package):
+        """Returns whether the package is in the allow list."""
+        return package in self.allowed
+
+    def is_denied(self, package):
+        """Returns whether the package is in the deny list."""
+        return package in self.denied
+
+    def is_listed(self, package):
+        """
+        Returns whether the package is in either list, and so is judged
+        without reading its bundle.
+        """
+        return package in self.allowed or package in self.denied
+
+    def evaluate(self, csv):
+        """
+        Evaluates every CSV rule, returning a dict of rule name to result in
+        the order the rules are declared.
+        """
+        tests = dict.fromkeys(self.names, True)
+        install_spec = csv['spec']['install']['spec']
+
+        for name, key in self._install_spec_keys:
+            if key in install_spec:
+                tests[name] = False
+
+        if self._permissions:
+            for permission in install_spec.get('permissions', []):
+                for rule in permission.get('rules', []):
+                    for name, group, verb, resource in self._permissions:
+                        if (group in rule.get('apiGroups', []) and
+                                verb in rule.get('verbs', []) and
+                                resource in rule.get('resources', [])):
+                            tests[name] = False
+
+        if self._install_modes:
+            for im in csv['spec']['installModes']:
+                if im['supported'] is True:
+                    for name in self._install_modes.get(im['type'], []):
+                        tests[name] = False
+
+        return tests
+
+
+_COMPILED_POLICIES = {}
+
+
+def current_policy():
+    """
+    Returns the current curation policy, compiled.  Compiled policies are
+    cached on the package lists, the identity of the CSV rules and the rules
+    version, so changing any of them recompiles the policy without hashing
+    it on every call.
+    """
+    key = (tuple(ALLOWED_PACKAGES), tuple(DENIED_PACKAGES), id(CSV_RULES),
+           VALIDATION_RULES_VERSION)
+    compiled = _COMPILED_POLICIES.get(key)
+    if compiled is None:
+        compiled = _COMPILED_POLICIES[key] = CompiledPolicy(curation_policy())
+    return compiled
+
+
+class ValidationCache:
+    """
+    A persistent SQLite store of validation results, keyed by package,
+    blob digest and policy fingerprint.  Changing the allow or deny lists,
+    or bumping VALIDATION_RULES_VERSION, changes the fingerprint and so
+    invalidates every stored result.
+    """
+    def __init__(self, path=DEFAULT_VALIDATION_CACHE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " package TEXT, digest TEXT, policy TEXT,"
+                " passed INTEGER, tests TEXT,"
+                " PRIMARY KEY (package, digest, policy))"
+            )
+
+    def prune(self):
+        """
+        Removes the results stored under any other policy, which can never
+        be hit again.
+        """
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM results WHERE policy != ?",
+                             (policy_fingerprint(),))
+
+    def get(self, release):
+        """
+        Returns the stored (passed, tests) result for a release, or None.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT passed, tests FROM results"
+                " WHERE package = ? AND digest = ? AND policy = ?",
+                (release['package'], release['digest'], policy_fingerprint())
+            ).fetchone()
+        if row is None:
+            return None
+        return bool(row[0]), json.loads(row[1])
+
+    def put(self, release, passed, tests):
+        """
+        Stores the validation result for a release.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (release['package'], release['digest'], policy_fingerprint(),
+                 int(passed), json.dumps(tests))
+            )
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
+
+
+def _bundle_truncated(tests):
+    """
+    Returns true if validation truncated the bundle, in which case the
+    package was regenerated.
+    """
+    return any(name.endswith("truncating bundle here") for name in tests)
+
+
+def _result_reusable(release, tests):
+    """
+    Returns whether a stored validation result can be used without
+    validating again: the bundle was not truncated, or the package
+    regenerated from it is still stored.
+    """
+    return not _bundle_truncated(tests) or REGENERATED.exists(release)
+
+
+def _stored_response(url, body, status=200):
+    """
+    Returns a stored registry response body as a requests.Response.
+    """
+    r = requests.Response()
+    r.status_code = status
+    r.url = url
+    r.headers["Content-Type"] = "application/json"
+    r.raw = BytesIO(bytes(body))
+    return r
+
+
+class MetadataCache:
+    """
+    A persistent SQLite store of registry metadata responses and their
+    ETag and Last-Modified validators.
+
+    A stored response is revalidated with a conditional request, and a
+    304 is answered from disk without downloading the listing again.
+    Responses that come without validators are served from disk without
+    any request for ttl seconds, and not stored at all if ttl is 0.
+    """
+    def __init__(self, path=DEFAULT_METADATA_CACHE, ttl=DEFAULT_METADATA_TTL):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT,"
+                " fetched REAL, body BLOB)"
+            )
+
+    def get(self, url):
+        """
+        GETs url, from disk if the stored response is still valid.
+        """
+        with self._lock:
+            row = self._db.execute(
+                "SELECT etag, last_modified, fetched, body FROM responses WHERE url = ?",
+                (url,)
+            ).fetchone()
+
+        headers = {}
+        if row is not None:
+            etag, last_modified, fetched, body = row
+            if not (etag or last_modified):
+                if time.time() - fetched < self.ttl:
+                    with self._lock:
+                        self.hits += 1
+                    return _stored_response(url, body)
+            if etag:
+                headers["If-None-Match"] = etag
+            if last_modified:
+                headers["If-Modified-Since"] = last_modified
+
+        r = QUAY.get(url, headers=headers)
+
+        if r.status_code == 304 and row is not None:
+            with self._lock, self._db:
+                self.revalidated += 1
+                self._db.execute("UPDATE responses SET fetched = ? WHERE url = ?",
+                                 (time.time(), url))
+            return _stored_response(url, row[3])
+
+        with self._lock:
+            self.misses += 1
+        if r.ok:
+            etag = r.headers.get("ETag")
+            last_modified = r.headers.get("Last-Modified")
+            if etag or last_modified or self.ttl:
+                with self._lock, self._db:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                        (url, etag, last_modified, time.time(), r.content)
+                    )
+        return r
+
+    def close(self):
+        """Closes the database."""
+        with self._lock:
+            self._db.close()
+
+
+# Registry metadata cache, set up by main.  Without one, every listing is
+# downloaded
+METADATA = None
+
+
+class MissingFromMirrorError(requests.exceptions.RequestException):
+    """
+    A package is not in the mirror being curated.  It is handled like a
+    failed download.
+    """
+
+
+class RegistryMirror:
+    """
+    A local snapshot of the source namespaces: their package listings and
+    release metadata as Quay served them, and their packages in a blob
+    cache that is never evicted.
+
+    Listings are stored under metadata/ by their path in the CNR API, so
+    a curator run can read them in place of Quay, and packages under
+    blobs/ in the blob cache layout, so the directory can also be given to
+    --cache-dir.
+    """
+    def __init__(self, root):
+        self.root = Path(root)
+        self.blobs = BlobCache(self.root / "blobs", max_bytes=float("inf"))
+
+    def path(self, url):
+        """
+        Returns the path the response to a CNR API url is stored at.
+        """
+        path = url.split("/cnr/api/v1/", 1)[-1].replace("?", "@")
+        return self.root / "metadata" / f"{path}.json"
+
+    def get(self, url):
+        """
+        Returns the stored response to url, or a 404 if it is not mirrored.
+        """
+        try:
+            return _stored_response(url, self.path(url).read_bytes())
+        except FileNotFoundError:
+            return _stored_response(url, b'{"error": "Not mirrored"}', status=404)
+
+    def put(self, url, body):
+        """
+        Stores the response body to url.
+        """
+        path = self.path(url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(body)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+
+# Mirror being curated instead of Quay, set up by main with --from-mirror
+MIRROR = None
+
+
+def _get_metadata(url):
+    """
+    GETs registry metadata, from the mirror when curating one, and
+    otherwise through the metadata cache if there is one.
+    """
+    if MIRROR is not None:
+        return MIRROR.get(url)
+    if METADATA is None:
+        return QUAY.get(url)
+    return METADATA.get(url)
+
+
+@timed("namespace_listing")
 def list_operators(namespace):
     '''List the operators in the provided quay app registry namespace'''
-    r = requests.get(_url(f"packages?namespace={namespace}"))
+    r = _get_metadata(_url(f"packages?namespace={namespace}"))
     if r.ok:
         l = [str(e['name']) for e in r.json()]
         return l
 
+    logging.warning(f"Failed to list the operators in {namespace}, skipping the namespace. HTTP Error: {r.status_code}")
     return None
 
 
-def get_release_data(operator):
+def _release_from_entry(entry, with_size=False):
+    """
+    Returns the release described by an entry of a release listing.
+    """
+    release = {
+        "package": entry['package'],
+        "digest": str(entry['content']['digest']),
+        "version": entry['release'],
+        "namespace": _pkg_namespace(entry['package'])
+    }
+    if with_size:
+        release["size"] = entry['content'].get('size')
+    return release
+
+
+@timed("release_metadata")
+def get_release_data(operator, with_size=False):
     """
     Gets all the release versions for an operator package,
     eg: redhat-operators/codeready-workspaces, and returns a list of
-    dictionaries with release version, package name, and its digests.
+    dictionaries with release version, package name, and its digests,
+    and the size of the package if with_size is set.
     """
     releases = []
-    r = requests.get(_url(f"packages/{operator}"))
+    r = _get_metadata(_url(f"packages/{operator}"))
     if r.ok:
         for release in r.json():
-            releases.append(
-                {
-                    "package": release['package'],
-                    "digest": str(release['content']['digest']),
-                    "version": release['release'],
-                    "namespace": _pkg_namespace(release['package'])
-                }
-            )
+            releases.append(_release_from_entry(release, with_size))
+    else:
+        logging.warning(f"Failed to get the releases of {operator}, skipping it. HTTP Error: {r.status_code}")
     return releases
 
 
-def curated(package, version):
+def enumerate_releases(namespaces, release_filter=None, workers=DEFAULT_DOWNLOAD_WORKERS,
+                       queue_size=DEFAULT_QUEUE_SIZE, with_size=False):
+    """
+    Lazily yields the releases of every package in the namespaces, in
+    order, or only those release_filter selects.  Release metadata is
+    fetched by a pool of workers that runs at most about queue_size
+    packages ahead of the consumer, so the first release is available as
+    soon as its package's metadata is, and memory use does not grow with
+    the size of the registry.
+    """
+    def packages():
+        for namespace in namespaces:
+            for package in list_operators(namespace) or []:
+                if release_filter is None or release_filter.package(package):
+                    yield package
+
+    fetch = functools.partial(get_release_data, with_size=with_size)
+    for releases in run_pipeline(packages(), [(fetch, workers)], queue_size):
+        if release_filter is not None:
+            releases = release_filter.releases(releases)
+        yield from releases
+
+
+def _export_package(package, mirror, release_filter=None):
+    """
+    Downloads the packages of the releases of a package that
+    release_filter selects into the mirror, and stores the listing of
+    those that downloaded.  Returns the number of releases exported.
+    """
+    url = _url(f"packages/{package}")
+    r = _get_metadata(url)
+    if not r.ok:
+        logging.warning(f"Failed to get the releases of {package}, skipping it. HTTP Error: {r.status_code}")
+        return 0
+
+    entries = r.json()
+    releases = [_release_from_entry(entry, with_size=True) for entry in entries]
+    if release_filter is not None:
+        releases = release_filter.releases(releases)
+    versions = set()
+    for release in releases:
+        try:
+            get_package_release(release, True, blobs=mirror.blobs).close()
+        except (requests.exceptions.RequestException, DigestMismatchError) as err:
+            logging.error(f"Failed to download {package} version {release['version']}, leaving it out: {err}")
+        else:
+            versions.add(release['version'])
+
+    mirror.put(url, json.dumps([e for e in entries if e['release'] in versions]).encode())
+    return len(versions)
+
+
+def export_mirror(mirror, namespaces, release_filter=None, workers=DEFAULT_DOWNLOAD_WORKERS,
+                  queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Snapshots the packages of the namespaces that release_filter selects
+    into a RegistryMirror: the namespace listings, release listings and
+    packages.  Packages already in the mirror are not downloaded again.
+    A release listing is only stored once all its packages are, so an
+    interrupted export never leaves a listing without its packages.
+    Returns the number of releases exported.
+    """
+    def packages():
+        for namespace in namespaces:
+            url = _url(f"packages?namespace={namespace}")
+            r = _get_metadata(url)
+            if not r.ok:
+                logging.warning(f"Failed to list the operators in {namespace}, skipping the namespace. HTTP Error: {r.status_code}")
+                continue
+            entries = [
+                e for e in r.json()
+                if release_filter is None or release_filter.package(str(e['name']))
+            ]
+            mirror.put(url, json.dumps(entries).encode())
+            for entry in entries:
+                yield str(entry['name'])
+
+    export = functools.partial(_export_package, mirror=mirror, release_filter=release_filter)
+    return sum(run_pipeline(packages(), [(export, workers)], queue_size))
+
+
+class CuratedIndex:
+    """
+    An in-memory index of the (package, version, digest) releases already
+    present in the curated namespaces.  It is loaded once at startup and
+    kept up to date as releases are pushed, so checking whether a release
+    is already curated does not need a request to Quay.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._digests = {}
+
+    def add(self, package, version, digest=None):
+        """
+        Records a release as present in its curated namespace.
+        """
+        with self._lock:
+            self._digests[(package, version)] = digest
+
+    def digest(self, package, version):
+        """
+        Returns the digest of a curated release, or None if it is unknown.
+        """
+        with self._lock:
+            return self._digests.get((package, version))
+
+    def load(self, namespaces, workers=DEFAULT_DOWNLOAD_WORKERS, include=None):
+        """
+        Loads every release from the given curated namespaces, or only of
+        the packages include returns True for.
+        """
+        for namespace in namespaces:
+            logging.info(f"Indexing curated releases in {namespace}")
+            packages = list_operators(namespace) or []
+            if include is not None:
+                packages = [p for p in packages if include(p)]
+            stages = [(get_release_data, workers)]
+            for releases in run_pipeline(packages, stages):
+                for release in releases:
+                    self.add(release['package'], release['version'], release['digest'])
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._digests
+
+    def __len__(self):
+        with self._lock:
+            return len(self._digests)
+
+
+class ReleaseManifest:
+    """
+    A record of the (package, version, digest, outcome) of every release
+    processed by previous runs, persisted as JSON between runs.
+
+    Releases whose digest is unchanged and whose outcome is final -- they
+    are already curated, or they failed validation under the current
+    policy -- do not need to be processed again.  Releases that passed but
+    were not pushed, or could not be downloaded, are retried.
+    """
+    FINAL_OUTCOMES = frozenset(["curated", "failed"])
+
+    def __init__(self, path=DEFAULT_MANIFEST, policy=None):
+        self.path = Path(path)
+        self.policy = policy
+        self.unchanged = 0
+        self._lock = threading.Lock()
+        self._releases = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                self._releases = json.load(f).get('releases', {})
+
+    def outcome(self, release):
+        """
+        Returns the recorded outcome of a release, or None if the release
+        is new or its digest has changed.
+        """
+        with self._lock:
+            entry = self._releases.get(release['package'], {}).get(release['version'])
+        if entry is None or entry['digest'] != release['digest']:
+            return None
+        # A policy change may let a previously failed release pass
+        if entry['outcome'] == "failed" and entry.get('policy') != self.policy:
+            return None
+        return entry['outcome']
+
+    def changed(self, releases):
+        """
+        Yields only the releases that are new, changed, or were not
+        finished by a previous run.  The number skipped is kept in
+        self.unchanged.
+        """
+        self.unchanged = 0
+        for release in releases:
+            if self.outcome(release) in self.FINAL_OUTCOMES:
+                self.unchanged += 1
+                continue
+            yield release
+        logging.info(f"Skipped {self.unchanged} releases unchanged since the last run")
+
+    def record(self, release, outcome):
+        """
+        Records the outcome of processing a release.
+        """
+        with self._lock:
+            self._releases.setdefault(release['package'], {})[release['version']] = {
+                "digest": release['digest'],
+                "outcome": outcome,
+                "policy": self.policy
+            }
+
+    def save(self):
+        """
+        Atomically writes the manifest to disk.
+        """
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(f".{self.path.name}.tmp")
+        with self._lock, open(tmp, 'w') as f:
+            json.dump({"releases": self._releases}, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.path)
+
+
+class CheckpointJournal:
+    """
+    An append-only record of the stages each release has completed during
+    a run -- downloaded, validated, pushed, made visible, and done with its
+    outcome -- so that a run that dies part way through can be resumed
+    without redoing finished work.
+
+    Every record is one JSON line, written with a single write and synced
+    to disk before the stage counts as done, so a crash can at worst leave
+    the last line torn; torn lines are ignored when the journal is read
+    back.  Records are keyed by package, version and digest, so a release
+    that has changed since is processed from scratch, and validation
+    results recorded under another policy are ignored.
+    """
+    def __init__(self, path=DEFAULT_JOURNAL, resume=False, policy=None):
+        self.path = Path(path)
+        self.policy = policy
+        self._lock = threading.Lock()
+        self._stages = {}
+        torn = False
+        if resume and self.path.exists():
+            torn = self._load()
+        elif self.path.exists() and self.path.stat().st_size:
+            logging.warning(f"Discarding the journal of an interrupted run in {self.path}, pass --resume to resume it")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.path, 'ab' if resume else 'wb')
+        if torn:
+            # Start the next record on a line of its own
+            self._file.write(b"\n")
+
+    @staticmethod
+    def _key(release):
+        return release['package'], release['version'], release['digest']
+
+    def _load(self):
+        """
+        Reads back the journal of an interrupted run, returning whether its
+        last line was torn.
+        """
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        for line in data.splitlines():
+            try:
+                record = json.loads(line)
+                key = self._key(record)
+                stage = record.pop('stage')
+            except (ValueError, KeyError, TypeError):
+                logging.warning(f"Ignoring a torn record in {self.path}")
+                continue
+            if stage == "validated" and record.get('policy') != self.policy:
+                continue
+            self._stages.setdefault(key, {})[stage] = record
+        return bool(data) and not data.endswith(b"\n")
+
+    def get(self, release, stage):
+        """
+        Returns the record of a stage the release completed, or None.
+        """
+        with self._lock:
+            return self._stages.get(self._key(release), {}).get(stage)
+
+    def record(self, release, stage, **data):
+        """
+        Durably records that the release completed a stage.
+        """
+        record = dict(data, package=release['package'], version=release['version'],
+                      digest=release['digest'], stage=stage)
+        if stage == "validated":
+            record['policy'] = self.policy
+        line = (json.dumps(record) + "\n").encode()
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            record.pop('stage')
+            self._stages.setdefault(self._key(release), {})[stage] = record
+
+    def replay(self, manifest):
+        """
+        Records the outcome of every release the interrupted run finished
+        in the release manifest, returning how many there were.
+        """
+        with self._lock:
+            done = [stages['done'] for stages in self._stages.values() if 'done' in stages]
+        for record in done:
+            manifest.record(record, record['outcome'])
+        return len(done)
+
+    def unfinished(self, releases):
+        """
+        Yields only the releases the interrupted run did not finish.
+        """
+        finished = 0
+        for release in releases:
+            done = self.get(release, "done")
+            if done is not None and done['outcome'] in ReleaseManifest.FINAL_OUTCOMES:
+                finished += 1
+                continue
+            yield release
+        logging.info(f"Skipped {finished} releases finished by the interrupted run")
+
+    def close(self):
+        """Closes the journal."""
+        with self._lock:
+            self._file.close()
+
+    def remove(self):
+        """
+        Deletes the journal once the run has finished and everything in it
+        has been saved to the release manifest.
+        """
+        self.close()
+        self.path.unlink()
+
+
+def curated(package, version, index=None):
     """
     Check for the package in the curated namespace, and return the result.
+    Uses the curated index if one is provided, otherwise asks Quay.
     """
+    if index is not None:
+        return (package, version) in index
+
     curated = [i for i in get_release_data(package) if version in i.values()]
 
     return curated
 
 
+@timed("visibility")
 def set_repo_visibility(namespace, package_shortname, oauth_token, public=True,):
     '''Set the visibility of the specified app registry in Quay.'''
     # NEEDS TEST
-    s = requests.sessions.Session()
-
     visibility = "public" if public else "private"
 
     logging.info(f"Setting visibility of {namespace}/{package_shortname} to {'public' if public else 'private'}")
 
     try:
-        r = s.post(
+        # Setting visibility is idempotent, so it is safe to retry
+        r = QUAY.post(
             _repo_url(f"repository/{namespace}/{package_shortname}/changevisibility"),
             json={"visibility": visibility},
-            headers=_quay_headers(f"Bearer {oauth_token}")
+            headers=_quay_headers(f"Bearer {oauth_token}"),
+            idempotent=True
         )
         r.raise_for_status()
+        return True
     except requests.exceptions.HTTPError as errh:
         logging.error(f"Failed to set visibility of {namespace}/{package_shortname}. HTTP Error: {errh}")
     except requests.exceptions.ConnectionError as errc:
@@ -136,85 +1892,200 @@ def set_repo_visibility(namespace, package_shortname, oauth_token, public=True,)
     except requests.exceptions.Timeout as errt:
         logging.error(f"Failed to set visibility of {namespace}/{package_shortname}. Timeout Error: {errt}")
 
+    return False
+
+
+def list_repositories(namespace, oauth_token):
+    '''
+    List the app registry repositories in a quay namespace, following
+    pagination.  Returns None if the repositories could not be listed.
+    '''
+    repositories = []
+    params = {"namespace": namespace, "repo_kind": "application"}
+
+    while True:
+        try:
+            r = QUAY.get(
+                _repo_url("repository"),
+                params=params,
+                headers=_quay_headers(f"Bearer {oauth_token}")
+            )
+        except requests.exceptions.RequestException as err:
+            logging.error(f"Failed to list repositories in {namespace}: {err}")
+            return None
+        if not r.ok:
+            logging.error(f"Failed to list repositories in {namespace}. HTTP Error: {r.status_code}")
+            return None
+
+        page = r.json()
+        repositories += page.get('repositories', [])
+        if not page.get('next_page'):
+            return repositories
+        params = dict(params, next_page=page['next_page'])
 
-def get_package_release(release, use_cache):
+
+class RepositoryIndex:
     """
-    Downloads the tarball package for the release.
+    The visibility of every repository in the curated namespaces, listed
+    once at startup and updated as visibility is changed during the run, so
+    that changevisibility is only called for repositories that are new or
+    still private.  Repositories in a namespace that could not be listed
+    are assumed to need their visibility set.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._namespaces = set()
+        self._public = {}
+
+    def load(self, namespaces, oauth_token):
+        """
+        Lists the repositories and their visibility in each namespace.
+        """
+        for namespace in namespaces:
+            logging.info(f"Listing repositories in {namespace}")
+            repositories = list_repositories(namespace, oauth_token)
+            if repositories is None:
+                continue
+            with self._lock:
+                self._namespaces.add(namespace)
+                for repo in repositories:
+                    self._public[(namespace, repo['name'])] = bool(repo.get('is_public'))
+
+    def set_public(self, namespace, name, public=True):
+        """
+        Records the visibility of a repository.
+        """
+        with self._lock:
+            self._public[(namespace, name)] = public
+
+    def needs_visibility(self, namespace, name):
+        """
+        Returns true unless the repository is known to be public already.
+        """
+        with self._lock:
+            if namespace not in self._namespaces:
+                return True
+            return not self._public.get((namespace, name), False)
+
+
+@timed("blob_download")
+def get_package_release(release, use_cache, blobs=None):
+    """
+    Downloads the tarball package for the release into the blob cache, or
+    into blobs if given, verifying it against its digest, and returns it
+    opened for reading.  Cached blobs are only reused if use_cache is set.
     """
-    # NEEDS TEST
     package = release['package']
-    version = release['version']
     digest = release['digest']
+    blobs = blobs or BLOBS
 
-    outfile = Path(f"{package}/{version}/{_pkg_shortname(package)}.tar.gz")
+    blob = blobs.open(digest) if use_cache else None
 
-    if use_cache and Path.exists(outfile):
+    if blob is None and MIRROR is not None:
+        raise MissingFromMirrorError(f"{package} sha256 {digest} is not in the mirror")
+    if blob is None:
+        r = QUAY.get(
+            _url(f"packages/{package}/blobs/sha256/{digest}"),
+            stream=True
+        )
+        try:
+            r.raise_for_status()
+            blob = blobs.put(digest, r.iter_content(DOWNLOAD_CHUNK_SIZE))
+            METRICS.add_bytes("download", os.fstat(blob.fileno()).st_size)
+        finally:
+            r.close()
+
+    return blob
+
+
+@contextlib.contextmanager
+def open_package_release(release, use_cache):
+    """
+    Opens the tarball package for the release as a stream.  Cached blobs are
+    read from disk when use_cache is set; otherwise the package is streamed
+    straight from Quay without being written to disk.
+    """
+    blob = BLOBS.open(release['digest']) if use_cache else None
+    if blob is not None:
+        with blob:
+            yield blob
         return
+    if MIRROR is not None:
+        raise MissingFromMirrorError(f"{release['package']} sha256 {release['digest']} is not in the mirror")
 
-    r = requests.get(
-        _url(f"packages/{package}/blobs/sha256/{digest}"),
+    r = QUAY.get(
+        _url(f"packages/{release['package']}/blobs/sha256/{release['digest']}"),
         stream=True
     )
-
-    outfile.parent.mkdir(parents=True, exist_ok=True)
-
     try:
-        with open(outfile, 'wb') as f:
-            shutil.copyfileobj(r.raw, f)
+        r.raise_for_status()
+        r.raw.decode_content = True
+        yield r.raw
     finally:
-        del r
+        METRICS.add_bytes("download", r.raw.tell())
+        r.close()
 
 
-def check_package_in_allow_list(package):
+def check_package_in_allow_list(package, policy=None):
     """
     Returns true if the packaged has been listed in the allow list,
     regardless of other heuristics.  Also returns the test name.
     """
     logging.debug("Checking if package is in the allow list")
     test_name = 'Package is in allowed list'
-    if package in ALLOWED_PACKAGES:
+    if (policy or current_policy()).is_allowed(package):
         return test_name, True
 
     return test_name, False
 
 
-def check_package_in_deny_list(package):
+def check_package_in_deny_list(package, policy=None):
     """
     Returns true if the packaged has been listed in the denly list,
     regardless of other heuristics.  Also returns the test name.
     """
     logging.debug("Checking if package is in the deny list")
     test_name = 'Package is in denied list'
-    if package in DENIED_PACKAGES:
+    if (policy or current_policy()).is_denied(package):
         return test_name, True
 
     return test_name, False
 
 
+@timed("bundle_extraction")
 def extract_bundle_from_tar_file(operator_tarfile):
     """
-    Extracts the bundle.yaml file from the tar object provides.
+    Extracts the bundle.yaml file from the tar object provides, which may be
+    a path or a binary stream.  The tarball is read as a stream and reading
+    stops at the first bundle.yaml, so the rest of it is never decompressed.
     Returns the bundle.yaml object, test name, and result.
     """
     logging.debug("Extracting bundle.yaml from tarfile")
 
     test_name = 'bundle.yaml must be present'
-    with tarfile.open(operator_tarfile) as t:
-        try:
-            bundle_file = t.extractfile(
-                [i for i in t if Path(i.name).name == "bundle.yaml"][0]
-            ).read()
-            result = True
-        except IndexError:
-            bundle_file = None
-            result = False
-        except TypeError:
-            bundle_file = None
-            result = False
+    if isinstance(operator_tarfile, (str, Path)):
+        with open(operator_tarfile, 'rb') as f:
+            return extract_bundle_from_tar_file(f)
+
+    bundle_file = None
+    result = False
+    try:
+        with tarfile.open(fileobj=operator_tarfile, mode="r|gz") as t:
+            for member in t:
+                if Path(member.name).name != "bundle.yaml":
+                    continue
+                extracted = t.extractfile(member)
+                if extracted is not None:
+                    bundle_file = extracted.read()
+                    result = True
+                break
+    except (tarfile.TarError, EOFError, OSError) as err:
+        logging.debug(f"Unable to read tarfile: {err}")
 
     return bundle_file, test_name, result
 
 
+@timed("yaml_parsing")
 def load_yaml_from_bundle_object(bundle_yaml_obj):
     """
     Loads the yaml from the bundle object and returns a failure if
@@ -224,7 +2095,7 @@ def load_yaml_from_bundle_object(bundle_yaml_obj):
 
     test_name = 'bundle.yaml must be parsable'
     try:
-        bundle_yaml = yaml.safe_load(bundle_yaml_obj)
+        bundle_yaml = yaml_load(bundle_yaml_obj)
     except yaml.YAMLError:
         bundle_yaml = None
         result = False
@@ -234,6 +2105,7 @@ def load_yaml_from_bundle_object(bundle_yaml_obj):
     return bundle_yaml, test_name, result
 
 
+@timed("yaml_parsing")
 def get_entry_from_bundle(bundle_yaml, entry):
     """
     Tests whether or not a particular entry is contained in the bundle.yaml,
@@ -243,7 +2115,7 @@ def get_entry_from_bundle(bundle_yaml, entry):
 
     test_name = f"bundle must have a {entry} object"
     try:
-        data = yaml.safe_load(bundle_yaml['data'][entry])
+        data = yaml_load(bundle_yaml['data'][entry])
     except yaml.YAMLError:
         data = None
         result = False
@@ -256,83 +2128,120 @@ def get_entry_from_bundle(bundle_yaml, entry):
     return data, test_name, result
 
 
-def validate_csv(package, version, csv):
+@timed("csv_validation")
+def validate_csv(package, version, csv, policy=None):
     """
-    Checks csv for prohibited clusterPermissions,
-    multi-namespace install mode, and security context constraints.
+    Checks csv against every rule in CSV_RULES: prohibited clusterPermissions,
+    multi-namespace install mode, and security context constraints.  The
+    compiled policy is looked up unless one is passed in.
     """
-
-    # Aggregates CSV sub-tests, returns dict of results
-    # test_name =
-    # return [X], test_name, result
-
-    #check_csv_for_clusterpermissions()
-    #check_csv_for_securitycontextconstraints()
-    #check_csv_for_multinamespace_installmode()
-
-    tests = {}
-    # Cluster Permissions aren't allowed
-    cpKey = "CSV must not include clusterPermissions"
-    tests[cpKey] = True
-    if 'clusterPermissions' in csv['spec']['install']['spec']:
-        logging.info(f"[FAIL] {package} version {version} requires clusterPermissions")
-        tests[cpKey] = False
-    # Using SCCs isn't allowed
-    sccKey = "CSV must not grant SecurityContextConstraints permissions"
-    tests[sccKey] = True
-    if 'permissions' in csv['spec']['install']['spec']:
-        for rules in csv['spec']['install']['spec']['permissions']:
-            for i in rules['rules']:
-                if ("security.openshift.io" in i['apiGroups'] and
-                        "use" in i['verbs'] and
-                        "securitycontextconstraints" in i['resources']):
-                    logging.info(f"[FAIL] {package} version {version} requires security context constraints")
-                    tests[sccKey] = False
-    # installMode == MultiNamespace is not allowed
-    multiNsKey = "CSV must not require MultiNamespace installMode"
-    tests[multiNsKey] = True
-    for im in csv['spec']['installModes']:
-        if im['type'] == "MultiNamespace" and im['supported'] is True:
-            logging.info(f"[FAIL] {package} version {version} supports multi-namespace install mode")
-            tests[multiNsKey] = False
+    policy = policy or current_policy()
+    tests = policy.evaluate(csv)
+    for name, passed in tests.items():
+        if not passed:
+            logging.info(f"[FAIL] {package} version {version} {policy.reasons[name]}")
 
     result = bool(all(tests.values()))
     return result, tests
 
 
+@timed("bundle_regeneration")
 def regenerate_bundle_yaml(bundle_yaml, packages,
                            customResourceDefinitions, csvsByChannel):
     """
     Regenerates the bundle yaml with curated CSV data
     """
     csvs = []
+    csvNames = set()
     # For every channel, carry over the curated CSVs, and reset the 'replaces' field for the last one
     for channel in csvsByChannel:
         channelCSVs = csvsByChannel[channel]
 
         channelCSVs[-1]['spec'].pop('replaces', None)
-        csvs += channelCSVs
+        # Channels that share history share CSVs, only carry each one over once
+        for csv in channelCSVs:
+            if csv['metadata']['name'] not in csvNames:
+                csvNames.add(csv['metadata']['name'])
+                csvs.append(csv)
 
     # Override CSVs in the original bundle, default to pipe delimited valus to support longer fields
-    bundle_yaml['data']['clusterServiceVersions'] = yaml.dump(csvs, default_style='|')
-    bundle_yaml['data']['customResourceDefinitions'] = yaml.dump(customResourceDefinitions, default_style='|')
-    bundle_yaml['data']['packages'] = yaml.dump(packages, default_style='|')
+    bundle_yaml['data']['clusterServiceVersions'] = yaml_dump(csvs, default_style='|')
+    bundle_yaml['data']['customResourceDefinitions'] = yaml_dump(customResourceDefinitions, default_style='|')
+    bundle_yaml['data']['packages'] = yaml_dump(packages, default_style='|')
 
     return bundle_yaml
 
 
-def validate_bundle(release):
+def build_bundle_tarball(bundle_yaml):
+    """
+    Returns a tar.gz package holding bundle_yaml, as bytes, as the
+    bundle.yaml at its root.  The package is built in memory, and the tar
+    and gzip metadata are fixed, so the same bundle always gives the same
+    bytes and digest.
+    """
+    buf = BytesIO()
+    with gzip.GzipFile(filename="", mode="wb", fileobj=buf, mtime=0) as gz:
+        with tarfile.open(fileobj=gz, mode="w", format=tarfile.USTAR_FORMAT) as tar:
+            info = tarfile.TarInfo("bundle.yaml")
+            info.size = len(bundle_yaml)
+            info.mode = 0o644
+            info.mtime = 0
+            tar.addfile(info, BytesIO(bundle_yaml))
+    return buf.getvalue()
+
+
+def _walk_replaces_chain(graph, latestCSVname, package, version, channel_name, tests):
+    """
+    Follows the 'replaces' chain of a channel back from its latest CSV,
+    which has passed curation, recording a test for each older CSV.
+    Returns the CSVs that passed, newest first, and whether a rejected CSV
+    truncated the chain.
+    """
+    goodCSVs = [graph.get(latestCSVname)]
+
+    seen = {latestCSVname}
+    replacesCSVName = graph.replaces(latestCSVname)
+    while replacesCSVName:
+        # A CSV that (indirectly) replaces itself can never be installed
+        if replacesCSVName in seen:
+            logging.info(f"[FAIL] {package} version {version} CSV {replacesCSVName} is part of a replaces cycle")
+            tests[f"CSV {replacesCSVName} replaces chain must not contain a cycle"] = False
+            break
+        seen.add(replacesCSVName)
+
+        # Older CSVs are often pruned from a bundle, the channel simply ends here
+        nextCSV = graph.get(replacesCSVName)
+        if nextCSV is None:
+            logging.debug(f"CSV {replacesCSVName} is not in the bundle, channel {channel_name} ends here")
+            break
+
+        nextCSVPass, _ = graph.validate(replacesCSVName, package, version)
+
+        if not nextCSVPass:
+            # If this CSV does not pass curation, we truncate the bundle
+            # But we do not reject the entire bundle
+            nextCSVRejKey = f"CSV {replacesCSVName} rejected, truncating bundle here"
+            tests[nextCSVRejKey] = True
+            return goodCSVs, True
+
+        goodCSVs.append(nextCSV)
+        nextCSVPassKey = f"CSV {replacesCSVName} curated"
+        tests[nextCSVPassKey] = True
+        # Refresh the pointer to the 'replaces' tag
+        replacesCSVName = graph.replaces(replacesCSVName)
+
+    return goodCSVs, False
+
+
+@timed("validation")
+def validate_bundle(release, use_cache=False):
     """
     Review the bundle.yaml for a package to check that it is
-    appropriate for use with OSD.
+    appropriate for use with OSD.  The package is streamed from the blob
+    cache if use_cache is set, or from Quay otherwise.
     """
     package = release['package']
     version = release['version']
-    shortname = _pkg_shortname(package)
-
-    tar_file = Path(f"{package}/{version}/{shortname}.tar.gz")
-    bundle_filename = "bundle.yaml"
-    bundle_file = Path(f"./{package}/{version}/{bundle_filename}")
 
     tests = {}
     csvsByChannel = {}
@@ -340,8 +2249,11 @@ def validate_bundle(release):
 
     logging.info(f"Validating bundle for {package} version {version}")
 
+    # The policy is compiled once and used for every check of this bundle
+    policy = current_policy()
+
     # Any package in our allow list is valid, regardless of other heuristics
-    name, result = check_package_in_allow_list(package)
+    name, result = check_package_in_allow_list(package, policy)
 
     if result:
         logging.info(f"[PASS] {package} (all versions) {name}")
@@ -350,7 +2262,7 @@ def validate_bundle(release):
         return True, tests
 
     # Any package in our deny is invalid; skip further processing
-    name, result = check_package_in_deny_list(package)
+    name, result = check_package_in_deny_list(package, policy)
 
     if result:
         logging.info(f"[FAIL] {package} (all versions) {name}")
@@ -361,7 +2273,8 @@ def validate_bundle(release):
         return False, tests
 
     # Extract the bundle.yaml file
-    bundle_yaml_object, name, result = extract_bundle_from_tar_file(tar_file)
+    with open_package_release(release, use_cache) as package_stream:
+        bundle_yaml_object, name, result = extract_bundle_from_tar_file(package_stream)
 
     tests[name] = result
     logging.info(f"{'[PASS]' if result else '[FAIL]'} {package} (all versions) {name}")
@@ -408,19 +2321,28 @@ def validate_bundle(release):
     # The rest of this function needs to be refactord into
     # smaller, simpler functions, and have tests added
 
+    # Index the CSVs by name once, rather than scanning the list for
+    # every step of every channel's 'replaces' chain
+    graph = CSVGraph(csvs, policy)
+
     # The package might have multiple channels, loop thru them
     logging.debug("Validating individual channels in package")
     for channel in packages[0]['channels']:
         logging.debug(f"Validating channel {channel['name']}")
 
-        goodCSVs = []
         channelKey = f"Curated channel: {channel['name']}"
         tests[channelKey] = False
         latestCSVname = channel['currentCSV']
-        latestCSV = get_csv_from_name(csvs, latestCSVname)
-        valPass, latestCSVTests = validate_csv(package,
-                                               version,
-                                               latestCSV)
+        latestCSV = graph.get(latestCSVname)
+
+        # The channel points at a CSV that isn't there, we reject the entire bundle
+        if latestCSV is None:
+            logging.info(f"[FAIL] {package} version {version} channel {channel['name']} is missing CSV {latestCSVname}")
+            tests[f"CSV {latestCSVname} must be present in the bundle"] = False
+            return False, tests
+
+        valPass, latestCSVTests = graph.validate(latestCSVname, package, version)
+        latestCSVTests = dict(latestCSVTests)
         latestCSVkey = "The most recent CSV must pass curation"
         latestCSVTests[latestCSVkey] = True
 
@@ -432,26 +2354,9 @@ def validate_bundle(release):
         latestBundleKey = f"CSV {latestCSV['metadata']['name']} curated"
         tests[latestBundleKey] = True
 
-        goodCSVs.append(latestCSV)
-
-        replacesCSVName = latestCSV['spec'].get('replaces')
-        while replacesCSVName:
-            nextCSV = get_csv_from_name(csvs, replacesCSVName)
-            nextCSVPass, _ = validate_csv(package, version, nextCSV)
-
-            if nextCSVPass:
-                goodCSVs.append(nextCSV)
-                nextCSVPassKey = f"CSV {replacesCSVName} curated"
-                tests[nextCSVPassKey] = True
-                # Refresh the pointer to the 'replaces' tag
-                replacesCSVName = nextCSV.get('replaces')
-            else:
-                # If this CSV does not pass curation, we truncate the bundle
-                # But we do not reject the entire bundle
-                nextCSVRejKey = f"CSV {replacesCSVName} rejected, truncating bundle here"
-                tests[nextCSVRejKey] = True
-                truncatedBundle = True
-                break
+        goodCSVs, truncated = _walk_replaces_chain(
+            graph, latestCSVname, package, version, channel['name'], tests)
+        truncatedBundle = truncatedBundle or truncated
 
         csvsByChannel[channel['name']] = goodCSVs
         tests[channelKey] = True
@@ -464,12 +2369,10 @@ def validate_bundle(release):
             customResourceDefinitions,
             csvsByChannel)
 
-        with open(bundle_file, 'w') as outfile:
-            yaml.dump(replacement_bundle_yaml, outfile, default_style='|')
-
-        # Create tar.gz file, forcing the bundle file to sit in the root of the tar vol
-        with tarfile.open(tar_file, "w:gz") as tar_handle:
-            tar_handle.add(bundle_file, arcname=bundle_filename)
+        # The package is rebuilt in memory and stored apart from the
+        # downloaded one, which is left as it was published
+        REGENERATED.put(release, build_bundle_tarball(
+            yaml_dump(replacement_bundle_yaml, default_style='|').encode()))
 
     # If all of the values for dict "tests" are True, return True
     # otherwise return False (operator validation has failed!)
@@ -477,43 +2380,157 @@ def validate_bundle(release):
     return result, tests
 
 
-def get_csv_from_name(csvs, csvName):
+class CSVGraph:
     """
-    Returns a cluster service version from the csv name
+    The cluster service versions of a bundle indexed by name, with the
+    'replaces' edges between them.  Validation results are memoized per
+    CSV, so channels that share history only validate each CSV once.
     """
-    for csv in csvs:
-        if csv['metadata']['name'] == csvName:
-            return csv
-
-    return None
-
+    def __init__(self, csvs, policy=None):
+        self._csvs = {}
+        self._results = {}
+        self._policy = policy
+        for csv in csvs or []:
+            # Like a linear scan, the first CSV with a given name wins
+            self._csvs.setdefault(csv['metadata']['name'], csv)
+
+    def get(self, name):
+        """
+        Returns the CSV with the given name, or None if it is not in the bundle.
+        """
+        return self._csvs.get(name)
+
+    def replaces(self, name):
+        """
+        Returns the name of the CSV that the named CSV replaces, if any.
+        """
+        return self._csvs[name]['spec'].get('replaces')
+
+    def validate(self, name, package, version):
+        """
+        Validates the named CSV, reusing the result if it was already
+        validated for another channel.
+        """
+        if name not in self._results:
+            self._results[name] = validate_csv(package, version, self._csvs[name], self._policy)
+        return self._results[name]
+
+    def __len__(self):
+        return len(self._csvs)
+
+
+class PushBody:
+    """
+    A streaming JSON request body of the form {"blob": <base64 package>, ...}.
 
-def push_package(release, target_namespace, oauth_token, basic_token):
+    The package is read and base64 encoded in chunks as the body is read, so
+    memory use does not depend on the size of the package.  The length is
+    known up front, so the request is sent with a Content-Length rather than
+    chunked.  The package is hashed as it is read.
+    """
+    def __init__(self, package_file, fields, chunk_size=PUSH_CHUNK_SIZE):
+        start = package_file.tell()
+        package_file.seek(0, os.SEEK_END)
+        size = package_file.tell() - start
+        package_file.seek(start)
+
+        prefix = b'{"blob": "'
+        suffix = ('", ' + json.dumps(fields)[1:]).encode()
+        self._length = len(prefix) + 4 * ((size + 2) // 3) + len(suffix)
+        self._sha256 = hashlib.sha256()
+        # Whole base64 quanta only, so chunks can simply be concatenated
+        self._chunks = self._generate(package_file, chunk_size - chunk_size % 3 or 3,
+                                      prefix, suffix)
+        self._buffer = b""
+        self._offset = 0
+
+    def _generate(self, package_file, chunk_size, prefix, suffix):
+        yield prefix
+        leftover = b""
+        while True:
+            data = package_file.read(chunk_size)
+            if not data:
+                break
+            self._sha256.update(data)
+            data = leftover + data
+            cut = len(data) - len(data) % 3
+            leftover = data[cut:]
+            yield base64.b64encode(data[:cut])
+        if leftover:
+            yield base64.b64encode(leftover)
+        yield suffix
+
+    def __len__(self):
+        return self._length
+
+    def read(self, size=-1):
+        """
+        Returns up to size bytes of the body, or the rest of it.
+        """
+        parts = []
+        while size != 0:
+            if self._offset >= len(self._buffer):
+                self._buffer = next(self._chunks, b"")
+                self._offset = 0
+                if not self._buffer:
+                    break
+            end = len(self._buffer)
+            if size > 0:
+                end = min(end, self._offset + size)
+                size -= end - self._offset
+            parts.append(self._buffer[self._offset:end])
+            self._offset = end
+        return b"".join(parts)
+
+    def hexdigest(self):
+        """
+        Returns the sha256 digest of the package, reading any of it that
+        has not been sent.
+        """
+        for _ in self._chunks:
+            pass
+        return self._sha256.hexdigest()
+
+
+@timed("push")
+def push_package(release, target_namespace, oauth_token, basic_token,
+                 package_file, repositories=None, journal=None):
     '''
-    Push package on disk into a target quay namespace.
+    Push a package into a target quay namespace.  The package is read from
+    package_file, an open binary file such as a cached blob or a package
+    regenerated from a truncated bundle, starting at its current position.
+    If the package is present afterwards and its repository is new or
+    private, the repository is made public.  Returns the sha256 digest of
+    the package if it is present in the target namespace afterwards, or
+    None if the upload failed.
     '''
     package = release['package']
     version = release['version']
 
     shortname = _pkg_shortname(package)
-
-    with open(f"{package}/{version}/{shortname}.tar.gz", 'rb') as f:
-        encoded_bundle = base64.b64encode(f.read())
-        encoded_bundle_str = encoded_bundle.decode()
-
-    payload = {
-        "blob": encoded_bundle_str,
-        "release": version,
-        "media_type": "helm"
-    }
+    pushed_digest = None
 
     try:
         logging.info(f"Pushing {shortname} to the {target_namespace} namespace")
-        r = requests.post(_url(f"packages/{target_namespace}/{shortname}"), data=json.dumps(payload), headers=_quay_headers(basic_token))
+        # A push is not idempotent, but one that was throttled never
+        # happened and is safe to send again once Quay allows it
+        start = package_file.tell()
+        for attempt in range(QUAY.retries + 1):
+            # The payload is streamed, the package is never held in memory
+            package_file.seek(start)
+            payload = PushBody(package_file, {"release": version, "media_type": "helm"})
+            r = QUAY.post(_url(f"packages/{target_namespace}/{shortname}"), data=payload, headers=_quay_headers(basic_token))
+            METRICS.add_bytes("upload", len(payload))
+            if r.status_code != 429 or attempt == QUAY.retries:
+                break
+            logging.warning(f"Quay is throttling uploads, retrying {shortname} for {target_namespace}")
+            time.sleep(QUAY.backoff_delay(attempt))
         r.raise_for_status()
+        pushed_digest = payload.hexdigest()
     except requests.exceptions.HTTPError as errh:
         if r.status_code == 409:
             logging.info(f"Version {version} of {shortname} is already present in {target_namespace} namespace. Skipping...")
+            pushed_digest = payload.hexdigest()
         else:
             logging.error(f"Failed to upload {shortname} to {target_namespace} namespace. HTTP Error: {errh}")
     except requests.exceptions.ConnectionError as errc:
@@ -521,44 +2538,544 @@ def push_package(release, target_namespace, oauth_token, basic_token):
     except requests.exceptions.Timeout as errt:
         logging.error(f"Failed to upload {shortname} to {target_namespace} namespace. Timeout Error: {errt}")
 
+    if pushed_digest:
+        if journal is not None:
+            journal.record(release, "pushed", pushed_digest=pushed_digest)
+        make_repository_public(release, target_namespace, oauth_token,
+                               repositories=repositories, journal=journal)
+
+    return pushed_digest
+
+
+def make_repository_public(release, target_namespace, oauth_token,
+                           repositories=None, journal=None):
+    '''
+    Makes the curated repository of a pushed release public, unless it is
+    known to be public already.  Returns whether the repository is public.
+    '''
+    shortname = _pkg_shortname(release['package'])
+
     # This is a new package namespace, make it publicly visible
-    set_repo_visibility(target_namespace, shortname, oauth_token)
+    if repositories is None or repositories.needs_visibility(target_namespace, shortname):
+        if not set_repo_visibility(target_namespace, shortname, oauth_token):
+            return False
+        if repositories is not None:
+            repositories.set_public(target_namespace, shortname)
+
+    if journal is not None:
+        journal.record(release, "visible")
+    return True
+
+
+# Wraps an exception raised by a pipeline stage so that it can travel
+# downstream and be re-raised in order by the consumer
+_StageError = collections.namedtuple("_StageError", ["exc"])
+
+
+_STOP = object()
+
+
+def run_pipeline(items, stages, queue_size=DEFAULT_QUEUE_SIZE):
+    """
+    Runs every item through a list of (function, workers) stages.
+
+    Each stage has its own pool of worker threads, and stages are connected
+    by bounded queues so only a limited number of items are in flight at
+    once.  The output of the last stage is yielded in the same order as
+    the input items, so results match a serial run.  If a stage raises,
+    the exception is re-raised when that item's turn comes up.
+
+    No more items are in flight than fill every queue and keep every worker
+    busy, so a slow item holds back at most that many finished ones while
+    they wait for their turn.
+    """
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    in_flight = threading.Semaphore(queue_size * len(queues) + sum(w for _, w in stages))
+
+    def feed():
+        seq = 0
+        try:
+            for item in items:
+                in_flight.acquire()
+                queues[0].put((seq, item))
+                seq += 1
+        except Exception as exc:  # pylint: disable=broad-except
+            queues[0].put((seq, _StageError(exc)))
+        for _ in range(stages[0][1]):
+            queues[0].put(_STOP)
+
+    def work(index, function, state):
+        inq, outq = queues[index], queues[index + 1]
+        while True:
+            job = inq.get()
+            if job is _STOP:
+                break
+            seq, item = job
+            if not isinstance(item, _StageError):
+                try:
+                    item = function(item)
+                except Exception as exc:  # pylint: disable=broad-except
+                    item = _StageError(exc)
+            outq.put((seq, item))
+
+        # The last worker out signals the next stage to shut down
+        with state['lock']:
+            state['running'] -= 1
+            last = state['running'] == 0
+        if last:
+            downstream = stages[index + 1][1] if index + 1 < len(stages) else 1
+            for _ in range(downstream):
+                outq.put(_STOP)
+
+    threads = [threading.Thread(target=feed, daemon=True)]
+    for index, (function, workers) in enumerate(stages):
+        state = {'lock': threading.Lock(), 'running': workers}
+        threads += [
+            threading.Thread(target=work, args=(index, function, state), daemon=True)
+            for _ in range(workers)
+        ]
+    for t in threads:
+        t.start()
+
+    # Results can finish out of order; hold them until their turn comes up
+    pending = {}
+    next_seq = 0
+    while True:
+        job = queues[-1].get()
+        if job is _STOP:
+            break
+        seq, item = job
+        pending[seq] = item
+        while next_seq in pending:
+            item = pending.pop(next_seq)
+            next_seq += 1
+            if isinstance(item, _StageError):
+                raise item.exc
+            in_flight.release()
+            yield item
+
+
+def needs_package(release, index=None, results=None, skip_push=False, journal=None):
+    """
+    Returns whether processing a release needs its package: to validate
+    it, unless it was already curated or has a reusable journaled or stored
+    result, or to push it if it may pass.
+    """
+    curated_package = f"{_pkg_curated_namespace(release['package'])}/{_pkg_shortname(release['package'])}"
+    if index is not None and (curated_package, release['version']) in index:
+        return False
+
+    policy = current_policy()
+    if policy.is_listed(release['package']):
+        # Listed packages are judged without reading them
+        return not skip_push and policy.is_allowed(release['package'])
+
+    journaled = journal.get(release, "validated") if journal is not None else None
+    if journaled is not None and _result_reusable(release, journaled['tests']):
+        return not skip_push and journaled['passed']
+
+    cached = results.get(release) if results is not None else None
+    if cached is None or not _result_reusable(release, cached[1]):
+        return True
+    return not skip_push and cached[0]
+
+
+def download_stage(release, use_cache, journal=None, index=None, results=None,
+                   skip_push=False):
+    """
+    Pipeline stage: downloads the release tarball into the blob cache, if
+    it is needed and may be pushed, so that validating and pushing it read
+    the one local copy.  When nothing is pushed the package is left for
+    validation to stream, so it is never written to disk.  Cached blobs are only reused if use_cache is set, or if the journal
+    records that an interrupted run downloaded and verified the blob.
+    Failed or corrupt downloads are recorded on the release so that it
+    fails validation instead of stopping the run.
+    """
+    if skip_push or not needs_package(release, index, results, skip_push, journal):
+        return release
+    downloaded = journal.get(release, "downloaded") if journal is not None else None
+    try:
+        get_package_release(release, use_cache or downloaded is not None).close()
+    except (requests.exceptions.RequestException, DigestMismatchError) as err:
+        logging.error(f"Failed to download {release['package']} version {release['version']}: {err}")
+        return dict(release, download_error=str(err))
+    if journal is not None and downloaded is None:
+        journal.record(release, "downloaded")
+    return release
+
+
+def validate_stage(release, index=None, results=None, use_cache=False, journal=None):
+    """
+    Pipeline stage: checks whether the release was already curated and, if
+    not, validates its bundle, reusing a result from an interrupted run's
+    journal or from the validation cache when there is one.  Returns the
+    release and its summary entry.
+    """
+    shortname = _pkg_shortname(release['package'])
+    version = release['version']
+    curated_namespace = _pkg_curated_namespace(release['package'])
+    curated_package_name = f"{curated_namespace}/{shortname}"
+
+    # Don't try to push if the specific package version is already
+    # present in our target namespace
+    if curated(curated_package_name, version, index):
+        curated_message = (
+            f"{curated_package_name} "
+            f"version {version} already curated"
+        )
+        logging.info(f"[SKIP] {curated_message}")
+        return release, {
+            release['package']: {
+                "version": version,
+                "pass": True,
+                "skipped": True,
+                "tests": {curated_message: True}
+            }
+        }
+
+    cached = results.get(release) if results is not None else None
+    journaled = journal.get(release, "validated") if journal is not None else None
+
+    # Truncated bundles are validated again if the package regenerated from
+    # them is gone, as that regenerates it
+    if journaled is not None and _result_reusable(release, journaled['tests']):
+        logging.info(f"Using the journaled validation result for {release['package']} version {version}")
+        passed, info = journaled['passed'], journaled['tests']
+    elif cached is not None and _result_reusable(release, cached[1]):
+        logging.info(f"Using cached validation result for {release['package']} version {version}")
+        passed, info = cached
+    elif 'download_error' not in release:
+        try:
+            passed, info = validate_bundle(release, use_cache)
+        except requests.exceptions.RequestException as err:
+            logging.error(f"Failed to download {release['package']} version {version}: {err}")
+            release = dict(release, download_error=str(err))
+        else:
+            if results is not None:
+                results.put(release, passed, info)
+            if journal is not None:
+                journal.record(release, "validated", passed=passed, tests=info)
+
+    if 'download_error' in release:
+        passed, info = False, {"Package must download and match its digest": False}
+    logging.info(
+        f"{release['package']}:{version} "
+        f"{'PASSED' if passed else 'FAILED'} "
+        f"validation for use with OSD"
+    )
+    return release, {
+        release['package']: {
+            "version": version,
+            "pass": passed,
+            "skipped": False,
+            "tests": info
+        }
+    }
+
+
+def _finish_interrupted_push(release, curated_namespace, oauth_token,
+                             repositories=None, journal=None):
+    """
+    Returns the digest an interrupted run pushed a release as, according
+    to the journal, or None if it was not pushed.  The interrupted run may
+    have died before making the repository public, so that is done if it
+    was not.
+    """
+    pushed = journal.get(release, "pushed") if journal is not None else None
+    if pushed is None:
+        return None
+
+    logging.info(f"{release['package']} version {release['version']} was pushed by the interrupted run")
+    if journal.get(release, "visible") is None:
+        make_repository_public(release, curated_namespace, oauth_token,
+                               repositories=repositories, journal=journal)
+    return pushed['pushed_digest']
+
+
+def push_stage(validated, skip_push, oauth_token, basic_token, index=None,
+               use_cache=False, repositories=None, journal=None):
+    """
+    Pipeline stage: pushes releases that passed validation to their curated
+    namespace, and records them in the curated index.  Truncated bundles
+    are pushed from the package regenerated during validation, any other
+    package is pushed from the blob cache.  Releases an interrupted run
+    already pushed are only made public if that was not done.  Returns the
+    release, its summary entry, and the outcome to record in the release
+    manifest.
+    """
+    release, entry = validated
+    info = entry[release['package']]
+    curated_namespace = _pkg_curated_namespace(release['package'])
+
+    if 'download_error' in release:
+        return release, entry, "error"
+    if info['skipped']:
+        if not skip_push:
+            _finish_interrupted_push(release, curated_namespace, oauth_token,
+                                     repositories, journal)
+        return release, entry, "curated"
+    if not info['pass']:
+        return release, entry, "failed"
+
+    outcome = "passed"
+    if not skip_push:
+        digest = _finish_interrupted_push(release, curated_namespace, oauth_token,
+                                          repositories, journal)
+        if digest is None:
+            if _bundle_truncated(info['tests']):
+                package_file = REGENERATED.open(release)
+                if package_file is None:
+                    logging.error(f"The package regenerated from {release['package']} version {release['version']} is missing")
+                    return release, entry, "error"
+            else:
+                try:
+                    package_file = get_package_release(release, use_cache)
+                except (requests.exceptions.RequestException, DigestMismatchError) as err:
+                    logging.error(f"Failed to download {release['package']} version {release['version']}: {err}")
+                    return release, entry, "error"
+            with package_file:
+                digest = push_package(
+                    release,
+                    curated_namespace,
+                    oauth_token,
+                    basic_token,
+                    package_file=package_file,
+                    repositories=repositories,
+                    journal=journal,
+                )
+        if digest:
+            outcome = "curated"
+            if index is not None:
+                index.add(
+                    f"{curated_namespace}/{_pkg_shortname(release['package'])}",
+                    release['version'],
+                    digest
+                )
+
+    return release, entry, outcome
+
+
+class SummaryCounts:
+    """
+    Running pass, skip and fail counts over summary entries.
+    """
+    def __init__(self):
+        self.total = 0
+        self.passed = 0
+        self.skipped = 0
+
+    def add(self, entry):
+        """
+        Counts a summary entry.
+        """
+        self.total += 1
+        self.passed += any(info["pass"] for info in entry.values())
+        self.skipped += any(info["skipped"] for info in entry.values())
+
+    @property
+    def failed(self):
+        """Number of entries that failed curation."""
+        return self.total - self.passed
+
+
+class ResultSink:
+    """
+    Writes summary entries out as they are produced: one JSON object per
+    line to a JSONL file, and optionally one testsuite per release to a
+    JUnit XML file.  Each line is flushed as it is written, so a crash
+    only loses the releases still in flight.
+    """
+    def __init__(self, path, junit_path=None):
+        self.counts = SummaryCounts()
+        self._lock = threading.Lock()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._jsonl = open(path, 'w')
+        self._junit = None
+        if junit_path:
+            Path(junit_path).parent.mkdir(parents=True, exist_ok=True)
+            self._junit = open(junit_path, 'w')
+            self._junit.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+
+    def write(self, entry):
+        """
+        Writes a summary entry.
+        """
+        with self._lock:
+            self.counts.add(entry)
+            self._jsonl.write(json.dumps(entry) + "\n")
+            self._jsonl.flush()
+            if self._junit:
+                self._junit.write(_junit_testsuite(entry))
+                self._junit.flush()
+
+    def close(self):
+        """
+        Closes the output files.
+        """
+        with self._lock:
+            self._jsonl.close()
+            if self._junit:
+                self._junit.write('</testsuites>\n')
+                self._junit.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _junit_testsuite(entry):
+    """
+    Renders a summary entry as a JUnit XML testsuite.
+    """
+    lines = []
+    for operator, info in entry.items():
+        failures = 0 if info["skipped"] else sum(not r for r in info["tests"].values())
+        suite_name = f"{operator} version {info['version']}"
+        lines.append(
+            f'  <testsuite name={quoteattr(suite_name)}'
+            f' tests="{len(info["tests"])}" failures="{failures}"'
+            f' skipped="{len(info["tests"]) if info["skipped"] else 0}">'
+        )
+        for name, result in info["tests"].items():
+            lines.append(f'    <testcase classname={quoteattr(operator)} name={quoteattr(name)}>')
+            if info["skipped"]:
+                lines.append('      <skipped/>')
+            elif not result:
+                lines.append(f'      <failure message={quoteattr(name)}/>')
+            lines.append('    </testcase>')
+        lines.append('  </testsuite>')
+    return "\n".join(lines) + "\n"
+
+
+def read_results(path):
+    """
+    Yields the summary entries from a JSONL results file, one at a time.
+    """
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def merge_results(paths):
+    """
+    Yields the summary entries of several results files, such as those of
+    the shards of a sharded run.  A release reported by more than one file
+    is only yielded the first time, so it is not counted twice.
+    """
+    seen = set()
+    for path in paths:
+        for entry in read_results(path):
+            for package, info in entry.items():
+                key = (package, info['version'])
+                if key in seen:
+                    logging.warning(f"{package} version {info['version']} is in more than one results file, ignoring the one in {path}")
+                    break
+                seen.add(key)
+            else:
+                yield entry
+
+
+def plan_run(releases, index=None, results=None, use_cache=False, skip_push=False):
+    """
+    Tallies what processing the pending releases would cost, without
+    downloading, validating or pushing anything: the releases already
+    curated, the package downloads and bytes, and at most how many pushes
+    and visibility changes.  Releases need their size, see
+    get_release_data.
+    """
+    plan = collections.Counter()
+    policy = current_policy()
+
+    for release in releases:
+        plan['releases'] += 1
+        shortname = _pkg_shortname(release['package'])
+        curated_package = f"{_pkg_curated_namespace(release['package'])}/{shortname}"
+        if index is not None and (curated_package, release['version']) in index:
+            plan['already_curated'] += 1
+            continue
+
+        size = release.get('size') or 0
+        listed = policy.is_listed(release['package'])
+        cached = results.get(release) if results is not None and not listed else None
+        if cached is not None and _result_reusable(release, cached[1]):
+            plan['validation_cached'] += 1
+        may_push = not skip_push and not policy.is_denied(release['package'])
+
+        # Needed packages are downloaded once, unless the cache has them
+        downloads = int(needs_package(release, None, results, skip_push)
+                        and not (use_cache and BLOBS.path(release['digest']).exists()))
+        plan['downloads'] += downloads
+        plan['download_bytes'] += downloads * size
+
+        if may_push:
+            plan['pushes'] += 1
+            plan['upload_bytes'] += 4 * ((size + 2) // 3)
+
+    return plan
+
+
+def print_plan(plan, out=sys.stdout):
+    """
+    Prints the cost of a run, as tallied by plan_run.
+    """
+    out.write(
+        f"\nPlan\n"
+        f"----\n"
+        f"Releases to process: {plan['releases']}, of which"
+        f" {plan['already_curated']} are already curated and"
+        f" {plan['validation_cached']} have a cached validation result\n"
+        f"Releases unchanged since the last run: {plan['unchanged']}\n"
+        f"API calls made to plan: {plan['cnr_calls']} app registry,"
+        f" {plan['repository_calls']} repository\n"
+        f"The run would also need at most:\n"
+        f"  {plan['downloads']} package downloads ({plan['download_bytes']} bytes)\n"
+        f"  {plan['pushes']} pushes ({plan['upload_bytes']} bytes)\n"
+        f"  {plan['pushes']} visibility changes\n"
+    )
 
 
 def summarize(summary, out=sys.stdout):
-    """Summarize prints a summary of results for human readability."""
+    """
+    Summarize prints a summary of results for human readability.
+    The summary may be a list of entries, or an iterator over them (such as
+    read_results) which is rendered in a single pass without holding every
+    entry in memory.
+    """
 
-    if not isinstance(summary, list):
+    if not isinstance(summary, (list, collections.abc.Iterator)):
         raise TypeError()
-    if not summary:
-        raise IndexError()
 
+    entries = iter(summary)
+    first = next(entries, None)
+    if first is None:
+        raise IndexError()
 
-    report = []
+    counts = SummaryCounts()
 
-    passing_count = len([i for i in summary if {key:value for (key, value) in i.items() if value["pass"]}])
-    skipped_count = len([i for i in summary if {key:value for (key, value) in i.items() if value["skipped"]}])
-    for i in summary:
+    # Not as readable as printing, but prepping for unittesting
+    out.write(
+        "\nValidation Summary\n"
+        "------------------\n"
+    )
+    for i in itertools.chain([first], entries):
+        counts.add(i)
         for operator, info in i.items():
             operator_result = "[PASS]" if info["pass"] else "[FAIL]"
-            report.append(f"\n{operator_result} {operator} version {info['version']}")
+            out.write(f"\n{operator_result} {operator} version {info['version']}\n")
             for name, result in info["tests"].items():
                 test_result = (
                     "[SKIP]" if info["skipped"] else (
                         "[PASS]" if result else "[FAIL]"))
-                report.append(f"    {test_result} {name}")
+                out.write(f"    {test_result} {name}\n")
 
-    report_str = "\n".join(report)
-
-    # Not as readable as printing, but prepping for unittesting
     out.write(
-        f"\nValidation Summary\n"
-        f"------------------\n"
-        f"{report_str}\n"
         f"\n"
-        f"Passed Curation: {passing_count - skipped_count}\n"
-        f"Already Curated: {skipped_count}\n"
-        f"Failed Curation: {len(summary) - passing_count}\n"
+        f"Passed Curation: {counts.passed - counts.skipped}\n"
+        f"Already Curated: {counts.skipped}\n"
+        f"Failed Curation: {counts.failed}\n"
     )
 
 
@@ -567,6 +3084,10 @@ if __name__ == "__main__":
     PARSER = argparse.ArgumentParser(
         description=("""A tool for curating application registry for
             use with OSDv4."""))
+    PARSER.add_argument(
+        '--quay-url', action="store",
+        default=QUAY_URL, dest="quay_url", type=str,
+        help="Base url of the Quay instance to curate")
     PARSER.add_argument(
         '--app-token', action="store",
         dest="basic_token", type=str,
@@ -579,10 +3100,150 @@ if __name__ == "__main__":
         '--cache', action="store_true",
         default=False, dest="use_cache",
         help="Use local cache of operator packages")
+    PARSER.add_argument(
+        '--cache-dir', action="store",
+        default=DEFAULT_CACHE_DIR, dest="cache_dir", type=str,
+        help="Directory of the content-addressed package blob cache")
+    PARSER.add_argument(
+        '--cache-max-size', action="store",
+        default=DEFAULT_CACHE_MAX_SIZE_MB, dest="cache_max_size", type=int,
+        help="Maximum size of the package blob cache, in MiB")
+    PARSER.add_argument(
+        '--regenerated-dir', action="store",
+        default=DEFAULT_REGENERATED_DIR, dest="regenerated_dir", type=str,
+        help="Directory of the packages regenerated from truncated bundles")
     PARSER.add_argument(
         '--skip-push', action="store_true",
         default=False, dest="skip_push",
         help="Skip pushing validated packages to Quay.io")
+    PARSER.add_argument(
+        '--manifest', action="store",
+        default=None, dest="manifest", type=str,
+        help=f"Release manifest used to skip releases unchanged since the last run (default: {DEFAULT_MANIFEST})")
+    PARSER.add_argument(
+        '--validation-cache', action="store",
+        default=DEFAULT_VALIDATION_CACHE, dest="validation_cache", type=str,
+        help="SQLite database of validation results, keyed by bundle digest and policy")
+    PARSER.add_argument(
+        '--no-validation-cache', action="store_true",
+        default=False, dest="no_validation_cache",
+        help="Validate every bundle, ignoring stored validation results")
+    PARSER.add_argument(
+        '--metadata-cache', action="store",
+        default=DEFAULT_METADATA_CACHE, dest="metadata_cache", type=str,
+        help="SQLite database of registry metadata responses, revalidated with conditional requests")
+    PARSER.add_argument(
+        '--metadata-ttl', action="store",
+        default=DEFAULT_METADATA_TTL, dest="metadata_ttl", type=float,
+        help="Seconds to reuse metadata responses that have no ETag or Last-Modified")
+    PARSER.add_argument(
+        '--no-metadata-cache', action="store_true",
+        default=False, dest="no_metadata_cache",
+        help="Download all registry metadata, ignoring stored responses")
+    PARSER.add_argument(
+        '--full', action="store_true",
+        default=False, dest="full",
+        help="Process every release, even if unchanged since the last run")
+    PARSER.add_argument(
+        '--journal', action="store",
+        default=None, dest="journal", type=str,
+        help=f"Where to journal the progress of each release during the run (default: {DEFAULT_JOURNAL})")
+    PARSER.add_argument(
+        '--resume', action="store_true",
+        default=False, dest="resume",
+        help="Resume an interrupted run from its journal, skipping finished work")
+    PARSER.add_argument(
+        '--download-workers', action="store",
+        default=DEFAULT_DOWNLOAD_WORKERS, dest="download_workers", type=int,
+        help="Number of concurrent package downloads")
+    PARSER.add_argument(
+        '--validate-workers', action="store",
+        default=DEFAULT_VALIDATE_WORKERS, dest="validate_workers", type=int,
+        help="Number of concurrent bundle validations")
+    PARSER.add_argument(
+        '--push-workers', action="store",
+        default=DEFAULT_PUSH_WORKERS, dest="push_workers", type=int,
+        help="Number of concurrent pushes to Quay.io")
+    PARSER.add_argument(
+        '--queue-size', action="store",
+        default=DEFAULT_QUEUE_SIZE, dest="queue_size", type=int,
+        help="Maximum number of releases waiting between pipeline stages")
+    PARSER.add_argument(
+        '--pool-size', action="store",
+        default=DEFAULT_POOL_MAXSIZE, dest="pool_size", type=int,
+        help="Maximum number of pooled keep-alive connections to Quay.io per host")
+    PARSER.add_argument(
+        '--pool-connections', action="store",
+        default=DEFAULT_POOL_CONNECTIONS, dest="pool_connections", type=int,
+        help="Number of hosts to keep a connection pool for")
+    PARSER.add_argument(
+        '--retries', action="store",
+        default=DEFAULT_RETRIES, dest="retries", type=int,
+        help="Number of times to retry idempotent requests to Quay.io")
+    PARSER.add_argument(
+        '--rate-limit', action="store",
+        default=DEFAULT_CNR_RATE_LIMIT, dest="rate_limit", type=float,
+        help="Requests per second to send to the Quay.io app registry API, 0 for no limit")
+    PARSER.add_argument(
+        '--repository-rate-limit', action="store",
+        default=DEFAULT_REPOSITORY_RATE_LIMIT, dest="repository_rate_limit", type=float,
+        help="Requests per second to send to the Quay.io repository API, 0 for no limit")
+    PARSER.add_argument(
+        '--results', action="store",
+        default=None, dest="results", type=str,
+        help=f"JSONL file that results are written to as they are produced (default: {DEFAULT_RESULTS})")
+    PARSER.add_argument(
+        '--junit', action="store",
+        default=None, dest="junit", type=str,
+        help="Also write results to this JUnit XML file")
+    PARSER.add_argument(
+        '--namespace', action="append",
+        default=None, dest="namespaces", choices=SOURCE_NAMESPACES,
+        help="Only curate this source namespace, may be repeated")
+    PARSER.add_argument(
+        '--package', action="append",
+        default=None, dest="packages", metavar="GLOB",
+        help="Only curate packages matching this glob, such as 'community-operators/foo*', may be repeated")
+    PARSER.add_argument(
+        '--versions', action="store",
+        default=None, dest="versions", type=parse_version_range, metavar="RANGE",
+        help="Only curate releases in this version range, such as '>=1.2.0,<2.0.0'")
+    PARSER.add_argument(
+        '--latest-only', action="store_true",
+        default=False, dest="latest_only",
+        help="Only curate the latest selected release of each package")
+    PARSER.add_argument(
+        '--plan', action="store_true",
+        default=False, dest="plan",
+        help="Print the API calls and bytes the run would need, without running it")
+    PARSER.add_argument(
+        '--shard', action="store",
+        default=None, dest="shard", type=parse_shard,
+        help="Only curate the i'th of N shards of the packages, given as i/N counting from 0")
+    PARSER.add_argument(
+        '--merge', action="store", nargs='+',
+        default=None, dest="merge", metavar="RESULTS",
+        help="Merge the results files of a sharded run into --results and summarize them, then exit")
+    PARSER.add_argument(
+        '--export-mirror', action="store",
+        default=None, dest="export_mirror", metavar="DIR",
+        help="Snapshot the selected packages of the source namespaces into a mirror directory, then exit")
+    PARSER.add_argument(
+        '--from-mirror', action="store",
+        default=None, dest="from_mirror", metavar="DIR",
+        help="Validate the releases in a mirror directory without network access. Nothing is pushed")
+    PARSER.add_argument(
+        '--profile', action="store",
+        default=None, dest="profile", metavar="DIR",
+        help="Profile validation, regeneration and Quay calls, and write pstats files and collapsed stacks to DIR")
+    PARSER.add_argument(
+        '--profile-top', action="store",
+        default=DEFAULT_PROFILE_TOP, dest="profile_top", type=int,
+        help="Number of slowest releases to report with --profile")
+    PARSER.add_argument(
+        '--metrics-file', action="store",
+        default=None, dest="metrics_file", type=str,
+        help="Record per-stage metrics and write them to this Prometheus textfile")
     PARSER.add_argument(
         '--log-level', action="store",
         default='info', dest="log_level", type=str,
@@ -590,70 +3251,206 @@ if __name__ == "__main__":
         help="Set verbosity of logs printed to STDOUT.")
     ARGS = PARSER.parse_args()
 
+    for workers in ('download_workers', 'validate_workers', 'push_workers',
+                    'queue_size', 'pool_size', 'pool_connections'):
+        if getattr(ARGS, workers) < 1:
+            PARSER.error(f"--{workers.replace('_', '-')} must be at least 1")
+    for limit in ('retries', 'rate_limit', 'repository_rate_limit'):
+        if getattr(ARGS, limit) < 0:
+            PARSER.error(f"--{limit.replace('_', '-')} must not be negative")
+    if ARGS.export_mirror and ARGS.from_mirror:
+        PARSER.error("--export-mirror and --from-mirror cannot be combined")
+
+    # Each shard has its own default files, so that shards can share a
+    # working directory
+    for name, default in (('results', DEFAULT_RESULTS), ('manifest', DEFAULT_MANIFEST),
+                          ('journal', DEFAULT_JOURNAL)):
+        if getattr(ARGS, name) is None:
+            setattr(ARGS, name, shard_path(default, ARGS.shard))
+
     LOGLEVEL = getattr(logging, ARGS.log_level.upper(), None)
     logging.basicConfig(level=LOGLEVEL)
+    logging.debug(f"Using the {YAML_BACKEND} yaml parser")
+
+    if ARGS.merge:
+        if os.path.abspath(ARGS.results) in map(os.path.abspath, ARGS.merge):
+            PARSER.error("--results must not be one of the files being merged")
+        with ResultSink(ARGS.results, ARGS.junit) as SINK:
+            for entry in merge_results(ARGS.merge):
+                SINK.write(entry)
+        if SINK.counts.total:
+            summarize(read_results(ARGS.results))
+        else:
+            logging.info("No results to merge.")
+        sys.exit(0)
+
+    METRICS.enabled = ARGS.metrics_file is not None
+    PROFILER.enabled = ARGS.profile is not None
+    if PROFILER.enabled:
+        PROFILER.start()
+
+    QUAY_URL = ARGS.quay_url.rstrip('/')
+    QUAY = QuayClient(pool_connections=ARGS.pool_connections,
+                      pool_maxsize=ARGS.pool_size, retries=ARGS.retries,
+                      cnr_rate_limit=ARGS.rate_limit,
+                      repository_rate_limit=ARGS.repository_rate_limit)
+    BLOBS = BlobCache(ARGS.cache_dir, ARGS.cache_max_size * 1024 * 1024)
+    REGENERATED = RegeneratedStore(ARGS.regenerated_dir)
+    if ARGS.from_mirror:
+        # Everything is read from the mirror, and its results can be pushed
+        # by an online run, which reuses them from the validation cache
+        MIRROR = RegistryMirror(ARGS.from_mirror)
+        BLOBS = MIRROR.blobs
+        ARGS.use_cache = True
+        ARGS.skip_push = True
+        logging.info(f"Curating the mirror in {ARGS.from_mirror}, nothing will be pushed.")
+    elif not ARGS.no_metadata_cache:
+        METADATA = MetadataCache(ARGS.metadata_cache, ARGS.metadata_ttl)
+
+    FILTER = ReleaseFilter(
+        namespaces=ARGS.namespaces,
+        packages=ARGS.packages,
+        versions=ARGS.versions,
+        latest_only=ARGS.latest_only,
+        shard=ARGS.shard
+    )
+    NAMESPACES = [ns for ns in SOURCE_NAMESPACES if FILTER.namespace(ns)]
+    if ARGS.shard:
+        logging.info(f"Curating shard {ARGS.shard[0]}/{ARGS.shard[1]}")
 
-    SUMMARY = []
+    if ARGS.export_mirror:
+        logging.info(f"Exporting the source namespaces to {ARGS.export_mirror}.")
+        try:
+            EXPORTED = export_mirror(
+                RegistryMirror(ARGS.export_mirror), NAMESPACES, FILTER,
+                workers=ARGS.download_workers,
+                queue_size=ARGS.queue_size
+            )
+        finally:
+            if METADATA is not None:
+                METADATA.close()
+            if ARGS.metrics_file:
+                METRICS.write_textfile(ARGS.metrics_file)
+        logging.info(f"Exported {EXPORTED} releases.")
+        sys.exit(0)
+
+    CURATED = CuratedIndex()
+    if MIRROR is None:
+        logging.info("Indexing releases in curated namespaces.")
+        CURATED.load(
+            [_pkg_curated_namespace(ns) for ns in NAMESPACES],
+            workers=ARGS.download_workers,
+            include=lambda p: FILTER.package(_pkg_source_package(p))
+        )
 
-    logging.info("Downloading operator data from source namespaces.")
-    OPERATORS = [list_operators(ns) for ns in SOURCE_NAMESPACES]
+    RESULTS = None
+    if not ARGS.no_validation_cache:
+        RESULTS = ValidationCache(ARGS.validation_cache)
 
-    logging.info("Downloading release data for operators.")
-    RELEASES = [
-        get_release_data(o) for o in list(itertools.chain(*OPERATORS))
-    ]
+    MANIFEST = ReleaseManifest(ARGS.manifest, policy=policy_fingerprint())
 
-    logging.info("Beginning validation testing of release versions.")
-    for release in list(itertools.chain(*RELEASES)):
+    # Releases are listed as they are consumed, with metadata prefetched a
+    # bounded distance ahead, so processing starts with the first package
+    logging.info("Streaming release data for operators in the source namespaces.")
+    RELEASES = enumerate_releases(
+        NAMESPACES, FILTER,
+        workers=ARGS.download_workers,
+        queue_size=ARGS.queue_size,
+        with_size=ARGS.plan
+    )
 
-        shortname = _pkg_shortname(release['package'])
-        version = release['version']
-        namespace = _pkg_namespace(release['package'])
-        curated_namespace = _pkg_curated_namespace(release['package'])
-        curated_package_name = f"{curated_namespace}/{shortname}"
-
-        get_package_release(release, ARGS.use_cache)
-
-        # Don't try to push if the specific package version is already
-        # present in our target namespace
-        if curated(curated_package_name, version):
-            curated_message = (
-                f"{curated_package_name} "
-                f"version {version} already curated"
-            )
-            SUMMARY.append(
-                {
-                    release['package']: {
-                        "version": version,
-                        "pass": True,
-                        "skipped": True,
-                        "tests": {curated_message: True}
-                    }
-                }
-            )
-            logging.info(f"[SKIP] {curated_message}")
-        else:
-            passed, info = validate_bundle(release)
-            SUMMARY.append(
-                {release['package']: {
-                    "version": release['version'],
-                    "pass": passed,
-                    "skipped": False,
-                    "tests": info}
-                }
-            )
-            logging.info(
-                f"{release['package']}:{version} "
-                f"{'PASSED' if passed else 'FAILED'} "
-                f"validation for use with OSD"
-            )
+    if ARGS.plan:
+        PENDING = RELEASES
+        if not ARGS.full:
+            PENDING = MANIFEST.changed(PENDING)
+        PLAN = plan_run(PENDING, CURATED, RESULTS, ARGS.use_cache, ARGS.skip_push)
+        PLAN['unchanged'] = MANIFEST.unchanged
+        PLAN['cnr_calls'] = QUAY.limiters['cnr'].requests
+        PLAN['repository_calls'] = QUAY.limiters['repository'].requests
+        print_plan(PLAN)
+        sys.exit(0)
+
+    # A plan is a dry run, so work stored under other policies is only
+    # dropped once curation really starts
+    REGENERATED.prune()
+    if RESULTS is not None:
+        RESULTS.prune()
+
+    REPOSITORIES = RepositoryIndex()
+    if not ARGS.skip_push:
+        REPOSITORIES.load(
+            [_pkg_curated_namespace(ns) for ns in NAMESPACES],
+            ARGS.oauth_token
+        )
 
-            if passed and not ARGS.skip_push:
-                push_package(
-                    release,
-                    curated_namespace,
-                    ARGS.oauth_token,
-                    ARGS.basic_token,
-                )
+    JOURNAL = CheckpointJournal(ARGS.journal, resume=ARGS.resume, policy=policy_fingerprint())
+    if ARGS.resume:
+        logging.info(f"Resuming from {ARGS.journal}, {JOURNAL.replay(MANIFEST)} releases were finished.")
 
-    summarize(SUMMARY)
+    logging.info("Beginning validation testing of release versions.")
+    STAGES = [
+        (functools.partial(download_stage,
+                           use_cache=ARGS.use_cache,
+                           journal=JOURNAL,
+                           index=CURATED,
+                           results=RESULTS,
+                           skip_push=ARGS.skip_push),
+         ARGS.download_workers),
+        # The download stage has just stored the packages that may be
+        # pushed in the blob cache, so the later stages read them from
+        # there.  Without pushes, validation streams them from Quay.
+        (functools.partial(validate_stage,
+                           index=CURATED,
+                           results=RESULTS,
+                           use_cache=ARGS.use_cache or not ARGS.skip_push,
+                           journal=JOURNAL),
+         ARGS.validate_workers),
+        (functools.partial(push_stage,
+                           skip_push=ARGS.skip_push,
+                           oauth_token=ARGS.oauth_token,
+                           basic_token=ARGS.basic_token,
+                           index=CURATED,
+                           use_cache=True,
+                           repositories=REPOSITORIES,
+                           journal=JOURNAL),
+         ARGS.push_workers),
+    ]
+    if PROFILER.enabled:
+        STAGES = [(PROFILER.stage(stage), workers) for stage, workers in STAGES]
+    PENDING = RELEASES
+    if not ARGS.full:
+        PENDING = MANIFEST.changed(PENDING)
+    if ARGS.resume:
+        PENDING = JOURNAL.unfinished(PENDING)
+
+    SINK = ResultSink(ARGS.results, ARGS.junit)
+    try:
+        for release, entry, outcome in run_pipeline(PENDING, STAGES, ARGS.queue_size):
+            SINK.write(entry)
+            MANIFEST.record(release, outcome)
+            JOURNAL.record(release, "done", outcome=outcome)
+    finally:
+        SINK.close()
+        MANIFEST.save()
+        JOURNAL.close()
+        if RESULTS is not None:
+            RESULTS.close()
+        if METADATA is not None:
+            logging.info(f"Metadata cache: {METADATA.hits} fresh hits, {METADATA.revalidated} revalidated, {METADATA.misses} downloaded")
+            METADATA.close()
+        if ARGS.metrics_file:
+            METRICS.write_textfile(ARGS.metrics_file)
+        if PROFILER.enabled:
+            PROFILE = PROFILER.write(ARGS.profile)
+            if PROFILE is not None:
+                logging.info(f"Wrote profiles to {ARGS.profile}, collapsed stacks to {PROFILE}")
+
+    # Everything journaled is in the manifest now
+    JOURNAL.remove()
+
+    if SINK.counts.total:
+        summarize(read_results(ARGS.results))
+    else:
+        logging.info("No new or changed releases to curate.")
+    if PROFILER.enabled:
+        PROFILER.print_report(ARGS.profile_top)
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+A local stand-in for the parts of the Quay CNR and repository APIs that the
+curator uses, for load testing it without network access or touching real
+Quay:
+
+    GET  /cnr/api/v1/packages?namespace={namespace}
+    GET  /cnr/api/v1/packages/{namespace}/{package}
+    GET  /cnr/api/v1/packages/{namespace}/{package}/blobs/sha256/{digest}
+    POST /cnr/api/v1/packages/{namespace}/{package}
+    GET  /api/v1/repository?namespace={namespace}&repo_kind=application
+    POST /api/v1/repository/{namespace}/{package}/changevisibility
+
+The source namespaces are seeded with synthetic operators whose releases
+pass, fail, are truncated or have no bundle at all.  Pushed releases are
+kept in memory and listed back from the curated namespaces, so a second run
+against the same server sees what the first one curated.  Package and
+release listings carry an ETag, and are answered with a 304 when it is sent
+back in If-None-Match.  Latency, errors and 429 throttling can be injected,
+and every request is counted by endpoint and status:
+
+    ./fake_quay.py --operators 5000 --latency 0.01 --rate-limit 200
+"""
+
+import argparse
+import base64
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+import hashlib
+import json
+import random
+import sys
+import tarfile
+import threading
+import time
+from urllib.parse import parse_qs, urlsplit
+import yaml
+import bench_curator
+import curator
+
+
+# The share of seeded releases of each kind
+DEFAULT_MIX = {"pass": 0.7, "truncate": 0.1, "fail": 0.15, "nobundle": 0.05}
+
+DEFAULT_PAGE_SIZE = 100
+
+# Endpoints whose responses carry an ETag
+ETAG_ENDPOINTS = ("packages", "releases")
+
+
+def release_template(variant):
+    """
+    Returns the bundle.yaml of a release of the given kind, with __PACKAGE__
+    and __VERSION__ placeholders, or None for a release without a bundle.
+    """
+    if variant == "nobundle":
+        return None
+
+    # The rejected CSV's depth down the channel: the head fails the whole
+    # bundle, anything below it truncates the bundle there
+    reject_depth = {"pass": None, "truncate": 1, "fail": 0}[variant]
+    names = [f"__PACKAGE__.v__VERSION__-{i}" for i in range(3)]
+    csvs = [
+        bench_curator.synthetic_csv(
+            name,
+            replaces=names[i - 1] if i else None,
+            cluster_permissions=len(names) - 1 - i == reject_depth
+        )
+        for i, name in enumerate(names)
+    ]
+    packages = [{
+        "packageName": "__PACKAGE__",
+        "channels": [{"name": "stable", "currentCSV": names[-1]}]
+    }]
+    bundle = {"data": {
+        "clusterServiceVersions": yaml.dump(csvs, default_style='|'),
+        "customResourceDefinitions": yaml.dump(
+            [bench_curator.synthetic_crd(0, 1000)], default_style='|'),
+        "packages": yaml.dump(packages, default_style='|'),
+    }}
+    return yaml.dump(bundle, default_style='|')
+
+
+def release_tarball(template, shortname, version):
+    """
+    Returns the gzipped tarball of a release built from a template.
+    """
+    if template is None:
+        name, data = f"{shortname}/README", b"This package has no bundle.\n"
+    else:
+        name = f"{shortname}/bundle.yaml"
+        data = template.replace("__PACKAGE__", shortname).replace("__VERSION__", version).encode()
+
+    buf = BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz", compresslevel=1) as t:
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        t.addfile(info, BytesIO(data))
+    return buf.getvalue()
+
+
+class TokenBucket:
+    """
+    Allows rate requests a second on average, in bursts of up to burst.
+    """
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Takes a token, returning 0 if one was available or the number of
+        seconds until one will be.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+class FakeQuay:
+    """
+    An in-memory Quay served over HTTP from a background thread.
+
+    operators synthetic operators are spread across the namespaces, each
+    with releases releases.  latency seconds are added to every request, a
+    share error_rate of requests fail with a 503, and more than rate_limit
+    requests a second are answered with a 429 and a Retry-After header.
+    Unless etags is False, listings can be revalidated with If-None-Match.
+    """
+    def __init__(self, operators=1000, releases=2, namespaces=None,
+                 mix=None, latency=0.0, error_rate=0.0, rate_limit=None,
+                 burst=None, page_size=DEFAULT_PAGE_SIZE, etags=True, seed=0):
+        self.latency = latency
+        self.etags = etags
+        self.error_rate = error_rate
+        self.page_size = page_size
+        self.limiter = None
+        if rate_limit:
+            self.limiter = TokenBucket(rate_limit, burst or rate_limit)
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._packages = collections.defaultdict(dict)
+        self._blobs = {}
+        self._repositories = collections.defaultdict(dict)
+        self.requests = collections.Counter()
+        self.pushed = []
+        self._server = None
+        self._thread = None
+
+        self._seed(operators, releases, namespaces or curator.SOURCE_NAMESPACES, mix or DEFAULT_MIX)
+
+    def _seed(self, operators, releases, namespaces, mix):
+        templates = {variant: release_template(variant) for variant in mix}
+        variants = self._random.choices(list(mix), weights=list(mix.values()),
+                                        k=operators * releases)
+        for i in range(operators):
+            namespace = namespaces[i % len(namespaces)]
+            shortname = f"synthetic-{i:05d}"
+            for r in range(releases):
+                version = f"1.0.{r}"
+                blob = release_tarball(templates[variants[i * releases + r]], shortname, version)
+                self._add_release(f"{namespace}/{shortname}", version, blob)
+
+    def _add_release(self, package, version, blob):
+        digest = hashlib.sha256(blob).hexdigest()
+        self._packages[curator._pkg_namespace(package)].setdefault(package, {})[version] = digest
+        self._blobs[digest] = blob
+        return digest
+
+    def releases(self, namespace=None):
+        """
+        Returns the number of releases in a namespace, or in every namespace.
+        """
+        with self._lock:
+            return sum(
+                len(versions)
+                for ns, packages in self._packages.items()
+                if namespace in (None, ns)
+                for versions in packages.values()
+            )
+
+    def calls(self, endpoint=None):
+        """
+        Returns the number of requests made to an endpoint, or to all of them.
+        """
+        with self._lock:
+            return sum(n for (e, _), n in self.requests.items() if endpoint in (None, e))
+
+    def start(self, host="127.0.0.1", port=0):
+        """
+        Starts serving in a background thread and returns the base url.
+        """
+        self._server = _Server((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._server.quay = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.url
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        """
+        Stops serving.
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def route(self, method, path, query, body):
+        """
+        Returns the name of the endpoint a request is for, and a function
+        answering it with (status, headers, body).
+        """
+        parts = path.strip('/').split('/')
+
+        if parts[:4] == ["cnr", "api", "v1", "packages"]:
+            args = parts[4:]
+            if method == "GET" and not args:
+                return "packages", lambda: self._list_packages(query)
+            if method == "GET" and len(args) == 2:
+                return "releases", lambda: self._list_releases("/".join(args))
+            if method == "GET" and len(args) == 5 and args[2:4] == ["blobs", "sha256"]:
+                return "blob", lambda: self._blob(args[4])
+            if method == "POST" and len(args) == 2:
+                return "push", lambda: self._push("/".join(args), body)
+        elif parts[:3] == ["api", "v1", "repository"]:
+            args = parts[3:]
+            if method == "GET" and not args:
+                return "repositories", lambda: self._list_repositories(query)
+            if method == "POST" and len(args) == 3 and args[2] == "changevisibility":
+                return "changevisibility", lambda: self._change_visibility(args[0], args[1], body)
+
+        return "unknown", lambda: (404, {}, _json({"error": "Not found"}))
+
+    def _list_packages(self, query):
+        namespace = query.get("namespace", [""])[0]
+        with self._lock:
+            names = sorted(self._packages.get(namespace, {}))
+        return 200, {}, _json([{"name": name} for name in names])
+
+    def _list_releases(self, package):
+        with self._lock:
+            versions = self._packages.get(curator._pkg_namespace(package), {}).get(package)
+            if not versions:
+                return 404, {}, _json({"error": "Package not found"})
+            return 200, {}, _json([
+                {"package": package, "release": version,
+                 "content": {"digest": digest, "size": len(self._blobs[digest])}}
+                for version, digest in versions.items()
+            ])
+
+    def _blob(self, digest):
+        with self._lock:
+            blob = self._blobs.get(digest)
+        if blob is None:
+            return 404, {}, _json({"error": "Blob not found"})
+        return 200, {"Content-Type": "application/octet-stream"}, blob
+
+    def _push(self, package, body):
+        payload = json.loads(body)
+        version = payload["release"]
+        blob = base64.b64decode(payload["blob"])
+        namespace, shortname = package.split('/', 1)
+        with self._lock:
+            if version in self._packages[namespace].get(package, {}):
+                return 409, {}, _json({"error": "Package already exists"})
+            digest = self._add_release(package, version, blob)
+            self._repositories[namespace].setdefault(shortname, False)
+            self.pushed.append((package, version, digest))
+        return 201, {}, _json({"package": package, "release": version, "digest": digest})
+
+    def _list_repositories(self, query):
+        namespace = query.get("namespace", [""])[0]
+        start = int(query.get("next_page", ["0"])[0])
+        with self._lock:
+            names = sorted(self._repositories.get(namespace, {}))
+            page = [
+                {"namespace": namespace, "name": name,
+                 "is_public": self._repositories[namespace][name]}
+                for name in names[start:start + self.page_size]
+            ]
+        result = {"repositories": page}
+        if start + self.page_size < len(names):
+            result["next_page"] = str(start + self.page_size)
+        return 200, {}, _json(result)
+
+    def _change_visibility(self, namespace, shortname, body):
+        visibility = json.loads(body)["visibility"]
+        with self._lock:
+            if shortname not in self._repositories.get(namespace, {}):
+                return 404, {}, _json({"error": "Repository not found"})
+            self._repositories[namespace][shortname] = visibility == "public"
+        return 200, {}, _json({"success": True})
+
+    def is_public(self, namespace, shortname):
+        """
+        Returns whether a pushed repository is public.
+        """
+        with self._lock:
+            return self._repositories.get(namespace, {}).get(shortname, False)
+
+
+def _json(data):
+    return json.dumps(data).encode()
+
+
+class _Server(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        # Clients that are killed part way through a request are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections alive so the curator's pooled connections are reused
+    protocol_version = "HTTP/1.1"
+    # The headers and body are written separately, don't let Nagle's
+    # algorithm hold the body back waiting for an ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._respond("GET")
+
+    def do_POST(self):
+        self._respond("POST")
+
+    def _respond(self, method):
+        quay = self.server.quay
+        url = urlsplit(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if quay.latency:
+            time.sleep(quay.latency)
+
+        endpoint, answer = quay.route(method, url.path, parse_qs(url.query), body)
+        retry_after = quay.limiter.take() if quay.limiter else 0
+        if retry_after:
+            status, headers, data = 429, {"Retry-After": str(max(1, round(retry_after)))}, _json({"error": "Too many requests"})
+        elif quay.error_rate and quay._random.random() < quay.error_rate:
+            status, headers, data = 503, {}, _json({"error": "Service unavailable"})
+        else:
+            status, headers, data = answer()
+            if status == 200 and quay.etags and endpoint in ETAG_ENDPOINTS:
+                etag = f'"{hashlib.sha256(data).hexdigest()}"'
+                headers = dict(headers, ETag=etag)
+                if self.headers.get("If-None-Match") == etag:
+                    status, data = 304, b""
+
+        with quay._lock:
+            quay.requests[(endpoint, status)] += 1
+
+        self.send_response(status)
+        self.send_header("Content-Type", headers.get("Content-Type", "application/json"))
+        for name, value in headers.items():
+            if name != "Content-Type":
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+
+    PARSER = argparse.ArgumentParser(
+        description="Serve a local stand-in for the Quay APIs the curator uses.")
+    PARSER.add_argument(
+        '--host', action="store",
+        default="127.0.0.1", dest="host", type=str,
+        help="Address to listen on")
+    PARSER.add_argument(
+        '--port', action="store",
+        default=8080, dest="port", type=int,
+        help="Port to listen on")
+    PARSER.add_argument(
+        '--operators', action="store",
+        default=1000, dest="operators", type=int,
+        help="Number of synthetic operators to seed")
+    PARSER.add_argument(
+        '--releases', action="store",
+        default=2, dest="releases", type=int,
+        help="Number of releases of each operator")
+    PARSER.add_argument(
+        '--latency', action="store",
+        default=0.0, dest="latency", type=float,
+        help="Seconds of latency to add to every request")
+    PARSER.add_argument(
+        '--error-rate', action="store",
+        default=0.0, dest="error_rate", type=float,
+        help="Share of requests that fail with a 503")
+    PARSER.add_argument(
+        '--rate-limit', action="store",
+        default=None, dest="rate_limit", type=float,
+        help="Requests per second above which requests are throttled with a 429")
+    PARSER.add_argument(
+        '--burst', action="store",
+        default=None, dest="burst", type=float,
+        help="Requests allowed in a burst above the rate limit (default: the rate limit)")
+    PARSER.add_argument(
+        '--seed', action="store",
+        default=0, dest="seed", type=int,
+        help="Random seed for the release mix and injected errors")
+    PARSER.add_argument(
+        '--no-etags', action="store_false",
+        default=True, dest="etags",
+        help="Send listings without an ETag, so they cannot be revalidated")
+    ARGS = PARSER.parse_args()
+
+    QUAY = FakeQuay(
+        operators=ARGS.operators, releases=ARGS.releases,
+        latency=ARGS.latency, error_rate=ARGS.error_rate,
+        rate_limit=ARGS.rate_limit, burst=ARGS.burst, etags=ARGS.etags,
+        seed=ARGS.seed
+    )
+    print(f"Serving {QUAY.releases()} releases at {QUAY.start(ARGS.host, ARGS.port)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        QUAY.stop()
+        for (ENDPOINT, STATUS), COUNT in sorted(QUAY.requests.items()):
+            print(f"{ENDPOINT:20} {STATUS} {COUNT}")
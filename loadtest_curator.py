@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Load tests the curator end to end against a local stand-in for Quay.
+
+Seeds a fake_quay.FakeQuay with synthetic operators, runs the curator's
+full command line flow against it in a scratch directory, and reports the
+releases curated per second and the API calls made per release.  Any
+arguments after -- are passed on to the curator:
+
+    ./loadtest_curator.py --operators 2000 --latency 0.005 -- --download-workers 8
+
+With --runs, the curator is run repeatedly in the same directory against
+the same server, so the later runs show the cost of an incremental run.
+"""
+
+import argparse
+import collections
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import fake_quay
+
+
+CURATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "curator.py")
+
+
+def run_curator(url, workdir, args=(), log=None):
+    """
+    Runs the curator against the Quay at url in workdir, which is created
+    if it does not exist, and returns its exit code, the number of releases
+    it reported on, and the elapsed time.
+    """
+    os.makedirs(workdir, exist_ok=True)
+    results = os.path.join(workdir, "curator-results.jsonl")
+    if os.path.exists(results):
+        os.remove(results)
+
+    command = [
+        sys.executable, CURATOR,
+        "--quay-url", url,
+        "--app-token", "basic fake",
+        "--oauth-token", "fake",
+        "--results", results,
+    ] + list(args)
+
+    start = time.monotonic()
+    process = subprocess.run(command, cwd=workdir, stdout=log or subprocess.DEVNULL,
+                             stderr=subprocess.STDOUT)
+    elapsed = time.monotonic() - start
+
+    releases = 0
+    if os.path.exists(results):
+        with open(results) as f:
+            releases = sum(1 for line in f if line.strip())
+
+    return process.returncode, releases, elapsed
+
+
+def load_test(quay, runs=1, args=(), workdir=None, log=None):
+    """
+    Runs the curator runs times against a started FakeQuay, and returns a
+    report for each run.
+    """
+    reports = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        workdir = workdir or tmpdir
+        for run in range(runs):
+            before = collections.Counter(quay.requests)
+            pushed = len(quay.pushed)
+            returncode, releases, elapsed = run_curator(quay.url, workdir, args, log)
+
+            requests = collections.Counter(quay.requests)
+            requests.subtract(before)
+            calls = sum(requests.values())
+            by_endpoint = collections.Counter()
+            for (endpoint, status), count in requests.items():
+                if count:
+                    by_endpoint[f"{endpoint} {status}"] += count
+
+            reports.append({
+                "run": run + 1,
+                "returncode": returncode,
+                "releases": releases,
+                "pushed": len(quay.pushed) - pushed,
+                "seconds": elapsed,
+                "releases_per_second": releases / elapsed if elapsed else 0.0,
+                "api_calls": calls,
+                "api_calls_per_release": calls / releases if releases else None,
+                "requests": dict(sorted(by_endpoint.items())),
+            })
+    return reports
+
+
+def print_report(report, out=sys.stdout):
+    out.write(
+        f"Run {report['run']}: {report['releases']} releases in {report['seconds']:.2f}s "
+        f"({report['releases_per_second']:.1f}/s), {report['pushed']} pushed, "
+        f"exit code {report['returncode']}\n"
+    )
+    per_release = report['api_calls_per_release']
+    out.write(
+        f"  {report['api_calls']} API calls"
+        f"{f', {per_release:.2f} per release' if per_release is not None else ''}\n"
+    )
+    for name, count in report["requests"].items():
+        out.write(f"    {name:30} {count}\n")
+
+
+if __name__ == "__main__":
+
+    PARSER = argparse.ArgumentParser(
+        description="Load test the curator against a local stand-in for Quay.")
+    PARSER.add_argument(
+        '--operators', action="store",
+        default=1000, dest="operators", type=int,
+        help="Number of synthetic operators to seed")
+    PARSER.add_argument(
+        '--releases', action="store",
+        default=2, dest="releases", type=int,
+        help="Number of releases of each operator")
+    PARSER.add_argument(
+        '--latency', action="store",
+        default=0.0, dest="latency", type=float,
+        help="Seconds of latency to add to every request")
+    PARSER.add_argument(
+        '--error-rate', action="store",
+        default=0.0, dest="error_rate", type=float,
+        help="Share of requests that fail with a 503")
+    PARSER.add_argument(
+        '--rate-limit', action="store",
+        default=None, dest="rate_limit", type=float,
+        help="Requests per second above which requests are throttled with a 429")
+    PARSER.add_argument(
+        '--burst', action="store",
+        default=None, dest="burst", type=float,
+        help="Requests allowed in a burst above the rate limit (default: the rate limit)")
+    PARSER.add_argument(
+        '--seed', action="store",
+        default=0, dest="seed", type=int,
+        help="Random seed for the release mix and injected errors")
+    PARSER.add_argument(
+        '--no-etags', action="store_false",
+        default=True, dest="etags",
+        help="Send listings without an ETag, so they cannot be revalidated")
+    PARSER.add_argument(
+        '--runs', action="store",
+        default=1, dest="runs", type=int,
+        help="Number of times to run the curator against the same server")
+    PARSER.add_argument(
+        '--workdir', action="store",
+        default=None, dest="workdir", type=str,
+        help="Directory to run the curator in (default: a temporary directory)")
+    PARSER.add_argument(
+        '--log', action="store",
+        default=None, dest="log", type=str,
+        help="Write the curator's output to this file")
+    PARSER.add_argument(
+        '--output', action="store",
+        default=None, dest="output", type=str,
+        help="Write the reports to this JSON file")
+    PARSER.add_argument(
+        'curator_args', nargs=argparse.REMAINDER,
+        help="Arguments for the curator, after --")
+    ARGS = PARSER.parse_args()
+
+    CURATOR_ARGS = ARGS.curator_args
+    if CURATOR_ARGS[:1] == ["--"]:
+        CURATOR_ARGS = CURATOR_ARGS[1:]
+
+    QUAY = fake_quay.FakeQuay(
+        operators=ARGS.operators, releases=ARGS.releases,
+        latency=ARGS.latency, error_rate=ARGS.error_rate,
+        rate_limit=ARGS.rate_limit, burst=ARGS.burst, etags=ARGS.etags,
+        seed=ARGS.seed
+    )
+    print(f"Seeded {QUAY.releases()} releases")
+
+    LOG = open(ARGS.log, 'w') if ARGS.log else None
+    try:
+        with QUAY:
+            REPORTS = load_test(QUAY, ARGS.runs, CURATOR_ARGS, ARGS.workdir, LOG)
+    finally:
+        if LOG:
+            LOG.close()
+
+    for REPORT in REPORTS:
+        print_report(REPORT)
+
+    if ARGS.output:
+        with open(ARGS.output, 'w') as f:
+            json.dump(REPORTS, f, indent=2)
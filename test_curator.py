@@ -1,8 +1,23 @@
 import unittest
+import base64
+import bench_curator
+import contextlib
 import curator
-from io import StringIO
+import fake_quay
+import hashlib
+import json
+import loadtest_curator
+from io import BytesIO, StringIO
+import os
+import pstats
+import random
 import requests
+import tarfile
+import tempfile
+import threading
+import time
 from unittest.mock import Mock, patch
+from xml.etree import ElementTree
 import yaml
 
 
@@ -46,7 +61,200 @@ class TestStringFormattingHelpers(unittest.TestCase):
         )
 
 
-@patch('curator.requests.get')
+class TestQuayClient(unittest.TestCase):
+    def _response(self, status_code):
+        response = Mock()
+        response.status_code = status_code
+        return response
+
+
+    @patch('curator.time.sleep')
+    def test_retries_idempotent_requests(self, mock_sleep):
+        client = curator.QuayClient(retries=2)
+        client.session.request = Mock(side_effect=[
+            self._response(503),
+            requests.exceptions.ConnectionError(),
+            self._response(200),
+        ])
+
+        r = client.get("https://quay.io/cnr/api/v1/packages")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(client.session.request.call_count, 3)
+        self.assertEqual(mock_sleep.call_count, 2)
+
+
+    @patch('curator.time.sleep')
+    def test_returns_last_response_when_out_of_retries(self, mock_sleep):
+        client = curator.QuayClient(retries=1)
+        client.session.request = Mock(return_value=self._response(502))
+
+        r = client.get("https://quay.io/cnr/api/v1/packages")
+
+        self.assertEqual(r.status_code, 502)
+        self.assertEqual(client.session.request.call_count, 2)
+
+
+    def test_streamed_responses_are_in_flight_until_closed(self):
+        client = curator.QuayClient(retries=0, pool_maxsize=1)
+        client.session.request = Mock(side_effect=lambda *a, **kw: self._response(200))
+        limiter = client.limiters["cnr"]
+
+        r = client.get("https://quay.io/cnr/api/v1/packages/a/b/blobs/sha256/x", stream=True)
+        self.assertEqual(limiter.concurrency.in_flight, 1)
+        r.close()
+        r.close()
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+
+        client.get("https://quay.io/cnr/api/v1/packages")
+        self.assertEqual(limiter.concurrency.in_flight, 0)
+
+
+    @patch('curator.time.sleep')
+    def test_does_not_retry_non_idempotent_requests(self, mock_sleep):
+        client = curator.QuayClient(retries=3)
+        client.session.request = Mock(return_value=self._response(503))
+
+        r = client.post("https://quay.io/cnr/api/v1/packages/ns/pkg")
+
+        self.assertEqual(r.status_code, 503)
+        client.session.request.assert_called_once()
+        mock_sleep.assert_not_called()
+
+
+    def test_backoff_is_jittered_and_bounded(self):
+        client = curator.QuayClient(backoff=0.5)
+        for attempt in range(4):
+            delay = client.backoff_delay(attempt)
+            self.assertGreaterEqual(delay, 0)
+            self.assertLessEqual(delay, 0.5 * 2 ** attempt)
+
+
+    def test_retry_after(self):
+        self.assertEqual(curator._retry_after(Mock(headers={"Retry-After": "3"})), 3)
+        self.assertEqual(curator._retry_after(Mock(headers={"Retry-After": "86400"})),
+                         curator.MAX_RETRY_AFTER)
+        self.assertEqual(curator._retry_after(
+            Mock(headers={"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"})), 0)
+        self.assertIsNone(curator._retry_after(Mock(headers={})))
+        self.assertIsNone(curator._retry_after(None))
+
+
+    def test_rate_limiter_is_aimd(self):
+        now = [0.0]
+        limiter = curator.RateLimiter(max_concurrency=8, clock=lambda: now[0])
+
+        # Throttled responses to requests sent before the last cut count once
+        started = [limiter.acquire() for _ in range(4)]
+        now[0] = 1.0
+        for t in started:
+            limiter.release(t, 429)
+        self.assertEqual(limiter.limit, 4)
+
+        # A cap's worth of healthy responses grows the cap by one
+        for _ in range(4):
+            limiter.release(limiter.acquire(), 200)
+        self.assertEqual(limiter.limit, 5)
+
+
+    def test_rate_limiter_honours_retry_after_and_rate(self):
+        now = [0.0]
+        limiter = curator.RateLimiter(rate=10, burst=1, clock=lambda: now[0])
+        waits = []
+
+        def wait(timeout):
+            waits.append(timeout)
+            now[0] += timeout
+
+        limiter._cond.wait = wait
+        limiter.release(limiter.acquire(), 429, retry_after=2)
+        limiter.release(limiter.acquire(), 200)
+        limiter.release(limiter.acquire(), 200)
+
+        self.assertEqual(waits[0], 2)
+        self.assertAlmostEqual(waits[1], 0.1)
+
+
+    @patch('curator.time.sleep')
+    def test_apis_have_separate_budgets(self, mock_sleep):
+        client = curator.QuayClient(retries=0)
+        client.session.request = Mock(return_value=self._response(503))
+
+        client.get("https://quay.io/api/v1/repository")
+
+        self.assertEqual(client.limiters["repository"].limit, curator.DEFAULT_POOL_MAXSIZE / 2)
+        self.assertEqual(client.limiters["cnr"].limit, curator.DEFAULT_POOL_MAXSIZE)
+
+
+class TestBlobCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+
+
+    def test_put_verifies_digest(self):
+        cache = curator.BlobCache(self.tmpdir.name)
+        data = b"some operator tarball"
+        digest = hashlib.sha256(data).hexdigest()
+
+        with cache.put(digest, [data[:4], data[4:]]) as blob:
+            self.assertEqual(blob.read(), data)
+        with cache.open(digest) as blob:
+            self.assertEqual(blob.read(), data)
+
+
+    def test_put_rejects_truncated_download(self):
+        cache = curator.BlobCache(self.tmpdir.name)
+        data = b"some operator tarball"
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self.assertRaises(curator.DigestMismatchError):
+            cache.put(digest, [data[:4]])
+
+        self.assertIsNone(cache.open(digest))
+        self.assertListEqual(cache._blobs(), [])
+
+
+    def test_rejects_invalid_digest(self):
+        cache = curator.BlobCache(self.tmpdir.name)
+        with self.assertRaises(ValueError):
+            cache.path("../../etc/passwd")
+
+
+    def test_evicts_least_recently_used(self):
+        cache = curator.BlobCache(self.tmpdir.name, max_bytes=20)
+        blobs = [bytes([i]) * 8 for i in range(3)]
+        digests = [hashlib.sha256(b).hexdigest() for b in blobs]
+
+        cache.put(digests[0], [blobs[0]]).close()
+        cache.put(digests[1], [blobs[1]]).close()
+        os.utime(cache.path(digests[0]), (0, 0))
+        os.utime(cache.path(digests[1]), (1, 1))
+        # Using the oldest blob makes the other one the eviction candidate
+        cache.open(digests[0]).close()
+        cache.put(digests[2], [blobs[2]]).close()
+
+        self.assertTrue(cache.path(digests[0]).exists())
+        self.assertFalse(cache.path(digests[1]).exists())
+        self.assertTrue(cache.path(digests[2]).exists())
+
+
+    @patch('curator.QUAY.get')
+    def test_get_package_release_uses_cache(self, mock_get):
+        data = b"some operator tarball"
+        release = {'package': 'stark-industries/jarvis', 'version': '1.0.0',
+                   'digest': hashlib.sha256(data).hexdigest()}
+        mock_get.return_value.iter_content.return_value = [data]
+
+        with patch('curator.BLOBS', curator.BlobCache(self.tmpdir.name)):
+            curator.get_package_release(release, use_cache=True).close()
+            with curator.get_package_release(release, use_cache=True) as blob:
+                self.assertEqual(blob.read(), data)
+
+        mock_get.assert_called_once()
+
+
+@patch('curator.QUAY.get')
 class TestRequests(unittest.TestCase):
     def test_list_operators(self, mock_get):
         expected = ['redhat-operators/nfd', 'redhat-operators/metering-ocp']
@@ -82,6 +290,17 @@ class TestRequests(unittest.TestCase):
         self.assertListEqual(response, expected)
 
 
+    def test_failed_listings_are_not_silent(self, mock_get):
+        mock_get.return_value.ok = False
+        mock_get.return_value.status_code = 429
+
+        with self.assertLogs(level='WARNING') as logs:
+            self.assertIsNone(curator.list_operators("redhat-operators"))
+            self.assertListEqual(curator.get_release_data("redhat-operators/nfd"), [])
+
+        self.assertEqual(len(logs.output), 2)
+
+
     def test_get_release_data(self, mock_get):
         expected = [
             {
@@ -163,10 +382,42 @@ class TestBundleValidation(unittest.TestCase):
         self.assertEqual(name, 'Package is in denied list')
         self.assertFalse(result)
 
-    # def extract_bundle_from_tar_file(self):
-    # Not sure how to test this
-    # args: operator_tarfile (Pathlib path to tgz)
-    # Returns bundle_file (read)
+    def _tarball(self, members):
+        buf = BytesIO()
+        with tarfile.open(fileobj=buf, mode="w:gz") as t:
+            for name, data in members:
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                t.addfile(info, BytesIO(data))
+        return buf.getvalue()
+
+    def test_extract_bundle_from_tar_file_stops_at_bundle(self):
+        tarball = self._tarball([
+            ("jarvis/bundle.yaml", b"data: {}\n"),
+            ("jarvis/huge-crd.yaml", os.urandom(1024 * 1024)),
+        ])
+        stream = BytesIO(tarball)
+
+        bundle, name, result = curator.extract_bundle_from_tar_file(stream)
+
+        self.assertEqual(bundle, b"data: {}\n")
+        self.assertEqual(name, 'bundle.yaml must be present')
+        self.assertTrue(result)
+        self.assertLess(stream.tell(), len(tarball) / 2)
+
+    def test_extract_bundle_from_tar_file_missing_bundle(self):
+        tarball = self._tarball([("jarvis/README.md", b"hello")])
+
+        bundle, _, result = curator.extract_bundle_from_tar_file(BytesIO(tarball))
+
+        self.assertIsNone(bundle)
+        self.assertFalse(result)
+
+    def test_extract_bundle_from_tar_file_corrupt_tarball(self):
+        bundle, _, result = curator.extract_bundle_from_tar_file(BytesIO(b"not a tarball"))
+
+        self.assertIsNone(bundle)
+        self.assertFalse(result)
 
     # def load_yaml_from_bundle_object
     # Not sure how to test this
@@ -256,6 +507,252 @@ class TestBundleValidation(unittest.TestCase):
         self.assertEqual(name, 'bundle must have a clusterServiceVersions object')
         self.assertTrue(result)
 
+class TestYamlBackend(unittest.TestCase):
+    document = """
+        - apiVersion: operators.coreos.com/v1alpha1
+          kind: ClusterServiceVersion
+          metadata:
+            name: jarvis.v1.0.0
+            annotations:
+              description: "A very long description that will need to wrap when it gets dumped back out again"
+          spec:
+            replaces: jarvis.v0.9.0
+            version: 1.0.0
+            minKubeVersion: 1.11
+            installModes:
+            - type: MultiNamespace
+              supported: false
+    """
+
+    def test_yaml_load_matches_pure_python(self):
+        self.assertEqual(
+            curator.yaml_load(self.document),
+            yaml.load(self.document, Loader=yaml.SafeLoader)
+        )
+
+
+    def test_yaml_dump_is_identical_for_both_loaders(self):
+        with patch('curator.YAML_LOADER', yaml.SafeLoader):
+            python_dump = curator.yaml_dump(curator.yaml_load(self.document), default_style='|')
+        dump = curator.yaml_dump(curator.yaml_load(self.document), default_style='|')
+
+        self.assertEqual(dump, python_dump)
+        self.assertEqual(dump, yaml.dump(yaml.safe_load(self.document), default_style='|'))
+
+
+def _csv(name, replaces=None, cluster_permissions=False):
+    csv = {
+        'metadata': {'name': name},
+        'spec': {
+            'install': {'spec': {}},
+            'installModes': [{'type': 'OwnNamespace', 'supported': True}]
+        }
+    }
+    if replaces:
+        csv['spec']['replaces'] = replaces
+    if cluster_permissions:
+        csv['spec']['install']['spec']['clusterPermissions'] = []
+    return csv
+
+
+def _bundle_tarball(csvs, channels):
+    bundle = {'data': {
+        'clusterServiceVersions': yaml.dump(csvs, default_style='|'),
+        'customResourceDefinitions': yaml.dump([], default_style='|'),
+        'packages': yaml.dump([{
+            'packageName': 'jarvis',
+            'channels': [{'name': n, 'currentCSV': c} for n, c in channels]
+        }], default_style='|'),
+    }}
+    data = yaml.dump(bundle, default_style='|').encode()
+    buf = BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:gz") as t:
+        info = tarfile.TarInfo("jarvis/bundle.yaml")
+        info.size = len(data)
+        t.addfile(info, BytesIO(data))
+    return buf.getvalue()
+
+
+class TestCsvPolicy(unittest.TestCase):
+    def test_validate_csv_passes_clean_csv(self):
+        result, tests = curator.validate_csv("stark-industries/jarvis", "1.0.0", _csv('jarvis.v1'))
+
+        self.assertTrue(result)
+        self.assertListEqual(list(tests), [
+            "CSV must not include clusterPermissions",
+            "CSV must not grant SecurityContextConstraints permissions",
+            "CSV must not require MultiNamespace installMode",
+        ])
+
+
+    def test_validate_csv_fails_each_rule(self):
+        csv = _csv('jarvis.v1', cluster_permissions=True)
+        csv['spec']['install']['spec']['permissions'] = [{'rules': [
+            {'apiGroups': [''], 'verbs': ['get'], 'resources': ['pods']},
+            {'apiGroups': ['security.openshift.io'], 'verbs': ['use'],
+             'resources': ['securitycontextconstraints']},
+        ]}]
+        csv['spec']['installModes'].append({'type': 'MultiNamespace', 'supported': True})
+
+        result, tests = curator.validate_csv("stark-industries/jarvis", "1.0.0", csv)
+
+        self.assertFalse(result)
+        self.assertFalse(any(tests.values()))
+
+
+    def test_unsupported_install_mode_passes(self):
+        csv = _csv('jarvis.v1')
+        csv['spec']['installModes'].append({'type': 'MultiNamespace', 'supported': False})
+
+        result, _ = curator.validate_csv("stark-industries/jarvis", "1.0.0", csv)
+
+        self.assertTrue(result)
+
+
+    def test_unknown_rule_is_rejected(self):
+        policy = dict(curator.curation_policy(),
+                      csv=[{"name": "x", "reason": "y", "forbid": {"nonsense": 1}}])
+        with self.assertRaises(ValueError):
+            curator.CompiledPolicy(policy)
+
+
+    def test_policy_recompiles_when_lists_change(self):
+        with patch('curator.ALLOWED_PACKAGES', ["stark-industries/jarvis"]):
+            self.assertIn("stark-industries/jarvis", curator.current_policy().allowed)
+        with patch('curator.ALLOWED_PACKAGES', []):
+            self.assertNotIn("stark-industries/jarvis", curator.current_policy().allowed)
+
+
+    def test_policy_is_not_hashed_per_lookup(self):
+        with patch('curator.policy_fingerprint') as mock_fingerprint:
+            curator.validate_csv("stark-industries/jarvis", "1.0.0", _csv('jarvis.v1'))
+            curator.check_package_in_allow_list("stark-industries/jarvis")
+
+        mock_fingerprint.assert_not_called()
+
+
+@patch('curator.ALLOWED_PACKAGES', [])
+@patch('curator.DENIED_PACKAGES', [])
+class TestChannelWalk(unittest.TestCase):
+    release = {'package': 'stark-industries/jarvis', 'version': '1.0.0', 'digest': 'a' * 64}
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir.name)
+        self.addCleanup(os.chdir, cwd)
+
+
+    def _validate(self, csvs, channels):
+        tarball = _bundle_tarball(csvs, channels)
+        with patch('curator.open_package_release',
+                   lambda release, use_cache: contextlib.nullcontext(BytesIO(tarball))):
+            return curator.validate_bundle(self.release)
+
+
+    def test_walks_the_whole_replaces_chain(self):
+        passed, tests = self._validate(
+            [_csv('jarvis.v3', 'jarvis.v2'), _csv('jarvis.v2', 'jarvis.v1'), _csv('jarvis.v1')],
+            [('stable', 'jarvis.v3')]
+        )
+
+        self.assertTrue(passed)
+        for name in ['jarvis.v3', 'jarvis.v2', 'jarvis.v1']:
+            self.assertTrue(tests[f"CSV {name} curated"])
+
+
+    def test_truncates_at_first_rejected_csv(self):
+        passed, tests = self._validate(
+            [_csv('jarvis.v3', 'jarvis.v2'),
+             _csv('jarvis.v2', 'jarvis.v1', cluster_permissions=True),
+             _csv('jarvis.v1')],
+            [('stable', 'jarvis.v3')]
+        )
+
+        self.assertTrue(passed)
+        self.assertIn("CSV jarvis.v2 rejected, truncating bundle here", tests)
+        self.assertNotIn("CSV jarvis.v1 curated", tests)
+        with curator.REGENERATED.open(self.release) as f:
+            regenerated = f.read()
+        bundle, _, _ = curator.extract_bundle_from_tar_file(BytesIO(regenerated))
+        self.assertNotIn("jarvis.v1", bundle.decode())
+        # Nothing is written to the working directory
+        self.assertListEqual(os.listdir("."), [".cache"])
+
+
+    def test_regenerated_packages_are_deterministic(self):
+        csvs = [_csv('jarvis.v3', 'jarvis.v2'),
+                _csv('jarvis.v2', 'jarvis.v1', cluster_permissions=True),
+                _csv('jarvis.v1')]
+        packages = []
+        for now in [1e9, 2e9]:
+            with patch('time.time', return_value=now):
+                self._validate(csvs, [('stable', 'jarvis.v3')])
+            with curator.REGENERATED.open(self.release) as f:
+                packages.append(f.read())
+
+        self.assertEqual(packages[0], packages[1])
+        with tarfile.open(fileobj=BytesIO(packages[0])) as t:
+            info = t.getmember("bundle.yaml")
+        self.assertEqual((info.mtime, info.uid, info.uname), (0, 0, ""))
+
+
+    def test_missing_replaces_ends_the_channel(self):
+        passed, tests = self._validate(
+            [_csv('jarvis.v3', 'jarvis.v2')],
+            [('stable', 'jarvis.v3')]
+        )
+
+        self.assertTrue(passed)
+        self.assertTrue(tests["Curated channel: stable"])
+
+
+    def test_missing_current_csv_fails(self):
+        passed, tests = self._validate(
+            [_csv('jarvis.v2')],
+            [('stable', 'jarvis.v3')]
+        )
+
+        self.assertFalse(passed)
+        self.assertFalse(tests["CSV jarvis.v3 must be present in the bundle"])
+
+
+    def test_replaces_cycle_fails(self):
+        passed, tests = self._validate(
+            [_csv('jarvis.v3', 'jarvis.v2'), _csv('jarvis.v2', 'jarvis.v3')],
+            [('stable', 'jarvis.v3')]
+        )
+
+        self.assertFalse(passed)
+        self.assertFalse(tests["CSV jarvis.v3 replaces chain must not contain a cycle"])
+
+
+    def test_shared_history_is_validated_once(self):
+        csvs = [_csv('jarvis.v3', 'jarvis.v2'), _csv('jarvis.v2', 'jarvis.v1'), _csv('jarvis.v1')]
+        with patch('curator.validate_csv', wraps=curator.validate_csv) as mock_validate, \
+                patch('curator.current_policy', wraps=curator.current_policy) as mock_policy:
+            passed, _ = self._validate(csvs, [('stable', 'jarvis.v3'), ('fast', 'jarvis.v2')])
+
+        self.assertTrue(passed)
+        self.assertEqual(mock_validate.call_count, 3)
+        self.assertEqual(mock_policy.call_count, 1)
+
+
+    def test_synthetic_benchmark_bundle(self):
+        bundle = bench_curator.synthetic_bundle(
+            channels=2, csvs_per_channel=5, chain_length=4, crds=1, crd_size=500, reject_depth=2)
+        with patch('curator.open_package_release',
+                   lambda release, use_cache: contextlib.nullcontext(BytesIO(bundle["tarball"]))):
+            passed, tests = curator.validate_bundle(self.release)
+
+        self.assertTrue(passed)
+        for c in range(2):
+            self.assertTrue(tests[f"CSV synthetic-{c}.v0.0.3 curated"])
+            self.assertIn(f"CSV synthetic-{c}.v0.0.2 rejected, truncating bundle here", tests)
+            self.assertNotIn(f"CSV synthetic-{c}.v0.0.0 curated", tests)
+
+
 class TestNewBundleAndTarfileCreation(unittest.TestCase):
     def test_regenerate_bundle_yaml(self):
         expected = {'data': {'clusterServiceVersions': '[]\n', 'packages': '""\n', 'customResourceDefinitions': '""\n'}}
@@ -290,6 +787,1030 @@ class TestNewBundleAndTarfileCreation(unittest.TestCase):
         )
 
 
+class TestSharding(unittest.TestCase):
+    def test_shards_partition_packages(self):
+        packages = [f"community-operators/operator-{i}" for i in range(200)]
+        shards = [[p for p in packages if curator.in_shard(p, (i, 3))] for i in range(3)]
+
+        self.assertListEqual(sorted(sum(shards, [])), sorted(packages))
+        for shard in shards:
+            self.assertGreater(len(shard), 40)
+        self.assertTrue(all(curator.in_shard(p, None) for p in packages))
+
+
+    def test_parse_shard(self):
+        self.assertEqual(curator.parse_shard("2/4"), (2, 4))
+        for bad in ["4/4", "-1/4", "1", "a/b"]:
+            with self.assertRaises(curator.argparse.ArgumentTypeError):
+                curator.parse_shard(bad)
+
+
+    def test_shard_path(self):
+        self.assertEqual(curator.shard_path(".curator-journal.jsonl", (1, 3)),
+                         ".curator-journal.shard-1-of-3.jsonl")
+        self.assertEqual(curator.shard_path("curator-results.jsonl", None),
+                         "curator-results.jsonl")
+
+
+    def test_shards_in_one_directory_keep_their_own_files(self):
+        quay = fake_quay.FakeQuay(operators=6, releases=1, seed=2)
+        with quay, tempfile.TemporaryDirectory() as workdir:
+            for i in range(2):
+                returncode, _, _ = loadtest_curator.run_curator(
+                    quay.url, workdir, ["--shard", f"{i}/2", "--skip-push",
+                                        "--results", f"results-{i}.jsonl"])
+                self.assertEqual(returncode, 0)
+
+            self.assertTrue(os.path.exists(os.path.join(workdir, ".curator-manifest.shard-0-of-2.json")))
+            self.assertTrue(os.path.exists(os.path.join(workdir, ".curator-manifest.shard-1-of-2.json")))
+            self.assertFalse(os.path.exists(os.path.join(workdir, curator.DEFAULT_MANIFEST)))
+
+
+    def test_merge_results_counts_each_release_once(self):
+        entry = lambda name, passed: {name: {"version": "1.0.0", "pass": passed,
+                                             "skipped": False, "tests": {}}}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, f"{i}.jsonl") for i in range(2)]
+            for path, entries in zip(paths, [[entry("a/x", True), entry("a/y", False)],
+                                             [entry("a/z", True), entry("a/x", True)]]):
+                with curator.ResultSink(path) as sink:
+                    for e in entries:
+                        sink.write(e)
+
+            with self.assertLogs(level='WARNING'):
+                merged = list(curator.merge_results(paths))
+
+        self.assertListEqual([list(e)[0] for e in merged], ["a/x", "a/y", "a/z"])
+
+
+class TestReleaseFilter(unittest.TestCase):
+    def _releases(self, *versions):
+        return [{'package': 'community-operators/foo', 'version': v,
+                 'digest': v, 'size': 300} for v in versions]
+
+
+    def test_versions_sort_numerically(self):
+        self.assertLess(curator._version_key("1.9.0"), curator._version_key("1.10.0"))
+        self.assertLess(curator._version_key("0.0.9"), curator._version_key("0.1.0-rc1"))
+        # Prereleases come before their release, as in semver
+        self.assertLess(curator._version_key("1.0.0-rc1"), curator._version_key("1.0.0"))
+        self.assertLess(curator._version_key("1.0.0-alpha"), curator._version_key("1.0.0-beta"))
+        self.assertLess(curator._version_key("1.0.0-rc.2"), curator._version_key("1.0.0-rc.10"))
+        self.assertLess(curator._version_key("1.0.0"), curator._version_key("1.0.1-rc1"))
+
+
+    def test_package_globs_and_namespaces(self):
+        release_filter = curator.ReleaseFilter(packages=['community-operators/foo*', 'bar'])
+
+        self.assertTrue(release_filter.package('community-operators/foobar'))
+        self.assertTrue(release_filter.package('redhat-operators/bar'))
+        self.assertFalse(release_filter.package('community-operators/bar-baz'))
+
+        release_filter = curator.ReleaseFilter(packages=['community-operators/foo*'])
+        self.assertFalse(release_filter.namespace('redhat-operators'))
+        release_filter = curator.ReleaseFilter(namespaces=['redhat-operators'])
+        self.assertFalse(release_filter.package('community-operators/foo'))
+
+
+    def test_version_range_and_latest_only(self):
+        releases = self._releases("0.9.0", "1.2.0", "1.10.0", "2.0.0")
+        versions = curator.parse_version_range(">=1.2.0, <2.0.0")
+
+        selected = curator.ReleaseFilter(versions=versions).releases(releases)
+        latest = curator.ReleaseFilter(versions=versions, latest_only=True).releases(releases)
+
+        self.assertListEqual([r['version'] for r in selected], ["1.2.0", "1.10.0"])
+        self.assertListEqual([r['version'] for r in latest], ["1.10.0"])
+        with self.assertRaises(curator.argparse.ArgumentTypeError):
+            curator.parse_version_range("~1.0")
+
+
+    @patch('curator.ALLOWED_PACKAGES', [])
+    @patch('curator.DENIED_PACKAGES', [])
+    def test_plan_run(self):
+        index = curator.CuratedIndex()
+        index.add('curated-community-operators/foo', '1.0.0')
+        releases = self._releases("1.0.0", "1.1.0", "1.2.0")
+
+        plan = curator.plan_run(releases, index)
+        out = StringIO()
+        curator.print_plan(plan, out=out)
+
+        self.assertEqual(plan['already_curated'], 1)
+        # Each pending package is downloaded once, for validation and push
+        self.assertEqual(plan['downloads'], 2)
+        self.assertEqual(plan['download_bytes'], 600)
+        self.assertEqual(plan['pushes'], 2)
+        self.assertEqual(plan['upload_bytes'], 800)
+        self.assertIn("2 package downloads (600 bytes)", out.getvalue())
+        self.assertEqual(curator.plan_run(releases, index, skip_push=True)['downloads'], 2)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_run_pipeline_preserves_order(self):
+        def slow_double(i):
+            time.sleep(random.random() / 100)
+            return i * 2
+
+        stages = [(slow_double, 4), (lambda i: i + 1, 3)]
+        results = list(curator.run_pipeline(range(50), stages, queue_size=2))
+
+        self.assertListEqual(results, [i * 2 + 1 for i in range(50)])
+
+
+    def test_run_pipeline_reraises_in_order(self):
+        def explode_on_three(i):
+            if i == 3:
+                raise ValueError("boom")
+            return i
+
+        results = []
+        with self.assertRaises(ValueError):
+            for i in curator.run_pipeline(range(10), [(explode_on_three, 2)]):
+                results.append(i)
+
+        self.assertListEqual(results, [0, 1, 2])
+
+
+    def test_run_pipeline_bounds_items_in_flight(self):
+        started = []
+        head = threading.Event()
+
+        def stall_first(i):
+            started.append(i)
+            if i == 0:
+                head.wait(5)
+            return i
+
+        results = curator.run_pipeline(range(100), [(stall_first, 2)], queue_size=1)
+        first = threading.Thread(target=lambda: next(results))
+        first.start()
+        time.sleep(0.2)
+        # While the first item is stuck, only a bounded number of later
+        # items are started: two queues of one, plus two workers
+        self.assertLessEqual(len(started), 4)
+        head.set()
+        first.join()
+        self.assertListEqual(list(results), list(range(1, 100)))
+
+
+    @patch('curator.get_package_release', return_value=StringIO())
+    @patch('curator.push_package')
+    def test_push_stage_only_pushes_new_passes(self, mock_push, mock_get):
+        release = {'package': 'stark-industries/jarvis', 'version': '1.0.0'}
+        for passed, skipped, skip_push, outcome in [(False, False, False, "failed"),
+                                                    (True, True, False, "curated"),
+                                                    (True, False, True, "passed")]:
+            entry = {release['package']: {
+                "version": "1.0.0", "pass": passed,
+                "skipped": skipped, "tests": {}}}
+            self.assertEqual(
+                curator.push_stage((release, entry), skip_push, "oauth", "basic"),
+                (release, entry, outcome)
+            )
+        mock_push.assert_not_called()
+
+        _, _, outcome = curator.push_stage((release, {release['package']: {
+            "version": "1.0.0", "pass": True, "skipped": False, "tests": {}}}),
+            False, "oauth", "basic")
+        mock_push.assert_called_once_with(
+            release, 'curated-stark-industries', "oauth", "basic",
+            package_file=mock_get.return_value, repositories=None, journal=None)
+        self.assertEqual(outcome, "curated")
+
+
+class TestReleaseEnumeration(unittest.TestCase):
+    @patch('curator.get_release_data')
+    @patch('curator.list_operators')
+    def test_releases_stream_with_bounded_prefetch(self, mock_list, mock_releases):
+        mock_list.side_effect = lambda ns: [f"{ns}/operator-{i}" for i in range(1000)]
+        mock_releases.side_effect = lambda package, with_size: [
+            {'package': package, 'version': v, 'digest': v} for v in ["1.0.0", "2.0.0"]]
+
+        releases = curator.enumerate_releases(["a", "b"], workers=2, queue_size=4)
+        first = next(releases)
+        time.sleep(0.1)
+
+        self.assertEqual(first['package'], "a/operator-0")
+        mock_list.assert_called_once_with("a")
+        self.assertLess(mock_releases.call_count, 20)
+
+        rest = list(releases)
+        self.assertEqual(len(rest), 3999)
+        self.assertEqual(rest[-1]['package'], "b/operator-999")
+
+
+    @patch('curator.get_release_data')
+    @patch('curator.list_operators')
+    def test_filters_are_applied_while_streaming(self, mock_list, mock_releases):
+        mock_list.return_value = ["a/foo", "a/bar"]
+        mock_releases.side_effect = lambda package, with_size: [
+            {'package': package, 'version': v, 'digest': v} for v in ["1.0.0", "2.0.0"]]
+        release_filter = curator.ReleaseFilter(packages=["foo"], latest_only=True)
+
+        releases = list(curator.enumerate_releases(["a"], release_filter))
+
+        mock_releases.assert_called_once_with("a/foo", with_size=False)
+        self.assertListEqual([r['version'] for r in releases], ["2.0.0"])
+
+
+class TestCuratedIndex(unittest.TestCase):
+    @patch('curator.get_release_data')
+    @patch('curator.list_operators')
+    def test_load_indexes_curated_releases(self, mock_list, mock_releases):
+        mock_list.return_value = ['curated-stark-industries/jarvis']
+        mock_releases.return_value = [
+            {'package': 'curated-stark-industries/jarvis', 'version': '1.0.0',
+             'digest': 'abc', 'namespace': 'curated-stark-industries'},
+            {'package': 'curated-stark-industries/jarvis', 'version': '1.1.0',
+             'digest': 'def', 'namespace': 'curated-stark-industries'},
+        ]
+
+        index = curator.CuratedIndex()
+        index.load(['curated-stark-industries'])
+
+        mock_list.assert_called_once_with('curated-stark-industries')
+        mock_releases.assert_called_once_with('curated-stark-industries/jarvis')
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.digest('curated-stark-industries/jarvis', '1.1.0'), 'def')
+
+
+    @patch('curator.get_release_data')
+    def test_curated_uses_index_without_requests(self, mock_releases):
+        index = curator.CuratedIndex()
+        index.add('curated-stark-industries/jarvis', '1.0.0', 'abc')
+
+        self.assertTrue(curator.curated('curated-stark-industries/jarvis', '1.0.0', index))
+        self.assertFalse(curator.curated('curated-stark-industries/jarvis', '2.0.0', index))
+        mock_releases.assert_not_called()
+
+
+    @patch('curator.get_package_release', return_value=StringIO())
+    @patch('curator.push_package', return_value='abc')
+    def test_push_stage_updates_index(self, mock_push, mock_get):
+        index = curator.CuratedIndex()
+        release = {'package': 'stark-industries/jarvis', 'version': '1.0.0'}
+        entry = {release['package']: {
+            "version": "1.0.0", "pass": True, "skipped": False, "tests": {}}}
+
+        curator.push_stage((release, entry), False, "oauth", "basic", index=index)
+
+        self.assertIn(('curated-stark-industries/jarvis', '1.0.0'), index)
+
+
+class TestReleaseManifest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "manifest.json")
+
+
+    def _release(self, version, digest):
+        return {'package': 'stark-industries/jarvis', 'version': version,
+                'digest': digest, 'namespace': 'stark-industries'}
+
+
+    def test_changed_releases_survive_a_round_trip(self):
+        manifest = curator.ReleaseManifest(self.path)
+        manifest.record(self._release('1.0.0', 'aaa'), "curated")
+        manifest.record(self._release('1.1.0', 'bbb'), "failed")
+        manifest.record(self._release('1.2.0', 'ccc'), "passed")
+        manifest.record(self._release('1.3.0', 'ddd'), "error")
+        manifest.save()
+
+        live = [
+            self._release('1.0.0', 'aaa'),   # unchanged, curated
+            self._release('1.1.0', 'bbb'),   # unchanged, failed
+            self._release('1.2.0', 'ccc'),   # passed but never pushed
+            self._release('1.3.0', 'ddd'),   # download failed
+            self._release('1.0.0', 'zzz'),   # digest changed
+            self._release('2.0.0', 'eee'),   # new
+        ]
+        changed = list(curator.ReleaseManifest(self.path).changed(live))
+
+        self.assertListEqual(changed, live[2:])
+
+
+    def test_policy_change_retries_failed_releases(self):
+        manifest = curator.ReleaseManifest(self.path, policy="old")
+        manifest.record(self._release('1.0.0', 'aaa'), "curated")
+        manifest.record(self._release('1.1.0', 'bbb'), "failed")
+        manifest.save()
+
+        live = [self._release('1.0.0', 'aaa'), self._release('1.1.0', 'bbb')]
+        changed = list(curator.ReleaseManifest(self.path, policy="new").changed(live))
+
+        self.assertListEqual(changed, live[1:])
+
+
+    def test_missing_manifest_processes_everything(self):
+        manifest = curator.ReleaseManifest(self.path)
+        live = [self._release('1.0.0', 'aaa')]
+
+        self.assertListEqual(list(manifest.changed(live)), live)
+        self.assertIsNone(manifest.outcome(live[0]))
+
+
+class TestCheckpointJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "journal.jsonl")
+        self.release = {'package': 'stark-industries/jarvis', 'version': '1.0.0',
+                        'digest': 'aaa', 'namespace': 'stark-industries'}
+        self.entry = {self.release['package']: {
+            "version": "1.0.0", "pass": True, "skipped": False, "tests": {"ok": True}}}
+
+
+    def test_resume_ignores_torn_records(self):
+        journal = curator.CheckpointJournal(self.path, policy="p")
+        journal.record(self.release, "validated", passed=True, tests={"ok": True})
+        journal.record(self.release, "done", outcome="curated")
+        journal.close()
+        with open(self.path, 'ab') as f:
+            f.write(b'{"package": "stark-industries/jar')
+
+        journal = curator.CheckpointJournal(self.path, resume=True, policy="p")
+        journal.record(dict(self.release, version='2.0.0'), "downloaded")
+        journal.close()
+        resumed = curator.CheckpointJournal(self.path, resume=True, policy="other")
+
+        # Validation results from another policy are not reused
+        self.assertIsNone(resumed.get(self.release, "validated"))
+        self.assertEqual(resumed.get(self.release, "done")['outcome'], "curated")
+        self.assertIsNotNone(resumed.get(dict(self.release, version='2.0.0'), "downloaded"))
+        self.assertIsNone(resumed.get(dict(self.release, digest='bbb'), "done"))
+
+        manifest = curator.ReleaseManifest(os.path.join(self.tmpdir.name, "m.json"))
+        self.assertEqual(resumed.replay(manifest), 1)
+        self.assertEqual(manifest.outcome(self.release), "curated")
+        self.assertListEqual(list(resumed.unfinished([self.release])), [])
+
+
+    def test_without_resume_the_journal_starts_over(self):
+        journal = curator.CheckpointJournal(self.path)
+        journal.record(self.release, "done", outcome="curated")
+        journal.close()
+
+        with self.assertLogs(level='WARNING'):
+            journal = curator.CheckpointJournal(self.path)
+        self.assertIsNone(journal.get(self.release, "done"))
+        journal.remove()
+        self.assertFalse(os.path.exists(self.path))
+
+
+    @patch('curator.validate_bundle')
+    def test_validate_stage_reuses_journaled_result(self, mock_validate):
+        journal = curator.CheckpointJournal(self.path)
+        mock_validate.return_value = (True, {"ok": True})
+        curator.validate_stage(self.release, index=curator.CuratedIndex(), journal=journal)
+        _, entry = curator.validate_stage(self.release, index=curator.CuratedIndex(), journal=journal)
+
+        mock_validate.assert_called_once()
+        self.assertDictEqual(entry, self.entry)
+
+
+    def test_download_stage_reuses_journaled_download(self):
+        journal = curator.CheckpointJournal(self.path)
+        blobs = curator.BlobCache(os.path.join(self.tmpdir.name, "blobs"))
+        response = Mock(status_code=200)
+        response.iter_content.return_value = [b"package"]
+        release = dict(self.release, digest=hashlib.sha256(b"package").hexdigest())
+        with patch('curator.BLOBS', blobs), \
+                patch('curator.QuayClient.get', return_value=response) as mock_get:
+            curator.download_stage(release, False, journal=journal)
+            curator.download_stage(release, False, journal=journal)
+
+        mock_get.assert_called_once()
+
+
+    @patch('curator.get_package_release')
+    def test_download_stage_skips_journaled_results(self, mock_get):
+        journal = curator.CheckpointJournal(self.path)
+        journal.record(self.release, "validated", passed=False, tests={"ok": False})
+
+        curator.download_stage(self.release, False, journal=journal)
+
+        mock_get.assert_not_called()
+
+
+    @patch('curator.set_repo_visibility', return_value=True)
+    @patch('curator.push_package')
+    def test_push_stage_finishes_half_done_push(self, mock_push, mock_visibility):
+        journal = curator.CheckpointJournal(self.path)
+        journal.record(self.release, "pushed", pushed_digest="aaa")
+
+        _, _, outcome = curator.push_stage((self.release, self.entry), False,
+                                           "oauth", "basic", journal=journal)
+        curator.push_stage((self.release, self.entry), False, "oauth", "basic", journal=journal)
+
+        self.assertEqual(outcome, "curated")
+        mock_push.assert_not_called()
+        mock_visibility.assert_called_once_with('curated-stark-industries', 'jarvis', 'oauth')
+        self.assertIsNotNone(journal.get(self.release, "visible"))
+
+
+@patch('curator.ALLOWED_PACKAGES', ["stark-industries/jarvis"])
+@patch('curator.DENIED_PACKAGES', ["skynet/find-john-connor"])
+class TestValidationCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "validation.sqlite3")
+        self.release = {'package': 'wonka-industries/gobstopper-firmware',
+                        'version': '1.0.0', 'digest': 'a' * 64}
+        regenerated = patch('curator.REGENERATED', curator.RegeneratedStore(
+            os.path.join(self.tmpdir.name, "regenerated")))
+        regenerated.start()
+        self.addCleanup(regenerated.stop)
+
+
+    def test_result_round_trip(self):
+        tests = {"bundle.yaml must be present": True,
+                 "CSV must not include clusterPermissions": False}
+        cache = curator.ValidationCache(self.path)
+        cache.put(self.release, False, tests)
+        cache.close()
+
+        cache = curator.ValidationCache(self.path)
+        self.assertEqual(cache.get(self.release), (False, tests))
+        self.assertIsNone(cache.get(dict(self.release, digest='def')))
+        cache.close()
+
+
+    def test_policy_change_invalidates_results(self):
+        cache = curator.ValidationCache(self.path)
+        cache.put(self.release, True, {"some test": True})
+        with patch('curator.DENIED_PACKAGES', ["wonka-industries/gobstopper-firmware"]):
+            self.assertIsNone(cache.get(self.release))
+        with patch('curator.VALIDATION_RULES_VERSION', -1):
+            self.assertIsNone(cache.get(self.release))
+        self.assertIsNotNone(cache.get(self.release))
+        cache.close()
+
+
+    def test_prune_keeps_only_the_current_policy(self):
+        cache = curator.ValidationCache(self.path)
+        with patch('curator.VALIDATION_RULES_VERSION', -1):
+            cache.put(self.release, True, {"some test": True})
+        cache.close()
+
+        # Opening the cache, as a plan does, keeps the other policy's result
+        cache = curator.ValidationCache(self.path)
+        with patch('curator.VALIDATION_RULES_VERSION', -1):
+            self.assertIsNotNone(cache.get(self.release))
+        cache.prune()
+        with patch('curator.VALIDATION_RULES_VERSION', -1):
+            self.assertIsNone(cache.get(self.release))
+        cache.close()
+
+
+    @patch('curator.validate_bundle')
+    def test_validate_stage_uses_cached_result(self, mock_validate):
+        cache = curator.ValidationCache(self.path)
+        cache.put(self.release, False, {"some test": False})
+
+        _, entry = curator.validate_stage(self.release, curator.CuratedIndex(), cache)
+
+        mock_validate.assert_not_called()
+        self.assertEqual(entry[self.release['package']]['tests'], {"some test": False})
+        cache.close()
+
+
+    @patch('curator.validate_bundle')
+    def test_validate_stage_revalidates_truncated_bundles(self, mock_validate):
+        tests = {"CSV jarvis.v0.9 rejected, truncating bundle here": True}
+        mock_validate.return_value = (True, tests)
+        cache = curator.ValidationCache(self.path)
+        cache.put(self.release, True, tests)
+
+        curator.validate_stage(self.release, curator.CuratedIndex(), cache)
+        mock_validate.assert_called_once_with(self.release, False)
+
+        # Once the regenerated package is stored, the result is reused
+        curator.REGENERATED.put(self.release, b"regenerated")
+        curator.validate_stage(self.release, curator.CuratedIndex(), cache)
+        mock_validate.assert_called_once()
+        cache.close()
+
+
+class TestMetadataCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "metadata.sqlite3")
+
+
+    def test_listings_are_revalidated(self):
+        quay = fake_quay.FakeQuay(operators=1, releases=2, namespaces=["redhat-operators"])
+        with quay, patch('curator.QUAY_URL', quay.url):
+            with patch('curator.METADATA', curator.MetadataCache(self.path)):
+                first = curator.get_release_data("redhat-operators/synthetic-00000")
+                curator.METADATA.close()
+            with patch('curator.METADATA', curator.MetadataCache(self.path)):
+                second = curator.get_release_data("redhat-operators/synthetic-00000")
+                self.assertEqual(curator.METADATA.revalidated, 1)
+                curator.METADATA.close()
+
+        self.assertEqual(first, second)
+        self.assertEqual(quay.requests[("releases", 200)], 1)
+        self.assertEqual(quay.requests[("releases", 304)], 1)
+
+
+    def test_responses_without_validators_use_ttl(self):
+        quay = fake_quay.FakeQuay(operators=1, releases=1, namespaces=["redhat-operators"],
+                                  etags=False)
+        with quay, patch('curator.QUAY_URL', quay.url):
+            with patch('curator.METADATA', curator.MetadataCache(self.path)):
+                curator.list_operators("redhat-operators")
+                curator.list_operators("redhat-operators")
+                curator.METADATA.close()
+            self.assertEqual(quay.calls("packages"), 2)
+
+            with patch('curator.METADATA', curator.MetadataCache(self.path, ttl=60)):
+                curator.list_operators("redhat-operators")
+                self.assertEqual(curator.list_operators("redhat-operators"),
+                                 ["redhat-operators/synthetic-00000"])
+                self.assertEqual(curator.METADATA.hits, 1)
+                curator.METADATA.close()
+            self.assertEqual(quay.calls("packages"), 3)
+
+
+class TestRegistryMirror(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.mirror = curator.RegistryMirror(self.tmpdir.name)
+
+
+    def test_responses_round_trip(self):
+        url = curator._url("packages?namespace=redhat-operators")
+        self.assertEqual(self.mirror.get(url).status_code, 404)
+
+        self.mirror.put(url, b'[{"name": "redhat-operators/jarvis"}]')
+        self.assertEqual(self.mirror.get(url).json(), [{"name": "redhat-operators/jarvis"}])
+        self.assertEqual(self.mirror.path(url).name, "packages@namespace=redhat-operators.json")
+
+
+    def test_packages_missing_from_the_mirror_fail_to_download(self):
+        release = {'package': 'redhat-operators/jarvis', 'version': '1.0.0', 'digest': 'a' * 64}
+        with patch('curator.MIRROR', self.mirror), patch('curator.BLOBS', self.mirror.blobs), \
+                patch('curator.QuayClient.get') as mock_get:
+            release = curator.download_stage(release, True)
+
+        mock_get.assert_not_called()
+        self.assertIn("not in the mirror", release['download_error'])
+
+
+    def test_export_then_curate_offline(self):
+        quay = fake_quay.FakeQuay(operators=4, releases=2, seed=3)
+        mirror = os.path.join(self.tmpdir.name, "mirror")
+        with quay, tempfile.TemporaryDirectory() as workdir:
+            returncode, _, _ = loadtest_curator.run_curator(
+                quay.url, workdir, ["--export-mirror", mirror, "--versions", ">=1.0.1"])
+            self.assertEqual(returncode, 0)
+            url = quay.url
+
+        # The server is gone, the mirror run needs no network
+        with tempfile.TemporaryDirectory() as workdir:
+            returncode, releases, _ = loadtest_curator.run_curator(url, workdir, ["--from-mirror", mirror])
+            self.assertEqual(returncode, 0)
+            self.assertEqual(releases, 4)
+            results = list(curator.read_results(os.path.join(workdir, "curator-results.jsonl")))
+
+        self.assertFalse(quay.pushed)
+        for entry in results:
+            (package, info), = entry.items()
+            self.assertEqual(info['version'], "1.0.1")
+
+
+class TestRepositoryIndex(unittest.TestCase):
+    @patch('curator.QUAY.get')
+    def test_list_repositories_follows_pages(self, mock_get):
+        mock_get.return_value.ok = True
+        mock_get.return_value.json.side_effect = [
+            {'repositories': [{'name': 'jarvis', 'is_public': True}], 'next_page': 'abc'},
+            {'repositories': [{'name': 'friday', 'is_public': False}]},
+        ]
+
+        repositories = curator.list_repositories('curated-stark-industries', 'oauth')
+
+        self.assertListEqual([r['name'] for r in repositories], ['jarvis', 'friday'])
+        self.assertEqual(mock_get.call_args[1]['params']['next_page'], 'abc')
+
+
+    @patch('curator.list_repositories')
+    def test_needs_visibility(self, mock_list):
+        mock_list.side_effect = [
+            [{'name': 'jarvis', 'is_public': True}, {'name': 'friday', 'is_public': False}],
+            None,
+        ]
+        index = curator.RepositoryIndex()
+        index.load(['curated-stark-industries', 'curated-wayne-enterprises'], 'oauth')
+
+        self.assertFalse(index.needs_visibility('curated-stark-industries', 'jarvis'))
+        self.assertTrue(index.needs_visibility('curated-stark-industries', 'friday'))
+        self.assertTrue(index.needs_visibility('curated-stark-industries', 'ultron'))
+        # Unlisted namespaces always need their visibility set
+        self.assertTrue(index.needs_visibility('curated-wayne-enterprises', 'batcomputer'))
+
+        index.set_public('curated-stark-industries', 'ultron')
+        self.assertFalse(index.needs_visibility('curated-stark-industries', 'ultron'))
+
+
+    @patch('curator.set_repo_visibility', return_value=True)
+    @patch('curator.QUAY.post')
+    def test_push_package_only_sets_visibility_when_needed(self, mock_post, mock_visibility):
+        release = {'package': 'stark-industries/jarvis', 'version': '1.0.0'}
+        index = curator.RepositoryIndex()
+        with patch('curator.list_repositories', return_value=[]):
+            index.load(['curated-stark-industries'], 'oauth')
+
+        # Failed uploads never create a repository
+        mock_post.return_value = Mock(status_code=500)
+        mock_post.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError()
+        curator.push_package(release, 'curated-stark-industries', 'oauth', 'basic',
+                             package_file=BytesIO(b"x"), repositories=index)
+        mock_visibility.assert_not_called()
+
+        # A new repository is made public once
+        mock_post.return_value = Mock(status_code=201)
+        for _ in range(2):
+            curator.push_package(release, 'curated-stark-industries', 'oauth', 'basic',
+                                 package_file=BytesIO(b"x"), repositories=index)
+        mock_visibility.assert_called_once_with('curated-stark-industries', 'jarvis', 'oauth')
+
+
+class TestPushBody(unittest.TestCase):
+    def test_body_matches_json_payload(self):
+        for size in [0, 1, 2, 3, 4, 1000, 1001, 1002]:
+            data = os.urandom(size)
+            body = curator.PushBody(BytesIO(data), {"release": "1.0.0", "media_type": "helm"},
+                                    chunk_size=10)
+            expected = json.dumps({
+                "blob": base64.b64encode(data).decode(),
+                "release": "1.0.0",
+                "media_type": "helm"
+            }).encode()
+
+            streamed = b"".join(iter(lambda: body.read(7), b""))
+
+            self.assertEqual(streamed, expected)
+            self.assertEqual(len(body), len(expected))
+            self.assertEqual(body.hexdigest(), hashlib.sha256(data).hexdigest())
+
+
+    def test_hexdigest_reads_unsent_package(self):
+        data = os.urandom(100)
+        body = curator.PushBody(BytesIO(data), {}, chunk_size=10)
+        body.read(5)
+
+        self.assertEqual(body.hexdigest(), hashlib.sha256(data).hexdigest())
+
+
+    @patch('curator.set_repo_visibility')
+    @patch('curator.QUAY.post')
+    def test_push_package_streams_body(self, mock_post, mock_visibility):
+        data = os.urandom(100)
+        mock_post.side_effect = lambda url, data, headers: Mock(
+            status_code=201, body=data.read())
+        release = {'package': 'stark-industries/jarvis', 'version': '1.0.0'}
+
+        digest = curator.push_package(release, 'curated-stark-industries', 'oauth',
+                                      'basic', package_file=BytesIO(data))
+
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertIsInstance(mock_post.call_args[1]['data'], curator.PushBody)
+
+
+    @patch('curator.time.sleep')
+    @patch('curator.set_repo_visibility')
+    @patch('curator.QUAY.post')
+    def test_push_package_retries_throttled_push(self, mock_post, mock_visibility, mock_sleep):
+        data = os.urandom(100)
+        bodies = []
+
+        def post(url, data, headers):
+            bodies.append(data.read())
+            return Mock(status_code=429 if len(bodies) == 1 else 201)
+
+        mock_post.side_effect = post
+        release = {'package': 'stark-industries/jarvis', 'version': '1.0.0'}
+
+        digest = curator.push_package(release, 'curated-stark-industries', 'oauth',
+                                      'basic', package_file=BytesIO(data))
+
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertEqual(len(bodies), 2)
+        self.assertEqual(bodies[0], bodies[1])
+        # Backs off before sending it again
+        mock_sleep.assert_called_once()
+
+
+class TestResultSink(unittest.TestCase):
+    summary = [
+        {"testOperator0": {"version": "1.0.0", "pass": True, "skipped": False,
+                           "tests": {"is in allowed list": True}}},
+        {"testOperator1": {"version": "2.2.40", "pass": True, "skipped": True,
+                           "tests": {"is already curated": True}}},
+        {"testOperator2": {"version": "0.1", "pass": False, "skipped": False,
+                           "tests": {"bundle.yaml must be present": False,
+                                     "<odd> & \"quoted\"": True}}},
+    ]
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.jsonl = os.path.join(self.tmpdir.name, "results.jsonl")
+        self.junit = os.path.join(self.tmpdir.name, "results.xml")
+
+
+    def test_streamed_summary_matches_list_summary(self):
+        with curator.ResultSink(self.jsonl) as sink:
+            for entry in self.summary:
+                sink.write(entry)
+
+        from_list, from_stream = StringIO(), StringIO()
+        curator.summarize(self.summary, out=from_list)
+        curator.summarize(curator.read_results(self.jsonl), out=from_stream)
+
+        self.assertEqual(from_stream.getvalue(), from_list.getvalue())
+        self.assertEqual((sink.counts.total, sink.counts.passed,
+                          sink.counts.skipped, sink.counts.failed), (3, 2, 1, 1))
+
+
+    def test_entries_are_flushed_as_they_are_written(self):
+        sink = curator.ResultSink(self.jsonl)
+        sink.write(self.summary[0])
+
+        self.assertListEqual(list(curator.read_results(self.jsonl)), self.summary[:1])
+        sink.close()
+
+
+    def test_junit_report(self):
+        with curator.ResultSink(self.jsonl, self.junit) as sink:
+            for entry in self.summary:
+                sink.write(entry)
+
+        suites = ElementTree.parse(self.junit).getroot().findall('testsuite')
+
+        self.assertEqual(len(suites), 3)
+        self.assertEqual(suites[1].get('skipped'), "1")
+        self.assertEqual(suites[2].get('failures'), "1")
+        self.assertEqual(suites[2].findall('testcase')[1].get('name'), '<odd> & "quoted"')
+
+
+    def test_summarize_empty_stream(self):
+        with self.assertRaises(IndexError):
+            curator.summarize(iter([]))
+
+
+class TestMetrics(unittest.TestCase):
+    def test_disabled_metrics_record_nothing(self):
+        metrics = curator.Metrics()
+        metrics.observe("push", 1.0)
+        metrics.add_bytes("upload", 10)
+        metrics.count_status("cnr", 200)
+
+        self.assertNotIn('stage="push"', metrics.render())
+        self.assertNotIn('direction="upload"', metrics.render())
+
+
+    def test_render_textfile(self):
+        metrics = curator.Metrics(enabled=True, buckets=(0.1, 1))
+        metrics.observe("push", 0.05)
+        metrics.observe("push", 0.5)
+        metrics.observe("push", 5)
+        metrics.add_bytes("download", 100)
+        metrics.add_bytes("download", 50)
+        metrics.count_status("cnr", 429)
+
+        text = metrics.render()
+
+        self.assertIn('curator_stage_duration_seconds_bucket{stage="push",le="0.1"} 1', text)
+        self.assertIn('curator_stage_duration_seconds_bucket{stage="push",le="1"} 2', text)
+        self.assertIn('curator_stage_duration_seconds_bucket{stage="push",le="+Inf"} 3', text)
+        self.assertIn('curator_stage_duration_seconds_count{stage="push"} 3', text)
+        self.assertIn('curator_bytes_total{direction="download"} 150', text)
+        self.assertIn('curator_http_responses_total{api="cnr",code="429"} 1', text)
+
+
+    def test_timed_and_http_statuses(self):
+        metrics = curator.Metrics(enabled=True)
+        client = curator.QuayClient(retries=0)
+        client.session.request = Mock(return_value=Mock(status_code=200))
+
+        with patch('curator.METRICS', metrics):
+            curator.timed("widgets")(lambda: None)()
+            client.get(curator._repo_url("repository"))
+
+        text = metrics.render()
+        self.assertIn('curator_stage_duration_seconds_count{stage="widgets"} 1', text)
+        self.assertIn('curator_http_responses_total{api="repository",code="200"} 1', text)
+
+
+    def test_write_textfile(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "curator.prom")
+            metrics = curator.Metrics(enabled=True)
+            metrics.add_bytes("upload", 1)
+            metrics.write_textfile(path)
+
+            with open(path) as f:
+                self.assertEqual(f.read(), metrics.render())
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.profiler = curator.Profiler(enabled=True)
+        patcher = patch('curator.PROFILER', self.profiler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.regenerate = curator.timed("bundle_regeneration")(lambda: time.sleep(0.05))
+
+        @curator.timed("validation")
+        def validate(release):
+            time.sleep(0.01)
+            self.regenerate()
+            return release
+        self.validate = validate
+
+
+    def test_slowest_releases_and_dominant_stage(self):
+        stage = self.profiler.stage(self.validate)
+        stage({'package': 'stark-industries/jarvis', 'version': '1.0.0'})
+        self.regenerate()
+
+        (release, seconds, dominant, dominant_seconds), = self.profiler.slowest()
+        self.assertEqual(release, "stark-industries/jarvis:1.0.0")
+        self.assertEqual(dominant, "bundle_regeneration")
+        # Stages are timed without the stages they call
+        self.assertLess(seconds - dominant_seconds, 0.04)
+
+        out = StringIO()
+        self.profiler.print_report(out=out)
+        self.assertIn("stark-industries/jarvis:1.0.0  (bundle_regeneration", out.getvalue())
+
+
+    def test_write_profiles(self):
+        self.validate({'package': 'stark-industries/jarvis', 'version': '1.0.0'})
+        self.regenerate()
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = self.profiler.write(tmpdir)
+            self.assertEqual(sorted(os.listdir(tmpdir)), [
+                "bundle_regeneration.pstats", "curator.collapsed",
+                "curator.pstats", "validation.pstats"])
+            stats = pstats.Stats(os.path.join(tmpdir, "curator.pstats"))
+            self.assertIn("validate", {name for _, _, name in stats.stats})
+            with open(path) as f:
+                stacks = f.read().splitlines()
+
+        self.assertTrue(any("validate (test_curator.py" in line and "<lambda>" in line
+                            for line in stacks))
+        for line in stacks:
+            frames, micros = line.rsplit(" ", 1)
+            self.assertGreater(int(micros), 0)
+
+
+    def test_run_wide_profile_without_per_thread_profiles(self):
+        self.profiler.per_thread = False
+        with self.assertLogs(level='WARNING'):
+            self.profiler.start()
+        stage = self.profiler.stage(self.validate)
+        stage({'package': 'stark-industries/jarvis', 'version': '1.0.0'})
+
+        (_, _, dominant, _), = self.profiler.slowest()
+        self.assertEqual(dominant, "bundle_regeneration")
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.profiler.write(tmpdir)
+            # Stages are not told apart, only the run is written
+            self.assertEqual(sorted(os.listdir(tmpdir)), ["curator.collapsed", "curator.pstats"])
+            stats = pstats.Stats(os.path.join(tmpdir, "curator.pstats"))
+            self.assertIn("validate", {name for _, _, name in stats.stats})
+
+
+    def test_disabled_profiler_is_not_called(self):
+        self.profiler.enabled = False
+        with patch.object(self.profiler, 'call') as mock_call:
+            self.validate({'package': 'stark-industries/jarvis', 'version': '1.0.0'})
+        mock_call.assert_not_called()
+        self.assertEqual(self.profiler.slowest(), [])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.assertIsNone(self.profiler.write(tmpdir))
+
+
+class TestLoadHarness(unittest.TestCase):
+    def test_fake_quay_routes(self):
+        quay = fake_quay.FakeQuay(operators=1, releases=1, namespaces=["redhat-operators"])
+        with quay, patch('curator.QUAY_URL', quay.url):
+            package = curator.list_operators("redhat-operators")[0]
+            release = curator.get_release_data(package)[0]
+            with curator.open_package_release(release, False) as f:
+                _, _, result = curator.extract_bundle_from_tar_file(f)
+
+        self.assertEqual(package, "redhat-operators/synthetic-00000")
+        self.assertEqual(release['version'], "1.0.0")
+        self.assertEqual(result, True)
+        self.assertEqual(quay.calls(), 3)
+
+
+    def test_rate_limit_and_errors_are_injected(self):
+        quay = fake_quay.FakeQuay(operators=1, releases=1, rate_limit=1, burst=1, error_rate=1.0)
+        with quay:
+            first = requests.get(quay.url + "/cnr/api/v1/packages?namespace=redhat-operators")
+            second = requests.get(quay.url + "/cnr/api/v1/packages?namespace=redhat-operators")
+
+        self.assertEqual(first.status_code, 503)
+        self.assertEqual(second.status_code, 429)
+        self.assertIn("Retry-After", second.headers)
+
+
+    def test_curator_runs_end_to_end(self):
+        quay = fake_quay.FakeQuay(operators=6, releases=2, seed=1)
+        with quay:
+            first, second = loadtest_curator.load_test(quay, runs=2, args=["--cache"])
+
+        self.assertEqual(first['returncode'], 0)
+        self.assertEqual(first['releases'], 12)
+        self.assertEqual(first['pushed'], len(quay.pushed))
+        self.assertTrue(quay.pushed)
+        for package, version, digest in quay.pushed:
+            self.assertTrue(package.startswith("curated-"))
+            self.assertTrue(quay.is_public(*package.split('/')))
+
+        # Nothing changed, the second run has nothing to do
+        self.assertEqual(second['releases'], 0)
+        self.assertEqual(second['pushed'], 0)
+        self.assertNotIn("blob 200", second['requests'])
+        # and the source listings it did fetch are unchanged
+        self.assertIn("releases 304", second['requests'])
+
+
+    def test_workdir_is_created(self):
+        quay = fake_quay.FakeQuay(operators=1, releases=1, seed=5)
+        with quay, tempfile.TemporaryDirectory() as tmpdir:
+            report, = loadtest_curator.load_test(
+                quay, args=["--skip-push"], workdir=os.path.join(tmpdir, "lt", "w"))
+
+        self.assertEqual(report['returncode'], 0)
+        self.assertEqual(report['releases'], 1)
+
+
+    def test_packages_are_downloaded_once(self):
+        quay = fake_quay.FakeQuay(operators=10, releases=2, seed=4)
+        with quay:
+            report, = loadtest_curator.load_test(quay)
+
+        self.assertEqual(report['releases'], 20)
+        self.assertTrue(report['pushed'])
+        self.assertEqual(report['requests']['blob 200'], 20)
+
+
+    @patch('curator.get_package_release')
+    def test_download_stage_skips_unneeded_packages(self, mock_get):
+        release = {'package': 'redhat-operators/jarvis', 'version': '1.0.0', 'digest': 'a' * 64}
+        index = curator.CuratedIndex()
+        index.add('curated-redhat-operators/jarvis', '1.0.0')
+
+        self.assertEqual(curator.download_stage(release, False, index=index), release)
+        mock_get.assert_not_called()
+        curator.download_stage(release, False)
+        mock_get.assert_called_once_with(release, False)
+        # Nothing can be pushed, validation streams the package instead
+        curator.download_stage(release, False, skip_push=True)
+        mock_get.assert_called_once()
+
+
+    def test_skip_push_never_writes_packages_to_disk(self):
+        quay = fake_quay.FakeQuay(operators=4, releases=2, seed=4)
+        with quay, tempfile.TemporaryDirectory() as workdir:
+            report, = loadtest_curator.load_test(quay, args=["--skip-push"], workdir=workdir)
+            self.assertFalse(os.path.exists(os.path.join(workdir, curator.DEFAULT_CACHE_DIR)))
+
+        self.assertEqual(report['releases'], 8)
+        self.assertEqual(report['requests']['blob 200'], 8)
+
+
+    def test_sharded_run_merges_to_a_full_summary(self):
+        quay = fake_quay.FakeQuay(operators=8, releases=1, seed=2)
+        with quay, tempfile.TemporaryDirectory() as workdir:
+            for i in range(2):
+                os.mkdir(os.path.join(workdir, str(i)))
+                _, releases, _ = loadtest_curator.run_curator(
+                    quay.url, os.path.join(workdir, str(i)), ["--shard", f"{i}/2", "--skip-push"])
+                self.assertGreater(releases, 0)
+
+            merged = os.path.join(workdir, "merged.jsonl")
+            loadtest_curator.run_curator(quay.url, workdir, [
+                "--results", merged, "--merge",
+                os.path.join(workdir, "0", "curator-results.jsonl"),
+                os.path.join(workdir, "1", "curator-results.jsonl")])
+
+            self.assertEqual(len(list(curator.read_results(merged))), 8)
+
+
 class TestPrintingSummary(unittest.TestCase):
     def test_summary_no_results(self):
         summary = []